@@ -1,18 +1,16 @@
-import pandas as pd
-
-# Load your dataset
-df = pd.read_csv('C:/Users/bencr/Downloads/combined_collision_v3/combined_collisions_v3.csv')
+from columnar_store import load_collisions # For reading only the needed columns and blocks of the dataset
 
 # Define London's borough boundaries
 minimum_latitude, maximum_latitude = 51.3550556, 51.6517156
 minimum_longitude, maximum_longitude = -0.453256, 0.15050513
 
-# Filter the dataset to include only accidents within the defined boundaries
-filtered_df = df[(df['Latitude'] >= minimum_latitude) & (df['Latitude'] <= maximum_latitude) &
-                 (df['Longitude'] >= minimum_longitude) & (df['Longitude'] <= maximum_longitude)]
+# Load every column for the accidents within the defined boundaries and save them as the London dataset
+London_df = load_collisions(bbox=(minimum_latitude, maximum_latitude, minimum_longitude, maximum_longitude))
+London_df.to_csv('London_dataset.csv', index=False)
+print("The London collisions have been saved to London_dataset.csv")
 
 # Keep only the required columns
-filtered_London_df = filtered_df[['Latitude', 'Longitude', 'Accident_Severity']]
+filtered_London_df = London_df[['Latitude', 'Longitude', 'Accident_Severity']]
 
 # Sort the dataset by Latitude, Longitude and Accident_Severity in ascending order
 filtered_London_df = filtered_London_df.sort_values(by=['Latitude', 'Longitude', 'Accident_Severity'],
@@ -0,0 +1,10 @@
+from borough_assignment import BoroughAssigner, assign_file # Vectorised nearest-borough assignment
+
+if __name__ == "__main__":
+    # Load the coordinates of London boroughs (written by London_borough.py)
+    assigner = BoroughAssigner.from_files("C:/Users/bencr/Downloads/combined_collision_v3/london_boroughs_coordinates.csv")
+
+    # Refine the per-location accident summary (written by severity_score.py) by adding the "Borough" of each location,
+    # giving the refined dataset the routing, grid index and borough scripts read
+    assign_file("C:/Users/bencr/Downloads/combined_collision_v3/accidents_summary_filtered.csv",
+                "refined_London_dataset.csv", assigner)
@@ -0,0 +1,145 @@
+import os # For interacting with the file system
+import json # For the cube's dimension labels
+import time # For timing the queries
+import numpy as np # For the count array
+import pandas as pd # For parsing the collision columns and returning tables
+
+# Where the cube lives
+CUBE_DIRECTORY = 'C:/Users/bencr/Downloads/combined_collision_v3/collision_cube'
+
+# Dimensions of the cube, in array order
+DIMENSIONS = ['year', 'day_of_week', 'hour', 'severity', 'borough']
+
+# Fixed labels of the dimensions that never grow (Day_of_Week runs from 1 = Sunday to 7 = Saturday)
+DAYS = list(range(1, 8))
+HOURS = list(range(24))
+SEVERITIES = [1, 2, 3]
+
+# Dense count of collisions over year x day of week x hour x severity x borough, stored as one int32 array
+# London over 2005-2018 with 33 boroughs is 15 x 8 x 25 x 4 x 34 cells, about 1.6 MB, so every slice or
+# roll-up the heatmap scripts need is a sum over a small in-memory array
+# Every dimension ends with an unknown bucket (not in the labels) for missing or unrecognised values, so a
+# collision with no time still counts towards its day and severity, as it did with a groupby on those columns
+class CollisionCube:
+    def __init__(self, directory=CUBE_DIRECTORY):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        self.labels = meta['labels']
+        self.unknown_buckets = meta.get('unknown_buckets', False)
+        self.counts = np.load(os.path.join(directory, 'counts.npy'))
+
+    # Function to create an empty cube for some years and boroughs
+    @classmethod
+    def create(cls, directory, years, boroughs):
+        labels = {'year': sorted(int(year) for year in years), 'day_of_week': DAYS, 'hour': HOURS,
+                  'severity': SEVERITIES, 'borough': list(boroughs)}
+        os.makedirs(directory, exist_ok=True)
+        save_cube(directory, labels, np.zeros([len(labels[name]) + 1 for name in DIMENSIONS], dtype=np.int32))
+        return cls(directory)
+
+    # Function to add a batch of collisions (Year or Date, Day_of_Week, Time, Accident_Severity and Borough columns)
+    # New years extend the cube; a missing or unknown value in a dimension is counted in that dimension's unknown bucket
+    def add(self, df):
+        values = collision_dimensions(df)
+        new_years = sorted(set(values['year'][~np.isnan(values['year'])].astype(int).tolist()) - set(self.labels['year']))
+        if new_years:
+            self.extend_years(new_years)
+        positions = []
+        known = np.ones(len(df), dtype=bool)
+        for name in DIMENSIONS:
+            lookup = pd.Index(self.labels[name])
+            position = lookup.get_indexer(pd.Index(values[name]))
+            known &= position >= 0
+            positions.append(np.where(position >= 0, position, len(self.labels[name])))
+        cells = np.ravel_multi_index(positions, self.counts.shape)
+        self.counts += np.bincount(cells, minlength=self.counts.size).reshape(self.counts.shape).astype(np.int32)
+        save_cube(self.directory, self.labels, self.counts)
+        print(f"Added {len(df)} collisions to the cube ({int((~known).sum())} with a missing or unknown value in some dimension)")
+        return len(df)
+
+    # Function to add years to the cube, keeping the year axis in order and the unknown year last
+    def extend_years(self, new_years):
+        years = sorted(self.labels['year'] + list(new_years))
+        counts = np.zeros((len(years) + 1,) + self.counts.shape[1:], dtype=np.int32)
+        counts[[years.index(year) for year in self.labels['year']] + [len(years)]] = self.counts
+        self.labels['year'], self.counts = years, counts
+
+    # Function to sum the cube over every dimension except some, after selecting values of any dimension
+    # e.g. table('day_of_week', 'severity', borough='Camden', year=[2016, 2017, 2018])
+    # Collisions with an unknown value in a summed-over dimension are included; unknown rows and columns are left out
+    def table(self, rows, columns=None, **filters):
+        keep = [rows] if columns is None else [rows, columns]
+        # Drop the unknown bucket of the kept dimensions (a filtered dimension only keeps the selected values)
+        counts = self.counts[tuple(slice(0, -1) if name in keep else slice(None) for name in DIMENSIONS)]
+        labels = dict(self.labels)
+        for name, selected in filters.items():
+            selected = selected if isinstance(selected, (list, tuple, set)) else [selected]
+            positions = pd.Index(self.labels[name]).get_indexer(list(selected))
+            if (positions < 0).any():
+                raise KeyError(f"Unknown {name} values {[value for value, p in zip(selected, positions) if p < 0]}")
+            counts = np.take(counts, positions, axis=DIMENSIONS.index(name))
+            labels[name] = [self.labels[name][p] for p in positions]
+        summed = counts.sum(axis=tuple(i for i, name in enumerate(DIMENSIONS) if name not in keep))
+        if columns is None:
+            return pd.Series(summed, index=pd.Index(labels[rows], name=rows))
+        if DIMENSIONS.index(rows) > DIMENSIONS.index(columns):
+            summed = summed.T
+        return pd.DataFrame(summed, index=pd.Index(labels[rows], name=rows), columns=pd.Index(labels[columns], name=columns))
+
+# Function to save the cube, replacing the files atomically
+def save_cube(directory, labels, counts):
+    temporary = os.path.join(directory, 'counts.tmp.npy')
+    np.save(temporary, counts)
+    os.replace(temporary, os.path.join(directory, 'counts.npy'))
+    temporary = os.path.join(directory, 'meta.tmp.json')
+    with open(temporary, 'w') as f:
+        json.dump({'dimensions': DIMENSIONS, 'labels': labels, 'unknown_buckets': True}, f)
+    os.replace(temporary, os.path.join(directory, 'meta.json'))
+
+# Function to read every collision's position on each dimension (NaN or None where it is missing)
+def collision_dimensions(df):
+    if 'Year' in df.columns:
+        year = pd.to_numeric(df['Year'], errors='coerce')
+    else:
+        year = pd.to_datetime(df['Date'].astype(object), dayfirst=True, errors='coerce').dt.year
+    # "HH:MM" times: only the hour is needed, so read it straight from the text instead of parsing datetimes
+    hour = pd.to_numeric(df['Time'].astype(object).str.split(':').str[0], errors='coerce')
+    return {
+        'year': year.to_numpy(dtype=float),
+        'day_of_week': pd.to_numeric(df['Day_of_Week'], errors='coerce').to_numpy(dtype=float),
+        'hour': hour.to_numpy(dtype=float),
+        'severity': pd.to_numeric(df['Accident_Severity'], errors='coerce').to_numpy(dtype=float),
+        'borough': df['Borough'].astype(object).to_numpy(),
+    }
+
+# Function to open the cube, building it from the London collisions the first time
+# A cube saved before the unknown buckets existed is missing the collisions it skipped, so it is built again
+def open_cube(directory=CUBE_DIRECTORY):
+    if os.path.exists(os.path.join(directory, 'meta.json')):
+        cube = CollisionCube(directory)
+        if cube.unknown_buckets:
+            return cube
+    from columnar_store import open_store # For reading only the needed columns of the dataset
+    from borough_assignment import BoroughAssigner # For the borough of every collision
+    print("Building the collision cube (only needed once)...")
+    store = open_store()
+    time_columns = ['Year'] if 'Year' in store.columns else ['Date']
+    df = store.read(['Latitude', 'Longitude', 'Day_of_Week', 'Time', 'Accident_Severity'] + time_columns,
+                    bbox=(51.3550556, 51.6517156, -0.453256, 0.15050513))
+    assigner = BoroughAssigner.from_files("C:/Users/bencr/Downloads/combined_collision_v3/london_boroughs_coordinates.csv")
+    df['Borough'] = assigner.assign(df['Latitude'], df['Longitude'])
+    years = collision_dimensions(df)['year']
+    cube = CollisionCube.create(directory, np.unique(years[~np.isnan(years)]), list(dict.fromkeys(assigner.names)))
+    cube.add(df)
+    return cube
+
+if __name__ == "__main__":
+    # Example usage: time a roll-up and a slice
+    cube = open_cube()
+    start = time.perf_counter()
+    by_day = cube.table('day_of_week', 'severity')
+    by_hour = cube.table('hour', 'severity', borough='Westminster')
+    print(f"Answered two queries in {(time.perf_counter() - start) * 1000:.2f} ms")
+    print(by_day)
+    print(by_hour.head())
@@ -0,0 +1,150 @@
+from collections import namedtuple # For returning routes with named fields
+import numpy as np # For the contiguous weight arrays
+from scipy.sparse import csr_matrix # For handing the graph to the compiled Dijkstra
+from scipy.sparse.csgraph import dijkstra # Compiled Dijkstra over CSR graphs
+from instrumentation import traced # For timing the calls
+from graph_snapshot import add_columns # For sharing a core's arrays through its snapshot
+
+# A route as node positions in the snapshot and the edge positions used between them
+Route = namedtuple('Route', ['nodes', 'edges'])
+
+# Added to every edge's severity for the safest route so that no edge costs zero
+# (the same "+ 1" as the lambda weight in Dijkstra_safest_shortest.py)
+SEVERITY_OFFSET = 1
+
+# Snapshot columns written by RoutingCore.save_columns: the parallel-edge slots, the per-edge severity and
+# safety weights, and the CSR data of both weights
+ROUTING_COLUMNS = ['routing_slot_start', 'routing_slot_end', 'routing_slot_heads', 'routing_slot_indptr',
+                   'routing_severity', 'routing_safety', 'routing_length_data', 'routing_safety_data']
+
+# Routing over a GraphSnapshot with precomputed weight vectors instead of per-edge Python callbacks
+class RoutingCore:
+    def __init__(self, snapshot, severity=None, accidents=None, severity_offset=SEVERITY_OFFSET):
+        self.snapshot = snapshot
+        self.node_count = snapshot.node_count
+        self.edge_length = np.ascontiguousarray(snapshot.edge_length, dtype=np.float64)
+        self.severity = np.array(snapshot.mean_severity_score if severity is None else severity, dtype=np.float64)
+        self.accidents = np.array(snapshot.number_of_accidents if accidents is None else accidents, dtype=np.float64)
+        self.severity_offset = severity_offset
+
+        # Parallel edges (same tail and head) sit next to each other in the snapshot, so group them into slots
+        tails = snapshot.tails
+        heads = np.asarray(snapshot.indices)
+        new_slot = np.ones(snapshot.edge_count, dtype=bool)
+        new_slot[1:] = (tails[1:] != tails[:-1]) | (heads[1:] != heads[:-1])
+        self.slot_start = np.flatnonzero(new_slot)
+        self.slot_end = np.append(self.slot_start[1:], snapshot.edge_count)
+        self.slot_heads = heads[self.slot_start]
+        self.slot_indptr = np.zeros(self.node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tails[self.slot_start], minlength=self.node_count), out=self.slot_indptr[1:])
+
+        # Precompute the weight vectors and the graphs built from them
+        self.weights = {}
+        self.matrices = {}
+        self.set_weight('length', self.edge_length)
+        self.set_weight('safety', self.severity + severity_offset)
+
+    # Function to open a core over the arrays a previous save_columns wrote into the snapshot, without copying them
+    # Every process that does this maps the same read-only pages, so N workers hold one copy of the arrays;
+    # the core can route but not update_severity
+    @classmethod
+    def from_columns(cls, snapshot):
+        if 'routing_columns' not in snapshot.meta:
+            raise ValueError("The snapshot has no routing columns; write them with RoutingCore.save_columns first.")
+        core = cls.__new__(cls)
+        core.snapshot = snapshot
+        core.node_count = snapshot.node_count
+        core.edge_length = snapshot.edge_length
+        core.severity = snapshot.routing_severity
+        core.accidents = snapshot.number_of_accidents
+        core.severity_offset = snapshot.meta['routing_columns']['severity_offset']
+        core.slot_start, core.slot_end = snapshot.routing_slot_start, snapshot.routing_slot_end
+        core.slot_heads, core.slot_indptr = snapshot.routing_slot_heads, snapshot.routing_slot_indptr
+        core.weights = {'length': snapshot.edge_length, 'safety': snapshot.routing_safety}
+        shape = (core.node_count, core.node_count)
+        core.matrices = {name: csr_matrix((getattr(snapshot, f'routing_{name}_data'), core.slot_heads, core.slot_indptr),
+                                          shape=shape) for name in core.weights}
+        return core
+
+    # Function to write the core's slots and weights into its snapshot as columns (see from_columns)
+    # The indices are stored as int32 where they fit, which is what scipy uses, so the CSR graphs wrap the mapped files
+    def save_columns(self):
+        index_type = np.int32 if self.snapshot.edge_count <= np.iinfo(np.int32).max else np.int64
+        values = [self.slot_start, self.slot_end, self.slot_heads.astype(index_type), self.slot_indptr.astype(index_type),
+                  self.severity, self.weights['safety'], self.matrices['length'].data, self.matrices['safety'].data]
+        return add_columns(self.snapshot.directory, dict(zip(ROUTING_COLUMNS, values)),
+                           routing_columns={'severity_offset': self.severity_offset})
+
+    # Function to register (or replace) a named per-edge weight vector
+    def set_weight(self, name, weights):
+        self.weights[name] = np.ascontiguousarray(weights, dtype=np.float64)
+        self.matrices[name] = self.matrix(self.weights[name])
+
+    # Function to build the CSR graph for a weight vector, keeping the cheapest of any parallel edges
+    # (networkx does the same when it routes over a MultiDiGraph with a named weight)
+    def matrix(self, weights):
+        data = np.minimum.reduceat(weights, self.slot_start) if len(weights) else weights
+        return csr_matrix((data, self.slot_heads, self.slot_indptr), shape=(self.node_count, self.node_count))
+
+    # Function to update the severity of some edges in place (used when new collision data arrives)
+    def update_severity(self, edges, severity, accidents=None):
+        self.severity[edges] = severity
+        if accidents is not None:
+            self.accidents[edges] = accidents
+        self.set_weight('safety', self.severity + self.severity_offset)
+
+    # Function to run Dijkstra from one source over every node, returning distances and predecessors
+    @traced('dijkstra')
+    def search_tree(self, source, weight='length', limit=np.inf):
+        return dijkstra(self.matrices[weight], indices=source, return_predecessors=True, limit=limit)
+
+    # Function to read the route to a target back out of a search tree
+    def route_from_tree(self, predecessors, source, target, weight='length'):
+        if source != target and predecessors[target] < 0:
+            raise ValueError("No path exists between the selected start and end points.")
+        nodes = [int(target)]
+        while nodes[-1] != source:
+            nodes.append(int(predecessors[nodes[-1]]))
+        nodes.reverse()
+        return Route(nodes, self.path_edges(nodes, weight))
+
+    # Function to find the edge used between each pair of consecutive nodes (the cheapest parallel edge)
+    # weight is the name of a registered weight vector, or the per-edge weights the search used
+    def path_edges(self, nodes, weight='length'):
+        weights = self.weights[weight] if isinstance(weight, str) else weight
+        nodes = np.asarray(nodes, dtype=np.int64)
+        if len(nodes) < 2:
+            return np.empty(0, dtype=np.int64)
+        # Compare every step's head with all of its tail's slots at once (a node has only a few outgoing slots)
+        first, last = self.slot_indptr[nodes[:-1]], self.slot_indptr[nodes[:-1] + 1]
+        candidates = first[:, None] + np.arange((last - first).max())
+        matches = (candidates < last[:, None]) & (self.slot_heads[np.minimum(candidates, len(self.slot_heads) - 1)] == nodes[1:, None])
+        slots = candidates[np.arange(len(candidates)), matches.argmax(axis=1)]
+        edges = self.slot_start[slots].astype(np.int64)
+        # Only the few slots with parallel edges need the cheapest one picked out
+        for step in np.flatnonzero(self.slot_end[slots] - edges > 1):
+            start, end = edges[step], self.slot_end[slots[step]]
+            edges[step] = start + np.argmin(weights[start:end])
+        return edges
+
+    # Function to compute the route minimising a named weight
+    def route(self, source, target, weight='length'):
+        _, predecessors = self.search_tree(source, weight)
+        return self.route_from_tree(predecessors, source, target, weight)
+
+    # Function to compute the shortest route by length
+    def shortest(self, source, target):
+        return self.route(source, target, 'length')
+
+    # Function to compute the safest route (lowest total severity + offset)
+    def safest(self, source, target):
+        return self.route(source, target, 'safety')
+
+    # Compute the path metrics from the same arrays the search used
+    def path_metrics(self, route):
+        edges = route.edges if isinstance(route, Route) else route
+        if len(edges) == 0:
+            return 0.0, 0
+        total_distance = float(self.edge_length[edges].sum())
+        mean_severity = round(float(self.severity[edges].sum()) / len(edges))
+        return total_distance, mean_severity
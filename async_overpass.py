@@ -0,0 +1,266 @@
+import re # For reading the points out of queries in the stub server
+import csv # For reading and writing the coordinate files
+import time # For the throughput statistics
+import random # For the retry jitter
+import asyncio # For running many batched queries concurrently
+import argparse # For the command-line interface
+from email.utils import parsedate_to_datetime # For Retry-After headers given as dates
+from datetime import datetime, timezone # For the seconds until a Retry-After date
+import aiohttp # For the pooled HTTP connections
+from aiohttp import web # For the local stub Overpass server
+
+# URL of the Overpass API endpoint
+OVERPASS_URL = "http://overpass-api.de/api/interpreter"
+
+# Search radius around each point in metres (the same 10 m as checkpoint.py)
+SEARCH_RADIUS = 10
+
+# Points packed into each union query
+BATCH_SIZE = 50
+
+# Responses that mean "slow down and try again"
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# Element type of the separators that split a union query's response back out per point
+SEPARATOR_TYPE = 'point'
+
+# Function to build one Overpass query for many points
+# Every point's results are followed by a "make" separator, so the response can be split per point
+def union_query(points, radius=SEARCH_RADIUS, timeout=180):
+    statements = [f"[out:json][timeout:{timeout}];"]
+    for index, (latitude, longitude) in enumerate(points):
+        # Fixed-point formatting, since str() writes coordinates near zero in scientific notation
+        latitude, longitude = f"{latitude:.7f}", f"{longitude:.7f}"
+        statements.append(f"(node(around:{radius},{latitude},{longitude});way(around:{radius},{latitude},{longitude});"
+                          f"relation(around:{radius},{latitude},{longitude}););out center;")
+        statements.append(f"make {SEPARATOR_TYPE} index={index};out;")
+    return "\n".join(statements)
+
+# Function to split a union query's elements back out per point, keeping each point's first element
+# (the same element checkpoint.py takes from a single-point query)
+def split_response(data, point_count):
+    results = [(None, None)] * point_count
+    current = []
+    for element in data.get('elements', []):
+        if element['type'] == SEPARATOR_TYPE:
+            index = int(element['tags']['index'])
+            if current:
+                results[index] = (current[0]['id'], current[0]['type'])
+            current = []
+        else:
+            current.append(element)
+    return results
+
+# Function to read a Retry-After header as seconds to wait: either a number of seconds or an HTTP date
+# (returns None when it is missing or can't be read, which leaves the limiter's own backoff in charge)
+def retry_after_seconds(value):
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+# Concurrency and pacing limiter that adapts to the server (additive increase, multiplicative decrease)
+# Every successful request raises the concurrency limit by about one per round of requests; every throttled one
+# halves it and doubles the spacing between request starts
+class AdaptiveLimiter:
+    def __init__(self, initial=2, minimum=1, maximum=16, min_interval=0.0, max_interval=30.0):
+        self.limit = float(initial)
+        self.minimum, self.maximum = minimum, maximum
+        self.interval = min_interval
+        self.min_interval, self.max_interval = min_interval, max_interval
+        self.active = 0
+        self.next_start = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < int(self.limit))
+            self.active += 1
+            now = asyncio.get_running_loop().time()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def release(self, throttled=False, retry_after=None):
+        async with self.condition:
+            self.active -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+                self.interval = min(self.max_interval, max(self.interval * 2, 0.1))
+                if retry_after:
+                    self.next_start = max(self.next_start, asyncio.get_running_loop().time() + retry_after)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self.interval = max(self.min_interval, self.interval * 0.9)
+            self.condition.notify_all()
+
+# Overpass client that batches points into union queries over one pooled session
+class OverpassClient:
+    def __init__(self, url=OVERPASS_URL, batch_size=BATCH_SIZE, radius=SEARCH_RADIUS, retries=5,
+                 max_concurrency=16, min_interval=0.0, timeout=300, backoff=1.0):
+        self.url = url
+        self.batch_size = batch_size
+        self.radius = radius
+        self.retries = retries
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.backoff = backoff
+        self.session = None
+        self.limiter = None
+        self.stats = {'points': 0, 'requests': 0, 'retries': 0, 'throttled': 0, 'failed_points': 0, 'elapsed': 0.0}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.limiter = AdaptiveLimiter(maximum=self.max_concurrency, min_interval=self.min_interval)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    # Function to send one union query, retrying throttled and failed requests with jittered exponential backoff
+    async def fetch_batch(self, points):
+        query = union_query(points, self.radius)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats['retries'] += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            await self.limiter.acquire()
+            throttled, retry_after = False, None
+            try:
+                self.stats['requests'] += 1
+                async with self.session.post(self.url, data={'data': query}) as response:
+                    if response.status == 200:
+                        return split_response(await response.json(content_type=None), len(points))
+                    if response.status not in RETRY_STATUSES:
+                        print(f"Overpass returned {response.status} for a batch of {len(points)} points, not retrying")
+                        break
+                    throttled = True
+                    self.stats['throttled'] += 1
+                    retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                throttled = True
+                print(f"Request failed ({e.__class__.__name__}: {e}), retrying")
+            finally:
+                await self.limiter.release(throttled, retry_after)
+        self.stats['failed_points'] += len(points)
+        return [None] * len(points) # Failed, unlike (None, None) for "nothing within the radius"
+
+    # Function to look up the first OSM element near every point, in input order (None where the lookup failed)
+    async def lookup(self, points):
+        start = time.perf_counter()
+        points = list(points)
+        batches = [points[i:i + self.batch_size] for i in range(0, len(points), self.batch_size)]
+        results = await asyncio.gather(*[self.fetch_batch(batch) for batch in batches])
+        self.stats['points'] += len(points)
+        self.stats['elapsed'] += time.perf_counter() - start
+        return [result for batch in results for result in batch]
+
+    # Function to summarise the throughput so far
+    def summary(self):
+        elapsed = self.stats['elapsed'] or 1e-9
+        return (f"{self.stats['points']} points in {self.stats['requests']} requests over {elapsed:.1f} s "
+                f"({self.stats['points'] / elapsed:.1f} points/s) | retries: {self.stats['retries']} | "
+                f"throttled: {self.stats['throttled']} | failed points: {self.stats['failed_points']} | "
+                f"concurrency limit: {int(self.limiter.limit)}")
+
+# Function to look up many points from synchronous code
+def lookup_points(points, **client_options):
+    async def run():
+        async with OverpassClient(**client_options) as client:
+            results = await client.lookup(points)
+            print(client.summary())
+            return results
+    return asyncio.run(run())
+
+# Function to build a local stub of the Overpass API for testing
+# It answers union queries with one made-up way per point (none for points whose latitude ends in an odd
+# fourth decimal), and throttles with 429 like the real server when more than max_active queries are running
+def stub_application(max_active=4, delay=0.05, throttle_rate=0.0):
+    state = {'active': 0, 'requests': 0}
+    point_pattern = re.compile(r"way\(around:[\d.]+,(-?[\d.]+),(-?[\d.]+)\)")
+
+    async def interpreter(request):
+        form = await request.post() if request.method == 'POST' else request.query
+        state['requests'] += 1
+        if state['active'] >= max_active or random.random() < throttle_rate:
+            return web.Response(status=429, headers={'Retry-After': '0'})
+        state['active'] += 1
+        try:
+            await asyncio.sleep(delay)
+            elements = []
+            for index, (latitude, longitude) in enumerate(point_pattern.findall(form['data'])):
+                if int(round(float(latitude) * 1e4)) % 2 == 0:
+                    elements.append({'type': 'way', 'id': int(round(abs(float(latitude)) * 1e4)) * 100000 +
+                                     int(round(abs(float(longitude)) * 1e4)) % 100000})
+                elements.append({'type': SEPARATOR_TYPE, 'id': index + 1, 'tags': {'index': str(index)}})
+            return web.json_response({'elements': elements})
+        finally:
+            state['active'] -= 1
+
+    application = web.Application()
+    application.router.add_route('*', '/api/interpreter', interpreter)
+    application['state'] = state
+    return application
+
+# Function to start the stub server in the running event loop, returning its runner and URL
+async def start_stub(port=0, **stub_options):
+    runner = web.AppRunner(stub_application(**stub_options))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/api/interpreter"
+
+# Function to read (latitude, longitude) pairs from a CSV file with a header row
+def read_points(input_file):
+    with open(input_file, 'r', encoding='utf-8-sig') as infile:
+        csv_reader = csv.reader(infile)
+        next(csv_reader) # Skip header
+        return [tuple(map(float, row[:2])) for row in csv_reader if row]
+
+# Function to write the looked-up OSM IDs and types next to their coordinates
+def write_results(output_file, points, results):
+    with open(output_file, 'w', newline='') as outfile:
+        csv_writer = csv.writer(outfile)
+        csv_writer.writerow(['Latitude', 'Longitude', 'OSM_ID', 'OSM_Type'])
+        for (latitude, longitude), result in zip(points, results):
+            osm_id, osm_type = result or (None, None)
+            csv_writer.writerow([latitude, longitude, osm_id, osm_type])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look up the OSM element nearest to many coordinates with batched Overpass queries.")
+    parser.add_argument('--input', default='C:/Users/bencr/Downloads/combined_collision_v3/latlong.txt')
+    parser.add_argument('--output', default='osm_info.csv')
+    parser.add_argument('--url', default=OVERPASS_URL)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Points per union query")
+    parser.add_argument('--max-concurrency', type=int, default=4, help="Upper bound for the adaptive concurrency limit")
+    parser.add_argument('--stub', type=int, metavar='POINTS', help="Run against a local stub server with this many random points")
+    args = parser.parse_args()
+
+    if args.stub:
+        async def stub_run():
+            runner, url = await start_stub(max_active=4)
+            points = [(random.uniform(51.35, 51.65), random.uniform(-0.45, 0.15)) for _ in range(args.stub)]
+            async with OverpassClient(url, batch_size=args.batch_size, max_concurrency=args.max_concurrency, backoff=0.05) as client:
+                results = await client.lookup(points)
+                print(client.summary())
+            await runner.cleanup()
+            return points, results
+        points, results = asyncio.run(stub_run())
+    else:
+        points = read_points(args.input)
+        results = lookup_points(points, url=args.url, batch_size=args.batch_size, max_concurrency=args.max_concurrency)
+    write_results(args.output, points, results)
+    print(f"OSM information saved to {args.output}")
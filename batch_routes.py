@@ -0,0 +1,107 @@
+import os # For counting the available cores
+import csv # For streaming the results to a CSV file
+import argparse # For the command-line interface
+from concurrent.futures import ProcessPoolExecutor, as_completed # For routing on all cores
+import numpy as np # For grouping the pairs by origin
+import pandas as pd # For reading the pair and collision files
+from graph_snapshot import load_snapshot # For opening the memory-mapped road network
+from array_routing import RoutingCore # For the shortest and safest searches
+from compact_schema import read_compact_csv # For reading the collision file with compact types
+
+# Columns written for every origin/destination pair
+RESULT_COLUMNS = ['start_node', 'end_node', 'shortest_distance', 'shortest_severity', 'safest_distance', 'safest_severity']
+
+# The routing core used by each worker process (mapped read-only from the snapshot's routing columns)
+worker_routing = None
+
+# Function to open the snapshot once in every worker process, mapping the routing arrays the parent wrote
+# instead of building a private copy of the weights and graphs in every worker
+def initialise_worker(snapshot_directory):
+    global worker_routing
+    worker_routing = RoutingCore.from_columns(load_snapshot(snapshot_directory))
+
+# Function to route from one origin to many destinations, reusing one search tree per weight
+def evaluate_origin(origin, destinations, routing=None):
+    routing = routing or worker_routing
+    node_ids = routing.snapshot.node_ids
+    _, shortest_tree = routing.search_tree(origin, 'length')
+    _, safest_tree = routing.search_tree(origin, 'safety')
+    rows = []
+    for destination in destinations:
+        row = [int(node_ids[origin]), int(node_ids[destination])]
+        try:
+            row += routing.path_metrics(routing.route_from_tree(shortest_tree, origin, destination, 'length'))
+            row += routing.path_metrics(routing.route_from_tree(safest_tree, origin, destination, 'safety'))
+        except ValueError:
+            row += [None] * 4 # No path between this pair
+        rows.append(row)
+    return rows
+
+# Function to group pairs of node positions by origin, so each origin is searched only once
+def group_by_origin(origins, destinations):
+    origins, destinations = np.asarray(origins), np.asarray(destinations)
+    order = np.argsort(origins, kind='stable')
+    unique, starts = np.unique(origins[order], return_index=True)
+    return [(int(origin), destinations[group].tolist()) for origin, group in zip(unique, np.split(order, starts[1:]))]
+
+# Function to evaluate many origin/destination pairs on a process pool, streaming rows to a CSV file as they finish
+def evaluate_pairs(snapshot_directory, origins, destinations, output_file, max_workers=None):
+    groups = group_by_origin(origins, destinations)
+    # Build the routing arrays once, from the snapshot's current severities, for every worker to map
+    RoutingCore(load_snapshot(snapshot_directory)).save_columns()
+    written = 0
+    with open(output_file, 'w', newline='') as outfile, \
+            ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), initializer=initialise_worker,
+                                initargs=(snapshot_directory,)) as executor:
+        csv_writer = csv.writer(outfile)
+        csv_writer.writerow(RESULT_COLUMNS)
+        futures = [executor.submit(evaluate_origin, origin, targets) for origin, targets in groups]
+        for future in as_completed(futures):
+            rows = future.result()
+            csv_writer.writerows(rows)
+            outfile.flush()
+            written += len(rows)
+    print(f"Evaluated {written} pairs from {len(groups)} origins, written to {output_file}")
+    return written
+
+# Function to read origin/destination coordinates from a CSV file and snap them to the network
+def pairs_from_file(snapshot, pairs_file):
+    pairs = pd.read_csv(pairs_file)
+    origins = snapshot.nearest_nodes(pairs['start_longitude'], pairs['start_latitude'])
+    destinations = snapshot.nearest_nodes(pairs['end_longitude'], pairs['end_latitude'])
+    return origins, destinations
+
+# Function to sample pairs of collision locations from one borough to another
+def pairs_from_boroughs(snapshot, dataset_file, first_borough, second_borough, samples, seed=None):
+    df = read_compact_csv(dataset_file, usecols=['Latitude', 'Longitude', 'Borough', 'number_of_accidents'])
+    df = df[df['number_of_accidents'] > 0] # Remove rows without accidents, as command_borough.py does
+    rng = np.random.default_rng(seed)
+    starts = df[df['Borough'] == first_borough]
+    ends = df[df['Borough'] == second_borough]
+    if starts.empty or ends.empty:
+        raise ValueError("Both boroughs need at least one collision location.")
+    starts = starts.iloc[rng.integers(len(starts), size=samples)]
+    ends = ends.iloc[rng.integers(len(ends), size=samples)]
+    return (snapshot.nearest_nodes(starts['Longitude'], starts['Latitude']),
+            snapshot.nearest_nodes(ends['Longitude'], ends['Latitude']))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the shortest and safest routes for many origin/destination pairs.")
+    parser.add_argument('--snapshot', required=True, help="Road network snapshot directory (see graph_snapshot.py)")
+    parser.add_argument('--pairs', help="CSV with start_latitude, start_longitude, end_latitude and end_longitude columns")
+    parser.add_argument('--dataset', help="Refined London dataset to sample borough-to-borough pairs from")
+    parser.add_argument('--boroughs', nargs=2, metavar=('FROM', 'TO'), help="Boroughs to sample pairs between")
+    parser.add_argument('--samples', type=int, default=1000, help="Number of borough-to-borough pairs to sample")
+    parser.add_argument('--seed', type=int, help="Random seed for the sampled pairs")
+    parser.add_argument('--workers', type=int, help="Number of worker processes (default: all cores)")
+    parser.add_argument('--output', default='route_comparison.csv', help="CSV file to write the per-pair metrics to")
+    args = parser.parse_args()
+
+    snapshot = load_snapshot(args.snapshot)
+    if args.pairs:
+        origins, destinations = pairs_from_file(snapshot, args.pairs)
+    elif args.dataset and args.boroughs:
+        origins, destinations = pairs_from_boroughs(snapshot, args.dataset, *args.boroughs, args.samples, args.seed)
+    else:
+        parser.error("Give either --pairs, or --dataset with --boroughs.")
+    evaluate_pairs(args.snapshot, origins, destinations, args.output, args.workers)
@@ -0,0 +1,346 @@
+import os # For interacting with the file system
+import io # For hiding the stages' progress output
+import sys # For the exit code when a stage regresses
+import json # For the results and baseline files
+import time # For timing the stages
+import shutil # For removing the scratch directory
+import platform # For recording the machine the results came from
+import tempfile # For the scratch directory holding the synthetic data
+import argparse # For the command-line interface
+import contextlib # For hiding the stages' progress output
+from datetime import datetime # For the departure time of the time-dependent routes
+from functools import cached_property # For building each piece of synthetic data only when a stage needs it
+import numpy as np # For generating the synthetic data
+import pandas as pd # For the collision tables
+import networkx as nx # For the graph the routing scripts use
+
+# Synthetic scales: a jittered street grid of grid x grid junctions about 100 m apart, collisions along its streets
+# and the number of start/end pairs routed (Greater London's drive network has roughly 130,000 junctions)
+SCALES = {
+    'borough': {'grid': 60, 'collisions': 20000, 'routes': 20},
+    'inner_london': {'grid': 150, 'collisions': 200000, 'routes': 10},
+    'greater_london': {'grid': 360, 'collisions': 1000000, 'routes': 5},
+}
+
+# Stages timed at every scale, in the order the pipeline runs them
+STAGES = ['nearest_nodes', 'street_snapping', 'edge_annotation', 'routing_networkx', 'routing_arrays',
+          'routing_time_dependent', 'path_metrics', 'borough_assignment', 'chunk_merging', 'street_heatmap', 'density_tiles']
+
+# A stage regresses when its median time grows by more than this fraction of the baseline...
+THRESHOLD = 0.25
+# ...and by more than this many seconds (so millisecond stages don't flag on timer noise)
+NOISE_FLOOR = 0.005
+
+# Centre of the synthetic city (central London) and the grid spacing in degrees (about 100 m each way)
+CENTRE = (51.5074, -0.1278)
+LATITUDE_STEP, LONGITUDE_STEP = 0.0009, 0.00145
+
+# Share of Accident_Severity values 1 (fatal), 2 (serious) and 3 (slight), close to the London data
+SEVERITY_SHARES = [0.015, 0.135, 0.85]
+
+# Synthetic London-like data for one scale, generated deterministically from a seed
+# Every property is built on first use, so running one stage doesn't pay for the others' setup
+class Scenario:
+    def __init__(self, scale, directory, seed=0):
+        self.scale = scale
+        self.grid = SCALES[scale]['grid']
+        self.collision_count = SCALES[scale]['collisions']
+        self.route_count = SCALES[scale]['routes']
+        self.directory = directory
+        self.seed = seed
+
+    # Junctions of the jittered grid: OSM-style node IDs and coordinates
+    @cached_property
+    def nodes(self):
+        rng = np.random.default_rng(self.seed)
+        rows, columns = np.divmod(np.arange(self.grid * self.grid), self.grid)
+        latitudes = CENTRE[0] + (rows - self.grid / 2) * LATITUDE_STEP + rng.normal(0, LATITUDE_STEP * 0.15, len(rows))
+        longitudes = CENTRE[1] + (columns - self.grid / 2) * LONGITUDE_STEP + rng.normal(0, LONGITUDE_STEP * 0.15, len(rows))
+        return pd.DataFrame({'osmid': 1000000000 + np.arange(len(rows), dtype=np.int64), 'y': latitudes, 'x': longitudes})
+
+    # Street segments between neighbouring junctions: a few are missing, some are one-way, and runs of ten
+    # segments along a row or column share a way ID like an OSM street does
+    @cached_property
+    def segments(self):
+        from osmnx.distance import great_circle # For the segment lengths
+        rng = np.random.default_rng(self.seed + 1)
+        rows, columns = np.divmod(np.arange(self.grid * self.grid), self.grid)
+        across = columns < self.grid - 1
+        down = rows < self.grid - 1
+        first = np.concatenate([np.flatnonzero(across), np.flatnonzero(down)])
+        second = np.concatenate([np.flatnonzero(across) + 1, np.flatnonzero(down) + self.grid])
+        way = np.concatenate([rows[across] * self.grid + columns[across] // 10,
+                              self.grid * self.grid + columns[down] * self.grid + rows[down] // 10])
+        keep = rng.random(len(first)) > 0.08
+        first, second, way = first[keep], second[keep], way[keep]
+        nodes = self.nodes
+        length = great_circle(nodes['y'].values[first], nodes['x'].values[first], nodes['y'].values[second], nodes['x'].values[second])
+        return pd.DataFrame({'first': first, 'second': second, 'osmid': 500000000 + way, 'length': length,
+                             'oneway': rng.random(len(first)) < 0.15})
+
+    # Collisions scattered along the streets, a few metres either side of them, with more in the rush hours
+    @cached_property
+    def collisions(self):
+        rng = np.random.default_rng(self.seed + 2)
+        segments, nodes = self.segments, self.nodes
+        chosen = rng.integers(0, len(segments), self.collision_count)
+        along = rng.random(self.collision_count)
+        first, second = segments['first'].values[chosen], segments['second'].values[chosen]
+        latitudes = nodes['y'].values[first] + along * (nodes['y'].values[second] - nodes['y'].values[first])
+        longitudes = nodes['x'].values[first] + along * (nodes['x'].values[second] - nodes['x'].values[first])
+        collisions = pd.DataFrame({
+            'Latitude': latitudes + rng.normal(0, 0.00005, self.collision_count),
+            'Longitude': longitudes + rng.normal(0, 0.00008, self.collision_count),
+            'Accident_Severity': rng.choice([1, 2, 3], self.collision_count, p=SEVERITY_SHARES),
+        })
+        hours = np.where(rng.random(self.collision_count) < 0.3, rng.choice([8, 17], self.collision_count),
+                         rng.integers(0, 24, self.collision_count))
+        collisions['Day_of_Week'] = rng.integers(1, 8, self.collision_count)
+        collisions['Time'] = pd.Series(hours).astype(str).str.zfill(2) + ':' + \
+            pd.Series(rng.integers(0, 60, self.collision_count)).astype(str).str.zfill(2)
+        return collisions
+
+    # The OSMnx-style MultiDiGraph the routing scripts work on, annotated with the collisions
+    @cached_property
+    def graph(self):
+        from edge_severity_annotation import annotate_graph # For the mean_severity_score and number_of_accidents attributes
+        nodes, segments = self.nodes, self.segments
+        graph = nx.MultiDiGraph(crs='epsg:4326')
+        graph.add_nodes_from((int(osmid), {'y': float(y), 'x': float(x)})
+                             for osmid, y, x in zip(nodes['osmid'], nodes['y'], nodes['x']))
+        ids = nodes['osmid'].values
+        for first, second, osmid, length, oneway in zip(segments['first'].values, segments['second'].values,
+                                                        segments['osmid'].values, segments['length'].values,
+                                                        segments['oneway'].values):
+            attributes = {'osmid': int(osmid), 'length': float(length), 'oneway': bool(oneway)}
+            graph.add_edge(int(ids[first]), int(ids[second]), 0, **attributes)
+            if not oneway:
+                graph.add_edge(int(ids[second]), int(ids[first]), 0, **attributes)
+        annotate_graph(graph, self.collisions, default_severity=1)
+        return graph
+
+    # The graph's edge table with geometries, as ox.graph_to_gdfs gives the heatmap script
+    @cached_property
+    def edges(self):
+        import osmnx as ox # For converting the graph into GeoDataFrames
+        return ox.graph_to_gdfs(self.graph, nodes=False)
+
+    # Array snapshot of the annotated graph and the routing core over it
+    @cached_property
+    def core(self):
+        from graph_snapshot import build_snapshot, load_snapshot # For the CSR snapshot
+        from array_routing import RoutingCore # For the array routing
+        return RoutingCore(load_snapshot(build_snapshot(self.graph, os.path.join(self.directory, 'snapshot'))))
+
+    # Time-dependent routing over the snapshot, with hour-of-week profiles built from the collisions
+    @cached_property
+    def time_dependent(self):
+        from time_dependent_routing import TimeDependentRouting, build_profiles # For the profiles and the routing
+        return TimeDependentRouting(self.core, *build_profiles(self.core.snapshot, self.collisions))
+
+    # Start and end junctions that are connected, chosen from the largest strongly connected component
+    @cached_property
+    def route_pairs(self):
+        rng = np.random.default_rng(self.seed + 3)
+        component = np.array(sorted(max(nx.strongly_connected_components(self.graph), key=len)))
+        return [tuple(int(node) for node in rng.choice(component, 2, replace=False)) for _ in range(self.route_count)]
+
+    # Snapshot positions of the route pairs
+    @cached_property
+    def route_positions(self):
+        return self.core.snapshot.node_index(np.array(self.route_pairs, dtype=np.int64).ravel()).reshape(-1, 2)
+
+    # The shortest and safest route for every pair, over the snapshot arrays
+    @cached_property
+    def routes(self):
+        return [self.core.route(start, end, weight) for start, end in self.route_positions for weight in ['length', 'safety']]
+
+    # Chunk files in the osm_chunk_N.csv layout, as the Overpass scripts leave them
+    @cached_property
+    def chunk_files(self):
+        directory = os.path.join(self.directory, 'chunks')
+        os.makedirs(directory, exist_ok=True)
+        collisions = self.collisions[['Latitude', 'Longitude']].copy()
+        collisions['OSM_ID'] = np.random.default_rng(self.seed + 4).integers(500000000, 510000000, len(collisions))
+        collisions['OSM_Type'] = 'way'
+        files = []
+        bounds = np.linspace(0, len(collisions), 9).astype(int)
+        for number, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            files.append(os.path.join(directory, f'osm_chunk_{number}.csv'))
+            collisions.iloc[start:end].to_csv(files[-1], index=False)
+        return files
+
+    # Function to snap every collision to its nearest junction (the array version of ox.distance.nearest_nodes)
+    def nearest_nodes(self):
+        self.core.snapshot.nearest_nodes(self.collisions['Longitude'].values, self.collisions['Latitude'].values)
+        return self.collision_count
+
+    # Function to snap every collision to the OSM way of its nearest street, as offline_snapping.py does
+    def street_snapping(self):
+        from offline_snapping import StreetSnapper # For the nearest-street index
+        snapper = StreetSnapper(self.edges.reset_index()[['osmid', 'geometry']])
+        snapper.snap(self.collisions['Latitude'].values, self.collisions['Longitude'].values)
+        return self.collision_count
+
+    # Function to aggregate the collisions onto the nearest edges of the graph
+    def edge_annotation(self):
+        from edge_severity_annotation import annotate_graph # For the nearest-edge severity aggregation
+        annotate_graph(self.graph, self.collisions, default_severity=1)
+        return self.collision_count
+
+    # Function to route the shortest and safest paths with networkx, as the routing scripts do
+    # The safest weight is the same mean_severity_score + SEVERITY_OFFSET as routing_arrays, taking the cheapest of any
+    # parallel edges (on a MultiDiGraph networkx hands a weight function every parallel edge's attributes at once)
+    def routing_networkx(self):
+        from array_routing import SEVERITY_OFFSET # For the same safest-route weight as the routing core
+        def safety(u, v, parallel):
+            return min(data.get('mean_severity_score', 0) for data in parallel.values()) + SEVERITY_OFFSET
+        for start, end in self.route_pairs:
+            nx.shortest_path(self.graph, source=start, target=end, weight='length')
+            nx.shortest_path(self.graph, source=start, target=end, weight=safety)
+        return 2 * self.route_count
+
+    # Function to route the same shortest and safest paths over the snapshot arrays
+    def routing_arrays(self):
+        for start, end in self.route_positions:
+            self.core.shortest(start, end)
+            self.core.safest(start, end)
+        return 2 * self.route_count
+
+    # Function to route the safest path for a morning rush-hour departure, with severity that follows the arrival times
+    def routing_time_dependent(self):
+        for start, end in self.route_positions:
+            self.time_dependent.route(start, end, datetime(2024, 6, 14, 8, 30))
+        return self.route_count
+
+    # Function to compute the distance and mean severity of every routed path
+    def path_metrics(self):
+        for route in self.routes:
+            self.core.path_metrics(route)
+        return len(self.routes)
+
+    # Function to assign every collision to the nearest of 33 borough centroids
+    def borough_assignment(self):
+        from borough_assignment import BoroughAssigner # For the nearest-centroid lookup
+        rng = np.random.default_rng(self.seed + 5)
+        nodes = self.nodes
+        centroids = pd.DataFrame({'Borough': [f'Borough {number}' for number in range(1, 34)],
+                                  'Latitude': rng.uniform(nodes['y'].min(), nodes['y'].max(), 33),
+                                  'Longitude': rng.uniform(nodes['x'].min(), nodes['x'].max(), 33)})
+        BoroughAssigner(centroids).assign(self.collisions['Latitude'], self.collisions['Longitude'])
+        return self.collision_count
+
+    # Function to merge the chunk files into one file sorted by latitude, as osm_chunk_merger.py does
+    def chunk_merging(self):
+        from external_merge import external_sort # For the bounded-memory merge
+        external_sort(self.chunk_files, os.path.join(self.directory, 'merged.csv'), ['Latitude'],
+                      chunk_rows=max(self.collision_count // 16, 1000), temporary_directory=self.directory)
+        return self.collision_count
+
+    # Function to build the street severity heatmap, as Nominatim_heatmap.py does
+    def street_heatmap(self):
+        from street_heatmap_export import export_street_heatmap, first_osmid # For the GeoJSON heatmap
+        edges = self.edges
+        street_severity = edges['mean_severity_score'].groupby(first_osmid(edges['osmid']).values).mean()
+        lines = export_street_heatmap(edges, street_severity, os.path.join(self.directory, 'street_heatmap.html'))
+        return len(lines)
+
+    # Function to render the severity-weighted density tile pyramid
+    def density_tiles(self):
+        from density_tiles import build_pyramid # For the tile pyramid
+        output = os.path.join(self.directory, 'tiles')
+        shutil.rmtree(output, ignore_errors=True)
+        build_pyramid(self.collisions['Latitude'], self.collisions['Longitude'], self.collisions['Accident_Severity'], output)
+        return self.collision_count
+
+# Function to time one stage, returning its median and best time over some repeats
+# The first call also builds any synthetic data the stage needs, so it is run once untimed as a warm-up
+def time_stage(scenario, stage, repeats=3):
+    function = getattr(scenario, stage)
+    times = []
+    # The stages print their own progress, which would drown out the timings
+    with contextlib.redirect_stdout(io.StringIO()):
+        items = function()
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+    median = float(np.median(times))
+    return {'median': median, 'best': float(min(times)), 'repeats': repeats, 'items': items,
+            'items_per_second': items / median if median > 0 else None}
+
+# Function to describe the machine and software the results came from
+def environment():
+    import scipy, shapely, osmnx # Versions of the libraries doing the heavy lifting
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'processor': platform.processor(),
+            'cpus': os.cpu_count(), 'numpy': np.__version__, 'pandas': pd.__version__, 'scipy': scipy.__version__,
+            'networkx': nx.__version__, 'shapely': shapely.__version__, 'osmnx': osmnx.__version__}
+
+# Function to run the stages at some scales, returning the results
+def run_benchmarks(scales=('borough',), stages=STAGES, repeats=3, seed=0):
+    results = {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'seed': seed, 'environment': environment(), 'scales': {}}
+    for scale in scales:
+        directory = tempfile.mkdtemp(prefix=f'benchmark_{scale}_')
+        try:
+            scenario = Scenario(scale, directory, seed)
+            results['scales'][scale] = {}
+            for stage in stages:
+                print(f"[{scale}] {stage}...", flush=True)
+                results['scales'][scale][stage] = timing = time_stage(scenario, stage, repeats)
+                print(f"[{scale}] {stage}: {timing['median'] * 1000:.1f} ms median for {timing['items']} items")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+# Function to compare results with a baseline, returning the stages that got slower than the threshold allows
+def find_regressions(results, baseline, threshold=THRESHOLD, noise_floor=NOISE_FLOOR):
+    if baseline.get('environment', {}).get('platform') != results['environment']['platform']:
+        print("Warning: the baseline was recorded on a different platform, so timings may not be comparable")
+    regressions = []
+    for scale, stages in results['scales'].items():
+        for stage, timing in stages.items():
+            previous = baseline.get('scales', {}).get(scale, {}).get(stage)
+            if previous is None:
+                print(f"[{scale}] {stage}: no baseline")
+                continue
+            ratio = timing['median'] / previous['median'] if previous['median'] > 0 else float('inf')
+            regressed = ratio > 1 + threshold and timing['median'] - previous['median'] > noise_floor
+            print(f"[{scale}] {stage}: {previous['median'] * 1000:.1f} ms -> {timing['median'] * 1000:.1f} ms "
+                  f"({ratio:.2f}x){' REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append({'scale': scale, 'stage': stage, 'baseline': previous['median'],
+                                    'median': timing['median'], 'ratio': ratio})
+    return regressions
+
+# Function to write a JSON file, replacing any previous version atomically
+def write_json(path, data):
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temporary, path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the pipeline stages on synthetic London-scale data, fully offline.")
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['borough'])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to write this run's results")
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help="Results to check for regressions against")
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run's results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scales, args.stages, args.repeats, args.seed)
+    write_json(args.output, results)
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        write_json(args.baseline, results)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stages regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print("No regressions against the baseline")
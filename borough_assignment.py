@@ -0,0 +1,110 @@
+import os # For counting the available cores
+from collections import deque # For keeping a bounded window of chunks in flight
+from concurrent.futures import ProcessPoolExecutor # For assigning chunks on all cores
+import numpy as np # For vectorised distance calculations
+import pandas as pd # For streaming the collision table in chunks
+from scipy.spatial import cKDTree # For the nearest-centroid search
+
+# WGS84 ellipsoid (the model geopy.geodesic measures on)
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+
+# Number of nearest candidates re-ranked on the ellipsoid
+CANDIDATES = 4
+
+# Function to convert latitudes and longitudes to points on the unit sphere
+# (the straight-line distance between these points orders exactly like the great-circle distance)
+def unit_sphere(latitude, longitude):
+    latitude = np.radians(np.asarray(latitude, dtype=float))
+    longitude = np.radians(np.asarray(longitude, dtype=float))
+    return np.column_stack([np.cos(latitude) * np.cos(longitude),
+                            np.cos(latitude) * np.sin(longitude),
+                            np.sin(latitude)])
+
+# Function to approximate the geodesic distance (metres) between nearby points on the WGS84 ellipsoid
+def ellipsoidal_distance(latitude_1, longitude_1, latitude_2, longitude_2):
+    mean_latitude = np.radians((latitude_1 + latitude_2) / 2)
+    denominator = 1 - WGS84_E2 * np.sin(mean_latitude) ** 2
+    meridian_radius = WGS84_A * (1 - WGS84_E2) / denominator ** 1.5
+    normal_radius = WGS84_A / np.sqrt(denominator)
+    dy = np.radians(latitude_2 - latitude_1) * meridian_radius
+    dx = np.radians(longitude_2 - longitude_1) * normal_radius * np.cos(mean_latitude)
+    return np.hypot(dx, dy)
+
+# Nearest-centroid borough lookup (the same rule as london_borough_combination.py, for whole arrays at once)
+class BoroughAssigner:
+    def __init__(self, coordinates_df, boundaries=None, name_column='name'):
+        coordinates_df = coordinates_df.dropna(subset=['Latitude', 'Longitude'])
+        self.names = coordinates_df['Borough'].to_numpy(dtype=object)
+        self.latitudes = coordinates_df['Latitude'].to_numpy(dtype=float)
+        self.longitudes = coordinates_df['Longitude'].to_numpy(dtype=float)
+        self.tree = cKDTree(unit_sphere(coordinates_df['Latitude'], coordinates_df['Longitude']))
+        # Optional borough polygons (e.g. the London Datastore boundaries) for point-in-polygon assignment
+        self.boundaries = None
+        if boundaries is not None:
+            self.boundaries = boundaries.to_crs('EPSG:4326')[[name_column, 'geometry']].rename(columns={name_column: 'Borough'})
+
+    # Load the centroids written by London_borough.py and, optionally, a boundary file
+    @classmethod
+    def from_files(cls, coordinates_file, boundaries_file=None, name_column='name'):
+        boundaries = None
+        if boundaries_file is not None:
+            import geopandas as gpd # Only needed for point-in-polygon assignment
+            boundaries = gpd.read_file(boundaries_file)
+        return cls(pd.read_csv(coordinates_file), boundaries, name_column)
+
+    # Return the borough of every coordinate
+    def assign(self, latitudes, longitudes):
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        # Take the few nearest centroids on the sphere, then re-rank them on the ellipsoid as geodesic() would
+        k = min(CANDIDATES, len(self.names))
+        _, candidates = self.tree.query(unit_sphere(latitudes, longitudes), k=k)
+        candidates = candidates.reshape(len(latitudes), k)
+        distances = ellipsoidal_distance(latitudes[:, None], longitudes[:, None],
+                                         self.latitudes[candidates], self.longitudes[candidates])
+        nearest = candidates[np.arange(len(latitudes)), np.argmin(distances, axis=1)]
+        boroughs = self.names[nearest]
+        if self.boundaries is not None:
+            import geopandas as gpd
+            points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(longitudes, latitudes), crs='EPSG:4326')
+            # The spatial join uses the boundaries' spatial index; points outside every polygon keep the nearest centroid
+            joined = gpd.sjoin(points, self.boundaries, how='inner', predicate='within')
+            joined = joined[~joined.index.duplicated()]
+            boroughs[joined.index.to_numpy()] = joined['Borough'].to_numpy()
+        return boroughs
+
+# The assigner used by each worker process
+worker_assigner = None
+
+# Function to set up the assigner once in every worker process
+def initialise_worker(assigner):
+    global worker_assigner
+    worker_assigner = assigner
+
+# Function to add the Borough column to one chunk
+def assign_chunk(chunk):
+    chunk['Borough'] = worker_assigner.assign(chunk['Latitude'], chunk['Longitude'])
+    return chunk
+
+# Function to stream a collision table through the assigner on all cores and write the result
+def assign_file(input_file, output_file, assigner, chunk_size=200000, max_workers=None):
+    max_workers = max_workers or os.cpu_count()
+    reader = pd.read_csv(input_file, chunksize=chunk_size)
+    written = []
+    # Function to append a finished chunk to the output file
+    def write(result):
+        result.to_csv(output_file, mode='a' if written else 'w', header=not written, index=False)
+        written.append(len(result))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=initialise_worker, initargs=(assigner,)) as executor:
+        pending = deque()
+        # Keep only a few chunks in flight so memory stays bounded, and write them back in order
+        for chunk in reader:
+            pending.append(executor.submit(assign_chunk, chunk))
+            if len(pending) >= 2 * max_workers:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+    total = sum(written)
+    print(f"Assigned boroughs to {total} collisions, written to {output_file}")
+    return total
@@ -1,7 +1,7 @@
-import pandas as pd
+from compact_schema import read_compact_csv
 
 # Load your dataset into a DataFrame 
-df = pd.read_csv("C:/Users/bencr/Downloads/combined_collision_v3/refined_London_dataset.csv")
+df = read_compact_csv("C:/Users/bencr/Downloads/combined_collision_v3/refined_London_dataset.csv", usecols=['mean_severity_score'])
 
 # Group streets by mean_severity_score and count the number of streets in each group
 street_severity_count = df.groupby('mean_severity_score').size().reset_index(name='Number_of_Streets')
@@ -1,45 +1,9 @@
-import requests # For sending HTTP requests to the Overpass API
 import csv # For reading from and writing to CSV files
-import os # For interacting with the file system
-from concurrent.futures import ThreadPoolExecutor # For parallel processing of tasks
+from async_overpass import lookup_points # For batched, rate-controlled Overpass queries over pooled connections
+from osm_lookup_cache import LookupCache # For the coordinate lookups shared between runs and scripts
 
-# URL of the Overpass API endpoint
-OVERPASS_URL = "http://overpass-api.de/api/interpreter"
-
-# Function to query OpenStreetMap (OSM) data for a given latitude and longitude
-def osm(latitude, longitude):
-    # Define the Overpass query to find OSM elements (nodes, ways, relations) within a 10-metre radius
-    query = f"""
-    [out:json]; # Output format in JSON
-    (
-      node(around:10, {latitude}, {longitude});  
-      way(around:10, {latitude}, {longitude});   
-      relation(around:10, {latitude}, {longitude});  
-    );
-    out center; # Output with central geometry
-    """
-    # Send the query to the Overpass API and get the response
-    response = requests.get(OVERPASS_URL, params={"data": query})
-    if response.status_code == 200: # Check if the request was successful
-        data = response.json() # Parse the JSON response
-        # If there are elements in the response, retrieve the first element's ID and type
-        if "elements" in data and len(data["elements"]) > 0:
-            element = data["elements"][0]
-            return element["id"], element["type"] # Return the OSM ID and type of the element
-    return None, None # Return None if no data is found or the request fails
-
-# Function to process a single coordinate (latitude and longitude)
-def coordinate(latitude, longitude):
-    try:
-        # Call the osm function to get the OSM ID and type for the given coordinates
-        osm_id, osm_type = osm(latitude, longitude)
-        # Print the result for debugging purposes
-        print(f"Latitude: {latitude}\nLongitude: {longitude}\nOSM_ID: {osm_id}\nOSM_Type: {osm_type}\n")
-        return latitude, longitude, osm_id, osm_type # Return the results
-    except Exception as e: # Handle any exceptions that occur
-        # Print an error message and return None for OSM ID and type
-        print(f"Error processing coordinate {latitude}, {longitude}: {e}\n")
-        return latitude, longitude, None, None
+# Cache of earlier Overpass lookups
+cache = LookupCache(source='overpass')
 
 # Function to process a chunk of coordinates stored in a CSV file
 def chunks(chunk_file):
@@ -61,14 +25,13 @@ def chunks(chunk_file):
                 latitude, longitude = map(float, row[:2])
                 chunk.append((latitude, longitude)) # Add the coordinates to the chunk list
                 
-            # Use ThreadPoolExecutor to process coordinates in parallel
-            with ThreadPoolExecutor(max_workers=9) as executor:
-                # Map the coordinate function to each coordinate in the chunk
-                results = list(executor.map(lambda coord: coordinate(coord[0], coord[1]), chunk))
+            # Look up every coordinate not already cached, with union queries of many points each sent concurrently
+            results = cache.lookup(chunk, lambda points: lookup_points(points, max_concurrency=4))
+            print(f"Cache: {cache.stats()}")
                 
             # Write the results to the output file
-            for result in results:
-                csv_writer.writerow(result)
+            for (latitude, longitude), (osm_id, osm_type) in zip(chunk, results):
+                csv_writer.writerow([latitude, longitude, osm_id, osm_type])
                 
         # Print a success message indicating the output file location
         print(f"Written to {output_file}\n")
@@ -78,5 +41,5 @@ def chunks(chunk_file):
         print(f"Error processing chunk: {e}\n")
 
 # Example usage: Call the process_chunk function with a specific chunk file
-chunk_file = 'C:/Users/bencr/Downloads/chunks/osm_info_chunk_18.csv'
+chunk_file = 'C:/Users/bencr/Downloads/combined_collision_v3/chunks/osm_info_chunk_18.csv'
 chunks(chunk_file) # Process the specified chunk file
\ No newline at end of file
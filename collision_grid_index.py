@@ -0,0 +1,131 @@
+import os # For interacting with the file system
+import json # For the grid layout and column categories
+import time # For timing the queries
+import numpy as np # For the sorted cell arrays
+import pandas as pd # For reading the refined dataset and returning data frames
+import shapely # For the polygon queries
+from local_projection import project, project_coordinates # For the grid in metres
+from columnar_store import encode_chunk # For storing text columns as category codes
+from compact_schema import compact_frame, read_compact_csv # For the compact column types
+
+# Side of each grid cell in metres
+CELL_SIZE = 250
+
+# Where the refined dataset and its grid index live
+REFINED_CSV = 'C:/Users/bencr/Downloads/combined_collision_v3/refined_London_dataset.csv'
+REFINED_INDEX = 'C:/Users/bencr/Downloads/combined_collision_v3/refined_London_grid'
+
+# Uniform grid over collision locations, saved as memory-mapped columns sorted by cell
+# Cell c's rows are positions offsets[c]:offsets[c + 1], and cells are numbered row by row, so the cells of a
+# query box that share a grid row form one contiguous range and a query needs one slice per grid row
+class CollisionGridIndex:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.cell_size = self.meta['cell_size']
+        self.origin_x, self.origin_y = self.meta['origin']
+        self.columns_x, self.rows_y = self.meta['shape']
+        self.offsets = np.load(os.path.join(directory, 'offsets.npy'))
+        self.x = np.load(os.path.join(directory, 'x.npy'))
+        self.y = np.load(os.path.join(directory, 'y.npy'))
+        self.arrays = {}
+
+    # Function to find every row in the cells overlapping a box in projected metres
+    def candidates(self, minimum_x, maximum_x, minimum_y, maximum_y):
+        first_column = max(int((minimum_x - self.origin_x) // self.cell_size), 0)
+        last_column = min(int((maximum_x - self.origin_x) // self.cell_size), self.columns_x - 1)
+        first_row = max(int((minimum_y - self.origin_y) // self.cell_size), 0)
+        last_row = min(int((maximum_y - self.origin_y) // self.cell_size), self.rows_y - 1)
+        if first_column > last_column or first_row > last_row:
+            return np.empty(0, dtype=np.int64)
+        row_cells = np.arange(first_row, last_row + 1) * self.columns_x
+        starts = self.offsets[row_cells + first_column]
+        sizes = self.offsets[row_cells + last_column + 1] - starts
+        return np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+
+    # Function to find the collisions inside a latitude/longitude box, optionally widened by margin metres
+    def bbox(self, minimum_latitude, maximum_latitude, minimum_longitude, maximum_longitude, margin=0):
+        minimum_x, minimum_y = project(minimum_latitude, minimum_longitude)
+        maximum_x, maximum_y = project(maximum_latitude, maximum_longitude)
+        minimum_x, minimum_y, maximum_x, maximum_y = minimum_x - margin, minimum_y - margin, maximum_x + margin, maximum_y + margin
+        rows = self.candidates(minimum_x, maximum_x, minimum_y, maximum_y)
+        x, y = self.x[rows], self.y[rows]
+        return rows[(x >= minimum_x) & (x <= maximum_x) & (y >= minimum_y) & (y <= maximum_y)]
+
+    # Function to find the collisions within distance metres of a point
+    def radius(self, latitude, longitude, distance):
+        centre_x, centre_y = project(latitude, longitude)
+        rows = self.candidates(centre_x - distance, centre_x + distance, centre_y - distance, centre_y + distance)
+        return rows[(self.x[rows] - centre_x) ** 2 + (self.y[rows] - centre_y) ** 2 <= distance ** 2]
+
+    # Function to find the collisions inside a polygon given in longitude/latitude (e.g. a borough boundary)
+    def polygon(self, geometry):
+        projected = shapely.transform(geometry, project_coordinates)
+        minimum_x, minimum_y, maximum_x, maximum_y = projected.bounds
+        rows = self.candidates(minimum_x, maximum_x, minimum_y, maximum_y)
+        shapely.prepare(projected)
+        return rows[shapely.contains_xy(projected, self.x[rows], self.y[rows])]
+
+    # Function to map a stored column on first use
+    def array(self, name):
+        if name not in self.arrays:
+            self.arrays[name] = np.load(os.path.join(self.directory, f'{name}.npy'), mmap_mode='r')
+        return self.arrays[name]
+
+    # Function to return some rows of the dataset as a data frame (text columns come back as categoricals)
+    def frame(self, rows=None, columns=None):
+        rows = slice(None) if rows is None else rows
+        frame = {}
+        for name in columns or self.meta['columns']:
+            values = np.asarray(self.array(name)[rows])
+            categories = self.meta['categories'].get(name)
+            frame[name] = values if categories is None else pd.Categorical.from_codes(values, categories=categories)
+        return compact_frame(pd.DataFrame(frame))
+
+# Function to build the grid index for a data frame with Latitude and Longitude columns
+def build_index(df, directory, cell_size=CELL_SIZE):
+    os.makedirs(directory, exist_ok=True)
+    df = df.dropna(subset=['Latitude', 'Longitude'])
+    x, y = project(df['Latitude'].to_numpy(), df['Longitude'].to_numpy())
+    origin_x, origin_y = np.floor(x.min() / cell_size) * cell_size, np.floor(y.min() / cell_size) * cell_size
+    column = ((x - origin_x) // cell_size).astype(np.int64)
+    row = ((y - origin_y) // cell_size).astype(np.int64)
+    columns_x, rows_y = int(column.max()) + 1, int(row.max()) + 1
+    cells = row * columns_x + column
+
+    # Sort every column by cell and record where each cell's rows start
+    order = np.argsort(cells, kind='stable')
+    offsets = np.searchsorted(cells[order], np.arange(columns_x * rows_y + 1))
+    np.save(os.path.join(directory, 'offsets.npy'), offsets)
+    np.save(os.path.join(directory, 'x.npy'), x[order])
+    np.save(os.path.join(directory, 'y.npy'), y[order])
+    categories = {}
+    for name in df.columns:
+        values = df[name].iloc[order]
+        if pd.api.types.is_numeric_dtype(values):
+            np.save(os.path.join(directory, f'{name}.npy'), values.to_numpy())
+        else:
+            categories[name] = {}
+            np.save(os.path.join(directory, f'{name}.npy'), encode_chunk(values, categories[name]))
+            categories[name] = list(categories[name])
+    meta = {'cell_size': cell_size, 'origin': [float(origin_x), float(origin_y)], 'shape': [columns_x, rows_y],
+            'rows': len(df), 'columns': list(df.columns), 'categories': categories}
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return CollisionGridIndex(directory)
+
+# Function to open the refined dataset's grid index, building it the first time
+def open_index(csv_file=REFINED_CSV, directory=REFINED_INDEX, cell_size=CELL_SIZE):
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        print(f"Building the grid index for {csv_file} (only needed once)...")
+        return build_index(read_compact_csv(csv_file), directory, cell_size)
+    return CollisionGridIndex(directory)
+
+if __name__ == "__main__":
+    # Example usage: time a radius query around central London
+    index = open_index()
+    start = time.perf_counter()
+    rows = index.radius(51.5074, -0.1278, 1000)
+    print(f"Found {len(rows)} collision locations within 1 km in {(time.perf_counter() - start) * 1e6:.0f} microseconds")
+    print(index.frame(rows).head())
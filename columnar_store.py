@@ -0,0 +1,195 @@
+import os # For interacting with the file system
+import json # For the column types, categories and block statistics
+import time # For timing the conversion
+import shutil # For removing the temporary block files
+import numpy as np # For the memory-mapped columns
+import pandas as pd # For reading the CSV file and returning data frames
+from instrumentation import traced # For timing the calls
+from compact_schema import compact_frame # For the compact column types
+
+# Rows per block (every block keeps the minimum and maximum of each numeric column)
+BLOCK_SIZE = 65536
+
+# Where the combined collision dataset and its columnar copy live
+COLLISIONS_CSV = 'C:/Users/bencr/Downloads/combined_collision_v3/combined_collisions_v3.csv'
+COLLISIONS_STORE = 'C:/Users/bencr/Downloads/combined_collision_v3/combined_collisions_v3_columns'
+
+# Typed, memory-mapped copy of a CSV file with one .npy file per column
+# Text columns are stored as integer codes into a list of categories (-1 for missing values)
+# Rows are sorted by sort_column when the store is built, so the per-block ranges of that column are
+# narrow and a bounding box query only touches the few blocks that can contain matching rows
+# Each stored row's position in the CSV file is kept in row_order.npy, so reads come back in file order
+class ColumnStore:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.columns = list(self.meta['columns'])
+        self.row_count = self.meta['rows']
+        self.block_starts = np.arange(0, self.row_count, self.meta['block_size'])
+        self.block_ends = np.minimum(self.block_starts + self.meta['block_size'], self.row_count)
+        self.block_min = {name: np.array(stats['min'], dtype=float) for name, stats in self.meta['blocks'].items()}
+        self.block_max = {name: np.array(stats['max'], dtype=float) for name, stats in self.meta['blocks'].items()}
+        self.arrays = {}
+
+    # Function to map a column's file on first use
+    def array(self, name):
+        if name not in self.arrays:
+            self.arrays[name] = np.load(os.path.join(self.directory, f'{name}.npy'), mmap_mode='r')
+        return self.arrays[name]
+
+    # Function to find the blocks whose ranges overlap every (column, minimum, maximum) condition
+    def matching_blocks(self, ranges):
+        keep = np.ones(len(self.block_starts), dtype=bool)
+        for name, low, high in ranges:
+            # Blocks where the column is entirely missing have NaN ranges and can never match
+            keep &= (self.block_max[name] >= low) & (self.block_min[name] <= high)
+        return np.flatnonzero(keep)
+
+    # Function to read some columns, optionally only the rows inside a latitude/longitude box
+    # bbox is (minimum_latitude, maximum_latitude, minimum_longitude, maximum_longitude), inclusive like the scripts' filters
+    # Rows come back in the CSV file's order (as pd.read_csv would return them) unless file_order is False
+    def read(self, columns=None, bbox=None, latitude='Latitude', longitude='Longitude', file_order=True):
+        columns = self.columns if columns is None else list(columns)
+        unknown = [name for name in columns if name not in self.meta['columns']]
+        if unknown:
+            raise KeyError(f"Columns {unknown} are not in the store")
+        if bbox is None:
+            rows = slice(None)
+        else:
+            minimum_latitude, maximum_latitude, minimum_longitude, maximum_longitude = bbox
+            blocks = self.matching_blocks([(latitude, minimum_latitude, maximum_latitude),
+                                           (longitude, minimum_longitude, maximum_longitude)])
+            rows = np.concatenate([np.arange(self.block_starts[b], self.block_ends[b]) for b in blocks] or [np.empty(0, dtype=np.int64)])
+            latitudes, longitudes = self.array(latitude)[rows], self.array(longitude)[rows]
+            rows = rows[(latitudes >= minimum_latitude) & (latitudes <= maximum_latitude) &
+                        (longitudes >= minimum_longitude) & (longitudes <= maximum_longitude)]
+        if file_order and self.meta.get('row_order'):
+            rows = self.file_order(rows)
+        return compact_frame(pd.DataFrame({name: self.values(name, rows) for name in columns}))
+
+    # Function to put stored rows back into the order they had in the CSV file
+    def file_order(self, rows):
+        positions = np.asarray(self.array('row_order')[rows])
+        if isinstance(rows, slice):
+            return np.argsort(positions, kind='stable')
+        return rows[np.argsort(positions, kind='stable')]
+
+    # Function to read one column's values for some rows, decoding text columns as categoricals
+    def values(self, name, rows):
+        values = np.asarray(self.array(name)[rows])
+        categories = self.meta['columns'][name].get('categories')
+        if categories is None:
+            return values
+        return pd.Categorical.from_codes(values, categories=categories)
+
+    # Function to return a numeric column's minimum and maximum from the block statistics alone
+    def column_range(self, name):
+        return np.nanmin(self.block_min[name]), np.nanmax(self.block_max[name])
+
+# Function to convert a column chunk into an array, extending the column's categories for text values
+def encode_chunk(values, categories):
+    if categories is None:
+        return values.to_numpy()
+    codes = np.full(len(values), -1, dtype=np.int32)
+    present = values.notna().to_numpy()
+    text = values[present].astype(str)
+    for value in pd.unique(text):
+        if value not in categories:
+            categories[value] = len(categories)
+    codes[present] = text.map(categories).to_numpy()
+    return codes
+
+# Function to convert a CSV file into a column store, reading it one block at a time
+# Columns that pandas reads as text in the first block are stored as categories; categorical forces others to be
+def build_store(csv_file, directory, block_size=BLOCK_SIZE, sort_column='Latitude', categorical=()):
+    start = time.perf_counter()
+    staging = os.path.join(directory, 'blocks')
+    os.makedirs(staging, exist_ok=True)
+    categories, block_rows = {}, []
+    for block, chunk in enumerate(pd.read_csv(csv_file, chunksize=block_size, low_memory=False)):
+        if block == 0:
+            names = list(chunk.columns)
+            categories = {name: ({} if name in categorical or not pd.api.types.is_numeric_dtype(chunk[name]) else None)
+                          for name in names}
+        for column, name in enumerate(names):
+            values = chunk[name]
+            if categories[name] is None and not pd.api.types.is_numeric_dtype(values):
+                raise ValueError(f"Column '{name}' is numeric in the first block but not in block {block}; "
+                                 f"pass it in categorical")
+            np.save(os.path.join(staging, f'{column}_{block}.npy'), encode_chunk(values, categories[name]))
+        block_rows.append(len(chunk))
+
+    # Join the blocks into one file per column, promoting to the widest type seen (an integer column with
+    # missing values in a later block becomes float, as it would with pd.read_csv)
+    row_count = sum(block_rows)
+    block_count = len(block_rows)
+    dtypes = [np.result_type(*[np.load(os.path.join(staging, f'{column}_{block}.npy'), mmap_mode='r').dtype
+                               for block in range(block_count)]) for column in range(len(names))]
+    for column, name in enumerate(names):
+        output = np.lib.format.open_memmap(os.path.join(directory, f'{name}.npy'), mode='w+',
+                                           dtype=dtypes[column], shape=(row_count,))
+        position = 0
+        for block in range(block_count):
+            values = np.load(os.path.join(staging, f'{column}_{block}.npy'))
+            output[position:position + len(values)] = values
+            position += len(values)
+        output.flush()
+        del output
+    shutil.rmtree(staging)
+
+    # Reorder every column by the sort column, one column at a time
+    if sort_column is not None:
+        order = np.argsort(np.load(os.path.join(directory, f'{sort_column}.npy')), kind='stable')
+        for name in names:
+            path = os.path.join(directory, f'{name}.npy')
+            values = np.load(path)[order]
+            np.save(path, values)
+        np.save(os.path.join(directory, 'row_order.npy'), order.astype(np.int64))
+
+    # Record the type, categories and per-block range of every column
+    meta = {'rows': row_count, 'block_size': block_size, 'sort_column': sort_column, 'source': csv_file,
+            'row_order': sort_column is not None, 'columns': {}, 'blocks': {}}
+    starts = np.arange(0, row_count, block_size)
+    for column, name in enumerate(names):
+        meta['columns'][name] = {'dtype': str(dtypes[column])}
+        if categories[name] is not None:
+            meta['columns'][name]['categories'] = list(categories[name])
+            continue
+        values = np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r').astype(float)
+        minimum, maximum = [], []
+        for first in starts:
+            block = values[first:first + block_size]
+            finite = block[~np.isnan(block)]
+            minimum.append(float(finite.min()) if len(finite) else None)
+            maximum.append(float(finite.max()) if len(finite) else None)
+        meta['blocks'][name] = {'min': minimum, 'max': maximum}
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    print(f"Stored {row_count} rows and {len(names)} columns in {block_count} blocks "
+          f"in {time.perf_counter() - start:.1f} s")
+    return ColumnStore(directory)
+
+# Function to open a column store, converting the CSV file the first time
+# A sorted store written before row_order.npy existed is converted again, so reads keep the file's row order
+def open_store(csv_file=COLLISIONS_CSV, directory=COLLISIONS_STORE):
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        print(f"Converting {csv_file} into a column store (only needed once)...")
+        return build_store(csv_file, directory)
+    store = ColumnStore(directory)
+    if store.meta.get('sort_column') is not None and not store.meta.get('row_order'):
+        print(f"Converting {csv_file} again to record its row order...")
+        return build_store(csv_file, directory, sort_column=store.meta['sort_column'])
+    return store
+
+# Function to load columns of the combined collision dataset, optionally only inside a latitude/longitude box
+@traced('load_collisions', rows=len)
+def load_collisions(columns=None, bbox=None):
+    return open_store().read(columns, bbox)
+
+if __name__ == "__main__":
+    # Example usage: convert the dataset once and time a London query against it
+    store = open_store()
+    start = time.perf_counter()
+    london = store.read(['Latitude', 'Longitude', 'Accident_Severity'], bbox=(51.3550556, 51.6517156, -0.453256, 0.15050513))
+    print(f"Read {len(london)} London collisions in {(time.perf_counter() - start) * 1000:.1f} ms")
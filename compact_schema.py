@@ -0,0 +1,126 @@
+import numpy as np # For the fixed-point coordinates and the histograms
+import pandas as pd # For reading and typing the tables
+
+# Coordinates are grouped as whole microdegrees (about 0.1 m), the precision of the collision data's six decimal places
+COORDINATE_SCALE = 1000000
+
+# Coordinates within this many degrees of a whole microdegree count as six-decimal values (float rounding of the CSV text)
+MICRODEGREE_TOLERANCE = 1e-9
+
+# Accident_Severity values counted separately per location
+SEVERITY_CATEGORIES = {1: 'fatal', 2: 'serious', 3: 'slight'}
+HISTOGRAM_COLUMNS = [f'{name}_accidents' for name in SEVERITY_CATEGORIES.values()]
+
+# Compact types of the columns the scripts use (columns with missing values get the nullable version of the type)
+COLUMN_TYPES = {
+    'Accident_Severity': 'int8',
+    'Day_of_Week': 'int8',
+    'Year': 'int16',
+    'number_of_accidents': 'int32',
+    'fatal_accidents': 'int32',
+    'serious_accidents': 'int32',
+    'slight_accidents': 'int32',
+}
+
+# Text columns read as categories (each value is stored once, rows hold small integer codes)
+CATEGORY_COLUMNS = ['Borough', 'OSM_Type']
+
+# Function to convert coordinates in degrees to fixed-point microdegrees
+def fixed_point(degrees):
+    return np.rint(np.asarray(degrees, dtype=float) * COORDINATE_SCALE).astype(np.int32)
+
+# Function to convert fixed-point microdegrees back to degrees
+def from_fixed_point(codes):
+    return np.asarray(codes, dtype=np.int64) / COORDINATE_SCALE
+
+# Function to check that coordinates are whole microdegrees (six decimal places), within MICRODEGREE_TOLERANCE
+def whole_microdegrees(degrees):
+    degrees = np.asarray(degrees, dtype=float)
+    return len(degrees) == 0 or bool(np.abs(from_fixed_point(fixed_point(degrees)) - degrees).max() <= MICRODEGREE_TOLERANCE)
+
+# Function to pack a latitude and longitude into one int64 per location, ordered by latitude then longitude
+# (grouping and sorting one integer column is much faster than two float columns)
+# Coordinates are rounded to the nearest microdegree (about 0.1 m), so finer positions closer than that share a key;
+# location_groups only uses the keys when no coordinate has more than six decimal places
+def location_keys(latitudes, longitudes):
+    latitudes, longitudes = np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float)
+    if np.isnan(latitudes).any() or np.isnan(longitudes).any():
+        raise ValueError("Locations can't be grouped with missing coordinates")
+    return (fixed_point(latitudes).astype(np.int64) << 32) + (fixed_point(longitudes).astype(np.int64) + 2 ** 31)
+
+# Function to group rows by exact location, returning every location's latitude and longitude (ordered by latitude
+# then longitude, like a groupby) and each row's location
+# Six-decimal coordinates (the collision data) are grouped as int64 keys; finer ones, such as snapped or projected
+# points, fall back to sorting the float pairs, which keeps every distinct position apart as the groupby did
+def location_groups(latitudes, longitudes):
+    latitudes, longitudes = np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float)
+    if whole_microdegrees(latitudes) and whole_microdegrees(longitudes):
+        keys, locations = np.unique(location_keys(latitudes, longitudes), return_inverse=True)
+        return *key_coordinates(keys), locations
+    order = np.lexsort((longitudes, latitudes))
+    new_location = np.ones(len(order), dtype=bool)
+    new_location[1:] = (latitudes[order][1:] != latitudes[order][:-1]) | (longitudes[order][1:] != longitudes[order][:-1])
+    locations = np.empty(len(order), dtype=np.int64)
+    locations[order] = np.cumsum(new_location) - 1
+    first = order[new_location]
+    return latitudes[first], longitudes[first], locations
+
+# Function to unpack location keys into latitudes and longitudes
+def key_coordinates(keys):
+    return from_fixed_point(keys >> 32), from_fixed_point((keys & 0xFFFFFFFF) - 2 ** 31)
+
+# Function to give a table's columns their compact types, in place
+def compact_frame(df):
+    for name in df.columns:
+        if name in COLUMN_TYPES:
+            values = df[name]
+            if values.isna().any():
+                df[name] = values.astype(COLUMN_TYPES[name].capitalize()) # Nullable integer type, e.g. Int8
+            else:
+                df[name] = values.astype(COLUMN_TYPES[name])
+        elif name in CATEGORY_COLUMNS and not isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].astype('category')
+    return df
+
+# Function to read a CSV file straight into the compact types
+# Older summary files with an accident_severity_scores list column get severity histogram columns instead
+def read_compact_csv(path, usecols=None, **kwargs):
+    header = pd.read_csv(path, nrows=0, **kwargs).columns
+    columns = list(header) if usecols is None else list(usecols)
+    legacy = 'accident_severity_scores' in header and HISTOGRAM_COLUMNS[0] not in header and \
+        any(name in HISTOGRAM_COLUMNS + ['accident_severity_scores'] for name in columns)
+    if legacy:
+        columns = [name for name in columns if name not in HISTOGRAM_COLUMNS + ['accident_severity_scores']]
+        columns.append('accident_severity_scores')
+    df = pd.read_csv(path, usecols=columns, dtype={name: 'category' for name in CATEGORY_COLUMNS if name in columns}, **kwargs)
+    if legacy:
+        # The lists hold single-digit severities, so counting each digit in the text counts the collisions
+        scores = df.pop('accident_severity_scores').astype(str)
+        for value, column in zip(SEVERITY_CATEGORIES, HISTOGRAM_COLUMNS):
+            df[column] = scores.str.count(str(value))
+    return compact_frame(df)
+
+# Function to summarise collisions per location: the count, a count per severity and the mean severity
+# (the histograms replace the per-row lists of severities, and give the same mean)
+# Rows with a missing coordinate are left out, as groupby leaves out missing keys
+def severity_histograms(latitudes, longitudes, severity):
+    latitudes, longitudes = np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float)
+    severity = np.asarray(severity)
+    located = ~(np.isnan(latitudes) | np.isnan(longitudes))
+    latitudes, longitudes, severity = latitudes[located], longitudes[located], severity[located]
+    if not np.isin(severity, list(SEVERITY_CATEGORIES)).all():
+        raise ValueError(f"Accident_Severity values must be one of {list(SEVERITY_CATEGORIES)}")
+    latitude, longitude, locations = location_groups(latitudes, longitudes)
+    categories = len(SEVERITY_CATEGORIES)
+    histograms = np.bincount(locations * categories + (severity.astype(np.int64) - 1),
+                             minlength=len(latitude) * categories).reshape(len(latitude), categories).astype(np.int32)
+    counts = histograms.sum(axis=1)
+    summary = pd.DataFrame({'Latitude': latitude, 'Longitude': longitude, 'number_of_accidents': counts})
+    for column, name in enumerate(HISTOGRAM_COLUMNS):
+        summary[name] = histograms[:, column]
+    summary['mean_severity_score'] = histograms @ np.array(list(SEVERITY_CATEGORIES), dtype=np.int64) / counts
+    return summary
+
+# Function to report a table's memory use in megabytes (including the text in object columns)
+def memory_megabytes(df):
+    return df.memory_usage(deep=True).sum() / 1e6
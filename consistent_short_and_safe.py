@@ -1,70 +1,38 @@
-import pandas as pd # Importing pandas for data manipulation and analysis
-import osmnx as ox # Importing osmnx for downloading and working with OpenStreetMap data
-import networkx as nx # Importing networkx for graph-based operations and algorithms
 import folium # Importing folium for creating interactive maps
+from graph_tiles import open_tiles # Importing the tiled London road network
+from collision_grid_index import open_index # Importing the grid index over the refined dataset
+from instrumentation import Span # Importing the stage timing spans
 
-# Disable the OSMnx caching
-ox.settings.use_cache = False
-ox.settings.log_console = False  
-
-# Load the dataset
+# Open the grid index over the refined dataset (built from the CSV file on first use)
 file_path = "C:/Users/bencr/Downloads/combined_collision_v3/refined_London_dataset.csv"
-df = pd.read_csv(file_path)
-
-# Filter out accident-free streets
-df = df[df["number_of_accidents"] > 0]
+index = open_index(file_path)
 
-# Select two random points
-random_points = df.sample(2)
+# Select two random points from the accident locations
+locations = index.frame(columns=["Latitude", "Longitude", "number_of_accidents"])
+random_points = locations[locations["number_of_accidents"] > 0].sample(2)
 start_latitude, start_longitude = random_points.iloc[0][["Latitude", "Longitude"]]
 finish_latitude, finish_longitude = random_points.iloc[1][["Latitude", "Longitude"]]
 start = (start_latitude, start_longitude)
 finish = (finish_latitude, finish_longitude)
 
-# Fetch the road network around the start point 
-Graph = ox.graph_from_point(start, dist=5000, network_type="drive", retain_all=True, simplify=False)
-
-# Initialise the edge attributes efficiently
-for _, _, _, data in Graph.edges(keys=True, data=True):
-    data.setdefault('mean_severity_score', 1)
-    data.setdefault('number_of_accidents', 0)
-
-# Vectorised nearest node search
-df["nearest_node"] = ox.distance.nearest_nodes(Graph, df["Longitude"], df["Latitude"])
+# Open the London road network as tiles that are read only where the searches reach (the snapshot is annotated
+# with the refined dataset if it has no collision data yet, and split again whenever its collision data changes)
+# The safest path minimises the mean severity score alone, with a severity of 1 for edges without collisions
+Graph = open_tiles("C:/Users/bencr/Downloads/combined_collision_v3/london_drive_tiles",
+                   "C:/Users/bencr/Downloads/combined_collision_v3/london_drive_snapshot",
+                   severity_offset=0, default_severity=1, collisions_file=file_path)
 
-# Apply the severity scores to edges efficiently
-severity_map = df.set_index("nearest_node")[["mean_severity_score", "number_of_accidents"]].to_dict()
-
-# Iterate through all the edges in the graph, extracting nodes (i, j), edge key and edge data
-for i, j, key, data in Graph.edges(keys=True, data=True):
-    if i in severity_map["mean_severity_score"]:
-        data["mean_severity_score"] = severity_map["mean_severity_score"][i]
-        data["number_of_accidents"] = severity_map["number_of_accidents"][i]
-    elif j in severity_map["mean_severity_score"]:
-        data["mean_severity_score"] = severity_map["mean_severity_score"][j]
-        data["number_of_accidents"] = severity_map["number_of_accidents"][j]
-
-# Find the nearest nodes for start and finish points
-start_node = ox.distance.nearest_nodes(Graph, start_longitude, start_latitude)
-finish_node = ox.distance.nearest_nodes(Graph, finish_longitude, finish_latitude)
+# Compute the shortest and safest paths between the nearest nodes to the start and finish points
+shortest_route = Graph.route(start, finish, "length")
+safest_route = Graph.route(start, finish, "safety")
 
 # Snap the start and finish points to nearest nodes
-start = (Graph.nodes[start_node]['y'], Graph.nodes[start_node]['x'])
-finish = (Graph.nodes[finish_node]['y'], Graph.nodes[finish_node]['x'])
-
-# Compute the shortest and safest paths
-shortest_path = nx.shortest_path(Graph, source=start_node, target=finish_node, weight="length")
-safest_path = nx.shortest_path(Graph, source=start_node, target=finish_node, weight="mean_severity_score")
-
-# Compute the path metrics
-def path_metrics(Graph, path):
-    edges = [Graph[i][j][0] for i, j in zip(path[:-1], path[1:])]
-    total_distance = sum(edge["length"] for edge in edges)
-    mean_severity = round(sum(edge["mean_severity_score"] for edge in edges) / len(edges))
-    return total_distance, mean_severity
+start = (shortest_route.latitudes[0], shortest_route.longitudes[0])
+finish = (shortest_route.latitudes[-1], shortest_route.longitudes[-1])
 
-shortest_distance, shortest_severity = path_metrics(Graph, shortest_path)
-safest_distance, safest_severity = path_metrics(Graph, safest_path)
+# The path metrics come with the routes
+shortest_distance, shortest_severity = shortest_route.distance, shortest_route.mean_severity
+safest_distance, safest_severity = safest_route.distance, safest_route.mean_severity
 
 # Create the folium map
 map = folium.Map(location=start, zoom_start=13)
@@ -74,14 +42,15 @@ folium.Marker(location=start, popup="Start", icon=folium.Icon(color="green")).ad
 folium.Marker(location=finish, popup="Finish", icon=folium.Icon(color="red")).add_to(map)
 
 # Function to plot the paths
-def path_plot(map, Graph, path, colour, label, distance, severity):
-    coordinates = [(Graph.nodes[node]['y'], Graph.nodes[node]['x']) for node in path]
+def path_plot(map, route, colour, label, distance, severity):
+    coordinates = list(zip(route.latitudes, route.longitudes))
     folium.PolyLine(coordinates, color=colour, weight=5, opacity=0.8, popup=f"{label} (Distance: {distance:.2f} m, Severity: {severity})").add_to(map)
 
-path_plot(map, Graph, shortest_path, "blue", "Shortest Path", shortest_distance, shortest_severity)
-path_plot(map, Graph, safest_path, "cyan", "Safest Path", safest_distance, safest_severity)
+with Span('folium_render'):
+    path_plot(map, shortest_route, "blue", "Shortest Path", shortest_distance, shortest_severity)
+    path_plot(map, safest_route, "cyan", "Safest Path", safest_distance, safest_severity)
 
-# Save and print the results
-map.save("street_level_heatmap.html")
+    # Save and print the results
+    map.save("street_level_heatmap.html")
 print(f"Shortest Path: Distance = {round(shortest_distance, 2)}m | Mean Severity Score = {shortest_severity}")
 print(f"Safest Path: Distance = {round(safest_distance, 2)}m | Mean Severity Score = {safest_severity}")
\ No newline at end of file
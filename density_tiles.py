@@ -0,0 +1,146 @@
+import os # For interacting with the file system
+import zlib # For compressing the PNG tiles
+import struct # For the PNG chunk headers
+import argparse # For the command-line interface
+from concurrent.futures import ProcessPoolExecutor # For rendering tiles on all cores
+import numpy as np # For the pixel bins
+import matplotlib # For the colour map
+
+# Tile size in pixels (the standard for XYZ web map tiles)
+TILE_SIZE = 256
+
+# Zoom levels to render (coarser levels are built from the finest one)
+MIN_ZOOM, MAX_ZOOM = 10, 16
+
+# Weight of each Accident_Severity value (1 is fatal, 2 serious and 3 slight in the collision data)
+SEVERITY_WEIGHTS = {1: 3.0, 2: 2.0, 3: 1.0}
+
+# Define London's borough boundaries
+LONDON_BBOX = (51.3550556, 51.6517156, -0.453256, 0.15050513)
+
+# Function to convert coordinates into global pixel positions at a zoom level (Web Mercator)
+def pixel_positions(latitudes, longitudes, zoom):
+    scale = TILE_SIZE * 2 ** zoom
+    latitudes = np.radians(np.asarray(latitudes, dtype=float))
+    x = (np.asarray(longitudes, dtype=float) + 180) / 360 * scale
+    y = (1 - np.log(np.tan(latitudes) + 1 / np.cos(latitudes)) / np.pi) / 2 * scale
+    return x.astype(np.int64), y.astype(np.int64)
+
+# Function to sum weights per pixel, returning only the non-empty pixels (a sparse 2D histogram)
+def bin_pixels(x, y, weights):
+    keys = (y << 32) | x
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique & 0xFFFFFFFF, unique >> 32, np.bincount(inverse, weights=weights)
+
+# Function to build the next coarser zoom level by merging every 2x2 block of pixels
+def halve(x, y, weights):
+    return bin_pixels(x // 2, y // 2, weights)
+
+# Function to encode an RGBA image as a PNG file
+def png_bytes(image):
+    height, width, _ = image.shape
+    # Every scanline starts with filter type 0 (none)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width * 4)]).tobytes()
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 6)) + chunk(b'IEND', b'')
+
+# Function to render and write a batch of tiles (run in the worker processes)
+# Pixel values are scaled logarithmically against the zoom level's ceiling (a high percentile of its pixel weights,
+# with anything above it drawn at full colour) and looked up in the colour map
+def render_tiles(zoom, tiles, ceiling, colour_table, output_directory):
+    scale = np.log1p(ceiling)
+    for tile_x, tile_y, x, y, weights in tiles:
+        image = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+        level = np.clip(np.log1p(weights) / scale, 0, 1)
+        image[y, x] = colour_table[(level * 255).astype(np.int64)]
+        image[y, x, 3] = (120 + 135 * level).astype(np.uint8) # Faint for single collisions, opaque for hotspots
+        directory = os.path.join(output_directory, str(zoom), str(tile_x))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f'{tile_y}.png'), 'wb') as f:
+            f.write(png_bytes(image))
+    return len(tiles)
+
+# Function to split a zoom level's pixels into per-tile batches
+def tile_batches(x, y, weights, batch_count):
+    tile_x, tile_y = x // TILE_SIZE, y // TILE_SIZE
+    order = np.lexsort((tile_y, tile_x))
+    x, y, weights, tile_x, tile_y = x[order], y[order], weights[order], tile_x[order], tile_y[order]
+    starts = np.flatnonzero(np.r_[True, (tile_x[1:] != tile_x[:-1]) | (tile_y[1:] != tile_y[:-1])])
+    ends = np.r_[starts[1:], len(x)]
+    tiles = [(int(tile_x[s]), int(tile_y[s]), x[s:e] % TILE_SIZE, y[s:e] % TILE_SIZE, weights[s:e])
+             for s, e in zip(starts, ends)]
+    return [tiles[i::batch_count] for i in range(batch_count) if tiles[i::batch_count]]
+
+# Function to write a tile pyramid for collision points, weighted by severity
+def build_pyramid(latitudes, longitudes, severity, output_directory, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM,
+                  colour_map='YlOrRd', max_workers=None, percentile=99.5):
+    severity = np.asarray(severity)
+    if len(severity) == 0:
+        print("No collisions to render, so no tiles were written")
+        return 0
+    weights = np.ones(len(severity))
+    for value, weight in SEVERITY_WEIGHTS.items():
+        weights[severity == value] = weight
+    x, y, pixel_weights = bin_pixels(*pixel_positions(latitudes, longitudes, max_zoom), weights)
+    colour_table = (matplotlib.colormaps[colour_map](np.linspace(0, 1, 256)) * 255).astype(np.uint8)
+    workers = max_workers or os.cpu_count()
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for zoom in range(max_zoom, min_zoom - 1, -1):
+            if len(pixel_weights) == 0:
+                break
+            # A high percentile rather than the maximum, so one extreme junction doesn't wash out the rest
+            ceiling = max(np.percentile(pixel_weights, percentile), 1.0)
+            futures = [executor.submit(render_tiles, zoom, batch, ceiling, colour_table, output_directory)
+                       for batch in tile_batches(x, y, pixel_weights, workers * 4)]
+            tiles = sum(future.result() for future in futures)
+            written += tiles
+            print(f"Zoom {zoom}: {len(pixel_weights)} pixels in {tiles} tiles")
+            if zoom > min_zoom:
+                x, y, pixel_weights = halve(x, y, pixel_weights)
+    write_viewer(output_directory, min_zoom, max_zoom, latitudes, longitudes)
+    return written
+
+# Function to write a Leaflet page that shows the tiles over OpenStreetMap
+def write_viewer(output_directory, min_zoom, max_zoom, latitudes, longitudes):
+    centre = [float(np.mean(latitudes)), float(np.mean(longitudes))]
+    html = f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Collision density</title>
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css">
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>html, body, #map {{ height: 100%; margin: 0; }}</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+var map = L.map('map', {{minZoom: {min_zoom}}}).setView({centre}, {min_zoom + 2});
+L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
+    attribution: '&copy; OpenStreetMap contributors', maxZoom: 19}}).addTo(map);
+L.tileLayer('{{z}}/{{x}}/{{y}}.png', {{minZoom: {min_zoom}, maxNativeZoom: {max_zoom}, maxZoom: 19, opacity: 0.85}}).addTo(map);
+</script>
+</body>
+</html>
+"""
+    with open(os.path.join(output_directory, 'index.html'), 'w') as f:
+        f.write(html)
+
+if __name__ == "__main__":
+    from columnar_store import load_collisions # For reading only the London collisions
+
+    parser = argparse.ArgumentParser(description="Render collision density tiles for browsing London at every zoom level.")
+    parser.add_argument('--output', default='C:/Users/bencr/Downloads/combined_collision_v3/density_tiles')
+    parser.add_argument('--min-zoom', type=int, default=MIN_ZOOM)
+    parser.add_argument('--max-zoom', type=int, default=MAX_ZOOM)
+    parser.add_argument('--workers', type=int, help="Number of worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    df = load_collisions(['Latitude', 'Longitude', 'Accident_Severity'], bbox=LONDON_BBOX)
+    tiles = build_pyramid(df['Latitude'], df['Longitude'], df['Accident_Severity'], args.output,
+                          args.min_zoom, args.max_zoom, max_workers=args.workers)
+    print(f"{tiles} tiles written to {args.output}; serve them with "
+          f"'python -m http.server --directory {args.output}' and open http://localhost:8000")
@@ -0,0 +1,105 @@
+import numpy as np # For the grouped array operations
+import pandas as pd # For reading the collision data
+import shapely # For the spatial index over the street segments
+from local_projection import project, project_coordinates # For measuring distances in metres
+from graph_snapshot import load_snapshot, write_column, mark_annotated # For reading and writing the edge columns
+from instrumentation import traced # For timing the calls
+
+# Collisions farther than this many metres from every street are left unmatched
+MATCH_DISTANCE = 50
+
+# Function to turn a collision table into per-row accident counts and severity sums
+# (the refined dataset has one row per location with number_of_accidents and mean_severity_score,
+# the raw data one row per collision with Accident_Severity)
+def collision_weights(df):
+    if 'number_of_accidents' in df.columns:
+        counts = df['number_of_accidents'].to_numpy(dtype=float)
+        return counts, counts * df['mean_severity_score'].to_numpy(dtype=float)
+    return np.ones(len(df)), df['Accident_Severity'].to_numpy(dtype=float)
+
+# Function to compute count, severity sum and mean severity per group with bincount
+def aggregate(groups, counts, sums, group_count, default_severity=0):
+    total_counts = np.bincount(groups, weights=counts, minlength=group_count)
+    total_sums = np.bincount(groups, weights=sums, minlength=group_count)
+    mean = np.full(group_count, float(default_severity))
+    np.divide(total_sums, total_counts, out=mean, where=total_counts > 0)
+    return total_counts, total_sums, mean
+
+# Spatial index over a snapshot's street segments, with both directions of a street sharing one segment
+class EdgeIndex:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        tails, heads = snapshot.tails, np.asarray(snapshot.indices)
+        pairs = np.minimum(tails, heads).astype(np.int64) * snapshot.node_count + np.maximum(tails, heads)
+        unique_pairs, self.segment_of_edge = np.unique(pairs, return_inverse=True)
+        self.segment_count = len(unique_pairs)
+        x, y = project(snapshot.node_y, snapshot.node_x)
+        first, second = unique_pairs // snapshot.node_count, unique_pairs % snapshot.node_count
+        # The snapshot is unsimplified, so every edge is a straight segment between its two nodes
+        coordinates = np.stack([np.column_stack([x[first], y[first]]), np.column_stack([x[second], y[second]])], axis=1)
+        self.tree = shapely.STRtree(shapely.linestrings(coordinates))
+
+    # Function to find the nearest segment to every point (-1 if none is within max_distance metres)
+    def nearest_segments(self, latitudes, longitudes, max_distance=MATCH_DISTANCE):
+        x, y = project(latitudes, longitudes)
+        segments = np.full(len(x), -1, dtype=np.int64)
+        point_index, segment_index = self.tree.query_nearest(shapely.points(x, y), max_distance=max_distance)
+        point_index, first = np.unique(point_index, return_index=True)
+        segments[point_index] = segment_index[first]
+        return segments
+
+    # Function to aggregate collisions onto every edge in one pass
+    @traced('edge_severity', rows=lambda result: len(result[0]))
+    def edge_severity(self, df, default_severity=0, max_distance=MATCH_DISTANCE):
+        segments = self.nearest_segments(df['Latitude'].to_numpy(), df['Longitude'].to_numpy(), max_distance)
+        counts, sums = collision_weights(df)
+        matched = segments >= 0
+        total_counts, _, mean = aggregate(segments[matched], counts[matched], sums[matched], self.segment_count, default_severity)
+        return mean[self.segment_of_edge], total_counts[self.segment_of_edge]
+
+# Function to annotate a snapshot on disk with per-edge collision counts and mean severity
+# (source names the collision data in the snapshot's meta.json, so tiles split from it can tell when it changes)
+def annotate_snapshot(snapshot_directory, df, default_severity=0, max_distance=MATCH_DISTANCE, source=None):
+    snapshot = load_snapshot(snapshot_directory)
+    severity, accidents = EdgeIndex(snapshot).edge_severity(df, default_severity, max_distance)
+    write_column(snapshot_directory, 'mean_severity_score', severity)
+    write_column(snapshot_directory, 'number_of_accidents', accidents)
+    mark_annotated(snapshot_directory, source)
+    print(f"Annotated {int((accidents > 0).sum())} of {len(accidents)} edges with collision data")
+    return severity, accidents
+
+# Function to annotate an OSMnx graph in one shot (for the scripts that still route with networkx)
+@traced('annotate_graph')
+def annotate_graph(graph, df, default_severity=0, default_accidents=0, rounded=False, max_distance=MATCH_DISTANCE):
+    import networkx as nx # For writing the edge attributes
+    import osmnx as ox # For the edge geometries
+    edges = ox.graph_to_gdfs(graph, nodes=False)
+    u = edges.index.get_level_values('u').to_numpy()
+    v = edges.index.get_level_values('v').to_numpy()
+    # Both directions of a street share one segment and the collisions snapped to it
+    segment_pairs = pd.MultiIndex.from_arrays([np.minimum(u, v), np.maximum(u, v)])
+    segment_of_edge = segment_pairs.factorize()[0]
+    tree = shapely.STRtree(shapely.transform(np.asarray(edges.geometry.values), project_coordinates))
+
+    # Snap every collision to its nearest edge in one vectorised query
+    x, y = project(df['Latitude'].to_numpy(), df['Longitude'].to_numpy())
+    point_index, edge_index = tree.query_nearest(shapely.points(x, y), max_distance=max_distance)
+    point_index, first = np.unique(point_index, return_index=True)
+    counts, sums = collision_weights(df)
+    total_counts, _, mean = aggregate(segment_of_edge[edge_index[first]], counts[point_index], sums[point_index],
+                                      segment_of_edge.max() + 1, default_severity)
+    severity, accidents = mean[segment_of_edge], total_counts[segment_of_edge]
+    if rounded:
+        severity = np.round(severity)
+    accidents = np.where(accidents > 0, accidents, default_accidents)
+    nx.set_edge_attributes(graph, dict(zip(edges.index, severity.tolist())), 'mean_severity_score')
+    nx.set_edge_attributes(graph, dict(zip(edges.index, accidents.tolist())), 'number_of_accidents')
+    return graph
+
+if __name__ == "__main__":
+    # Example usage: annotate the London snapshot with the refined collision data
+    from compact_schema import read_compact_csv # For the compact column types
+    refined = read_compact_csv("C:/Users/bencr/Downloads/combined_collision_v3/refined_London_dataset.csv",
+                               usecols=['Latitude', 'Longitude', 'number_of_accidents', 'mean_severity_score'])
+    annotate_snapshot("C:/Users/bencr/Downloads/combined_collision_v3/london_drive_snapshot", refined,
+                      source='refined_London_dataset.csv')
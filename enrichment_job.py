@@ -0,0 +1,120 @@
+import os # For interacting with the file system
+import csv # For the journal lines
+import time # For the progress reports
+import threading # For the worker threads and the journal lock
+from collections import deque # For the per-worker work queues
+import pandas as pd # For reading the input file and building the output file
+
+# Rows handed to a worker at a time (and written to the journal together)
+BATCH_SIZE = 50
+
+# Resumable enrichment of a CSV file's coordinates with OSM IDs and types
+# Every completed batch of rows is appended to a journal and flushed to disk, so after a crash the job resumes
+# from the last journaled row. Workers take batches from their own queue and steal from the back of another
+# worker's queue when theirs runs dry. The output file is built once, from the input and the journal, at the end
+# fetch takes a list of (latitude, longitude) points and returns one (osm_id, osm_type) or None (failed) per point
+class EnrichmentJob:
+    def __init__(self, input_file, output_file, journal_file, fetch, workers=4, batch_size=BATCH_SIZE):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.journal_file = journal_file
+        self.fetch = fetch
+        self.workers = workers
+        self.batch_size = batch_size
+        self.journal_lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    # Function to read the journal, dropping a final line left half-written by a crash
+    def read_journal(self):
+        results = {}
+        if not os.path.exists(self.journal_file):
+            return results
+        with open(self.journal_file, 'rb') as f:
+            content = f.read()
+        complete = content[:content.rfind(b'\n') + 1]
+        if len(complete) < len(content):
+            # Cut the torn line off so the next append starts on a fresh line
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(len(complete))
+        for row, osm_id, osm_type in csv.reader(complete.decode().splitlines()):
+            results[int(row)] = (osm_id, osm_type)
+        return results
+
+    # Function to append completed rows to the journal and flush them to disk
+    def write_journal(self, journal, rows, results):
+        lines = []
+        for row, result in zip(rows, results):
+            if result is not None: # Failed rows stay out of the journal and are retried on the next run
+                osm_id, osm_type = result
+                lines.append((row, '' if osm_id is None else osm_id, '' if osm_type is None else osm_type))
+        with self.journal_lock:
+            csv.writer(journal, lineterminator='\n').writerows(lines)
+            journal.flush()
+            os.fsync(journal.fileno())
+            self.completed += len(lines)
+            self.failed += len(rows) - len(lines)
+
+    # Function to run one worker: its own queue first, then work stolen from the others
+    def work(self, worker, queues, points, journal):
+        own = queues[worker]
+        others = queues[worker + 1:] + queues[:worker]
+        while True:
+            try:
+                rows = own.popleft()
+            except IndexError:
+                rows = None
+                for other in others:
+                    try:
+                        rows = other.pop() # Steal from the far end, away from the owner
+                        break
+                    except IndexError:
+                        continue
+                if rows is None:
+                    return
+            try:
+                results = self.fetch([points[row] for row in rows])
+            except Exception as e:
+                print(f"Worker {worker}: batch starting at row {rows[0]} failed ({e})")
+                results = [None] * len(rows)
+            self.write_journal(journal, rows, results)
+
+    # Function to process every row not in the journal yet, then build the output file if nothing is left
+    def run(self):
+        data = pd.read_csv(self.input_file, usecols=['Latitude', 'Longitude'])
+        points = list(zip(data['Latitude'].tolist(), data['Longitude'].tolist()))
+        done = self.read_journal()
+        remaining = [row for row in range(len(points)) if row not in done]
+        print(f"{len(done)} of {len(points)} rows already journaled, {len(remaining)} to process")
+
+        # Deal contiguous batches out round-robin, so neighbouring rows (often the same street) stay together
+        batches = [remaining[i:i + self.batch_size] for i in range(0, len(remaining), self.batch_size)]
+        queues = [deque(batches[worker::self.workers]) for worker in range(self.workers)]
+        start = time.perf_counter()
+        with open(self.journal_file, 'a', newline='') as journal:
+            threads = [threading.Thread(target=self.work, args=(worker, queues, points, journal))
+                       for worker in range(self.workers)]
+            for thread in threads:
+                thread.start()
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=10)
+                elapsed = time.perf_counter() - start
+                print(f"Journaled {self.completed} rows ({self.completed / max(elapsed, 1e-9):.1f} rows/s), {self.failed} failed")
+        if self.failed:
+            print(f"{self.failed} rows failed and will be retried on the next run; the output file was not built")
+            return False
+        self.build()
+        return True
+
+    # Function to build the output file once: the input rows with their OSM_ID and OSM_Type columns
+    def build(self):
+        results = self.read_journal()
+        data = pd.read_csv(self.input_file)
+        rows = pd.RangeIndex(len(data))
+        data['OSM_ID'] = pd.to_numeric(pd.Series([results[row][0] for row in rows]), errors='coerce').astype('Int64')
+        data['OSM_Type'] = pd.Series([results[row][1] for row in rows]).replace('', None)
+        temporary = self.output_file + '.tmp'
+        data.to_csv(temporary, index=False)
+        os.replace(temporary, self.output_file)
+        print(f"Built {self.output_file} with {len(data)} rows")
@@ -0,0 +1,113 @@
+import os # For interacting with the file system
+import csv # For streaming rows through the merge
+import heapq # For the k-way merge
+import shutil # For removing the temporary runs
+import tempfile # For the directory holding the sorted runs
+import argparse # For the command-line interface
+import pandas as pd # For reading the files a chunk at a time
+from instrumentation import traced # For timing the calls
+
+# Rows read into memory at a time when sorting the runs
+CHUNK_ROWS = 500000
+
+# Most runs merged at once (more are merged in several passes, so open files stay bounded)
+FAN_IN = 64
+
+# Function to turn one key value into something that sorts like pandas does (numbers in order, missing values last)
+def key_value(value, text):
+    if text:
+        return (0, value) if value != '' else (1, '')
+    try:
+        return (0, float(value))
+    except ValueError:
+        return (1, 0.0)
+
+# Function to build the sort key of a row for some key columns
+# (runs are sorted and merged with this same function, so they always agree on the order)
+def row_key_function(columns, key, text_keys=()):
+    key_positions = [(columns.index(name), name in text_keys) for name in key]
+    return lambda row: tuple(key_value(row[position], text) for position, text in key_positions)
+
+# Function to write the sorted runs for some CSV files, reading at most chunk_rows rows at a time
+def write_runs(input_files, directory, key, text_keys=(), columns=None, chunk_rows=CHUNK_ROWS):
+    runs = []
+    for input_file in input_files:
+        for chunk in pd.read_csv(input_file, chunksize=chunk_rows, dtype=str, keep_default_na=False, encoding='utf-8-sig'):
+            if columns is None:
+                columns = list(chunk.columns)
+            elif set(chunk.columns) != set(columns):
+                raise ValueError(f"{input_file} has columns {list(chunk.columns)}, expected {columns}")
+            # Python's sort is stable, so rows with equal keys keep their input order
+            rows = sorted(chunk[columns].itertuples(index=False, name=None), key=row_key_function(columns, key, text_keys))
+            run = os.path.join(directory, f'run_{len(runs)}.csv')
+            with open(run, 'w', newline='') as outfile:
+                csv_writer = csv.writer(outfile)
+                csv_writer.writerow(columns)
+                csv_writer.writerows(rows)
+            runs.append(run)
+    return runs, columns
+
+# Function to stream rows from a CSV file, skipping its header
+def read_rows(path):
+    with open(path, 'r', newline='', encoding='utf-8-sig') as infile:
+        csv_reader = csv.reader(infile)
+        next(csv_reader)
+        yield from csv_reader
+
+# Function to merge sorted runs into one sorted file, dropping duplicate rows
+# Rows are duplicates when they agree on every unique column (every column if unique is None); only rows with the
+# same sort key can be duplicates, so just the current key's rows are remembered. Ties keep their input order
+def merge_runs(runs, output_file, columns, key, text_keys=(), unique=None):
+    sort_key = row_key_function(columns, key, text_keys)
+    unique_positions = [columns.index(name) for name in unique] if unique else None
+    written = duplicates = 0
+    current_key, seen = None, set()
+    with open(output_file, 'w', newline='') as outfile:
+        csv_writer = csv.writer(outfile)
+        csv_writer.writerow(columns)
+        for row in heapq.merge(*[read_rows(run) for run in runs], key=sort_key):
+            row_key = sort_key(row)
+            if row_key != current_key:
+                current_key, seen = row_key, set()
+            identity = tuple(row) if unique_positions is None else tuple(row[position] for position in unique_positions)
+            if identity in seen:
+                duplicates += 1
+                continue
+            seen.add(identity)
+            csv_writer.writerow(row)
+            written += 1
+    return written, duplicates
+
+# Function to sort and merge CSV files into one file on a key, with memory bounded by chunk_rows and fan_in
+@traced('external_sort', rows=lambda written: written)
+def external_sort(input_files, output_file, key, unique=None, text_keys=(), columns=None,
+                  chunk_rows=CHUNK_ROWS, fan_in=FAN_IN, temporary_directory=None):
+    directory = tempfile.mkdtemp(prefix='external_merge_', dir=temporary_directory)
+    try:
+        runs, columns = write_runs(input_files, directory, key, text_keys, columns, chunk_rows)
+        duplicates = 0
+        # Merge groups of fan_in runs until one pass can merge the rest
+        generation = 0
+        while len(runs) > fan_in:
+            merged = []
+            for group in range(0, len(runs), fan_in):
+                run = os.path.join(directory, f'merge_{generation}_{group}.csv')
+                duplicates += merge_runs(runs[group:group + fan_in], run, columns, key, text_keys, unique)[1]
+                merged.append(run)
+            runs, generation = merged, generation + 1
+        written, last_duplicates = merge_runs(runs, output_file, columns, key, text_keys, unique)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    print(f"Wrote {written} rows to {output_file} ({duplicates + last_duplicates} duplicates dropped)")
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sort and merge CSV chunk files with bounded memory.")
+    parser.add_argument('inputs', nargs='+', help="CSV files to merge")
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--key', nargs='+', default=['Latitude'], help="Columns to sort on, in order")
+    parser.add_argument('--unique', nargs='+', help="Columns identifying duplicate rows (default: the whole row)")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--fan-in', type=int, default=FAN_IN)
+    args = parser.parse_args()
+    external_sort(args.inputs, args.output, args.key, args.unique, chunk_rows=args.chunk_rows, fan_in=args.fan_in)
@@ -0,0 +1,146 @@
+import os # For interacting with the file system
+import json # For the snapshot metadata
+import time # For timing how long the snapshot takes to open
+import numpy as np # For the array columns and memory mapping
+from scipy.spatial import cKDTree # For snapping coordinates to the nearest node
+from local_projection import project # For measuring distances in metres
+from instrumentation import traced # For timing the calls
+
+# Array columns stored in every snapshot (one .npy file each)
+NODE_COLUMNS = ['node_ids', 'node_x', 'node_y']
+EDGE_COLUMNS = ['indices', 'edge_key', 'edge_osmid', 'edge_length', 'mean_severity_score', 'number_of_accidents']
+
+# Compact, memory-mapped copy of a drive network in CSR (compressed sparse row) form
+# Node i's outgoing edges are positions indptr[i]:indptr[i + 1] of every edge column, sorted by head node
+class GraphSnapshot:
+    def __init__(self, directory, mmap_mode='r'):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        # np.load with mmap_mode maps the files straight from disk, so worker processes share the same pages
+        for column in ['indptr'] + NODE_COLUMNS + EDGE_COLUMNS + self.meta.get('extra_columns', []):
+            setattr(self, column, np.load(os.path.join(directory, f'{column}.npy'), mmap_mode=mmap_mode))
+        self.node_count = len(self.node_ids)
+        self.edge_count = len(self.indices)
+        self._tails = None
+        self._tree = None
+        self._node_index = None
+
+    # Tail node of every edge (expanded from indptr on first use)
+    @property
+    def tails(self):
+        if self._tails is None:
+            self._tails = np.repeat(np.arange(self.node_count, dtype=np.int32), np.diff(self.indptr))
+        return self._tails
+
+    # Position of every OSM node ID in the node columns
+    def node_index(self, osm_node_ids):
+        if self._node_index is None:
+            self._node_index = np.argsort(self.node_ids)
+        positions = np.searchsorted(self.node_ids, osm_node_ids, sorter=self._node_index)
+        return self._node_index[np.minimum(positions, self.node_count - 1)]
+
+    # Function to snap coordinates to the nearest node (the array version of ox.distance.nearest_nodes)
+    @traced('nearest_nodes', rows=len)
+    def nearest_nodes(self, longitudes, latitudes):
+        if self._tree is None:
+            self._tree = cKDTree(np.column_stack(project(self.node_y, self.node_x)))
+        x, y = project(latitudes, longitudes)
+        _, nearest = self._tree.query(np.column_stack([x, y]))
+        return nearest
+
+# Function to write one array column, replacing any previous version atomically
+# (processes that already mapped the old file keep reading it until they reopen the snapshot)
+def write_column(directory, name, values):
+    temporary = os.path.join(directory, f'{name}.tmp.npy')
+    np.save(temporary, np.ascontiguousarray(values))
+    os.replace(temporary, os.path.join(directory, f'{name}.npy'))
+
+# Function to add derived array columns to a snapshot (and any extra meta.json entries), so every later
+# load_snapshot maps them alongside the built-in columns
+def add_columns(directory, columns, **meta_entries):
+    for name, values in columns.items():
+        write_column(directory, name, values)
+    with open(os.path.join(directory, 'meta.json')) as f:
+        extra_columns = json.load(f).get('extra_columns', [])
+    return update_meta(directory, extra_columns=list(dict.fromkeys(extra_columns + list(columns))), **meta_entries)
+
+# Function to set some meta.json entries of a snapshot, replacing the file atomically
+def update_meta(directory, **meta_entries):
+    meta_file = os.path.join(directory, 'meta.json')
+    with open(meta_file) as f:
+        meta = json.load(f)
+    meta.update(meta_entries)
+    temporary = meta_file + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(temporary, meta_file)
+    return directory
+
+# Function to record that a snapshot's mean_severity_score and number_of_accidents columns now hold collision data
+# (a new snapshot has zeros there), where the data came from, and a stamp that changes with every annotation
+def mark_annotated(directory, source):
+    return update_meta(directory, annotated={'source': source, 'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                                             'stamp': time.time_ns()})
+
+# Function to convert an OSMnx graph into a snapshot directory
+def build_snapshot(graph, directory, source=None):
+    os.makedirs(directory, exist_ok=True)
+    node_ids = np.fromiter(graph.nodes, dtype=np.int64, count=graph.number_of_nodes())
+    position = {node: i for i, node in enumerate(node_ids.tolist())}
+    node_x = np.array([graph.nodes[node]['x'] for node in node_ids.tolist()], dtype=np.float64)
+    node_y = np.array([graph.nodes[node]['y'] for node in node_ids.tolist()], dtype=np.float64)
+
+    # Read every edge once, using the same defaults as the routing scripts for missing attributes
+    edge_count = graph.number_of_edges()
+    tails = np.empty(edge_count, dtype=np.int32)
+    heads = np.empty(edge_count, dtype=np.int32)
+    keys = np.empty(edge_count, dtype=np.int32)
+    osmids = np.empty(edge_count, dtype=np.int64)
+    lengths = np.empty(edge_count, dtype=np.float64)
+    severity = np.empty(edge_count, dtype=np.float64)
+    accidents = np.empty(edge_count, dtype=np.float64)
+    for e, (u, v, key, data) in enumerate(graph.edges(keys=True, data=True)):
+        osmid = data.get('osmid', -1)
+        tails[e], heads[e], keys[e] = position[u], position[v], key
+        osmids[e] = int(osmid[0]) if isinstance(osmid, list) else int(osmid)
+        lengths[e] = data.get('length', 0)
+        severity[e] = data.get('mean_severity_score', 0)
+        accidents[e] = data.get('number_of_accidents', 0)
+
+    # Sort the edges by tail then head node so each node's edges (and parallel edges) are contiguous
+    order = np.lexsort((keys, heads, tails))
+    indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tails, minlength=len(node_ids)), out=indptr[1:])
+    columns = {
+        'indptr': indptr, 'node_ids': node_ids, 'node_x': node_x, 'node_y': node_y,
+        'indices': heads[order], 'edge_key': keys[order], 'edge_osmid': osmids[order],
+        'edge_length': lengths[order], 'mean_severity_score': severity[order],
+        'number_of_accidents': accidents[order],
+    }
+    for name, values in columns.items():
+        write_column(directory, name, values)
+    meta = {'nodes': len(node_ids), 'edges': edge_count, 'source': source, 'built': time.strftime('%Y-%m-%d %H:%M:%S')}
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return directory
+
+# Function to download the London drive network once and save it as a snapshot
+def save_london_snapshot(directory, place='London, England'):
+    import osmnx as ox # Only needed when building the snapshot
+    street = ox.graph_from_place(place, network_type='drive', retain_all=True, simplify=False)
+    return build_snapshot(street, directory, source=place)
+
+# Function to open a snapshot without copying any of its arrays into memory
+def load_snapshot(directory):
+    return GraphSnapshot(directory)
+
+if __name__ == "__main__":
+    # Example usage: build the snapshot once, then every script opens it in milliseconds
+    snapshot_directory = 'C:/Users/bencr/Downloads/combined_collision_v3/london_drive_snapshot'
+    if not os.path.exists(os.path.join(snapshot_directory, 'meta.json')):
+        print("Downloading London street network...")
+        save_london_snapshot(snapshot_directory)
+    start = time.perf_counter()
+    snapshot = load_snapshot(snapshot_directory)
+    print(f"Opened {snapshot.node_count} nodes and {snapshot.edge_count} edges in {(time.perf_counter() - start) * 1000:.1f} ms")
@@ -0,0 +1,487 @@
+import os # For interacting with the file system
+import json # For the tile metadata
+import time # For timing the queries
+import argparse # For the command-line interface
+import threading # For guarding the shared tile cache
+from collections import OrderedDict, namedtuple # For the least-recently-used tile cache and the routes
+import numpy as np # For the tile arrays
+from scipy.sparse import csr_matrix # For handing the loaded tiles to the compiled Dijkstra
+from scipy.sparse.csgraph import dijkstra # Compiled Dijkstra over CSR graphs
+from local_projection import project, METRES_PER_DEGREE_LATITUDE, METRES_PER_DEGREE_LONGITUDE # For distances in metres
+from graph_snapshot import write_column # For writing the tile columns
+from array_routing import SEVERITY_OFFSET # For the same safest-route weight as the routing core
+from instrumentation import traced # For timing the calls
+
+# Side of a tile in degrees (about 2.2 km north to south and 1.4 km east to west in London)
+TILE_DEGREES = 0.02
+
+# Most memory the tile cache holds before it drops the least recently used tiles
+CACHE_BYTES = 256 * 1024 * 1024
+
+# Array columns stored in every tile (one .npy file each)
+# Node i's outgoing edges are positions indptr[i]:indptr[i + 1] of every edge column, and each edge's head is
+# node head_node of tile head_tile, which is another tile for the border edges listed in border_edges
+TILE_COLUMNS = ['node_ids', 'node_x', 'node_y', 'indptr', 'head_tile', 'head_node', 'edge_osmid', 'edge_length',
+                'mean_severity_score', 'number_of_accidents', 'border_edges']
+
+# The straight-line bound is scaled down by this much to allow for the projection's error
+HEURISTIC_SLACK = 0.99
+
+# A route across the tiles, with the number of tiles its search loaded
+TiledRoute = namedtuple('TiledRoute', ['node_ids', 'latitudes', 'longitudes', 'distance', 'mean_severity', 'tiles'])
+
+# Function to find the severity the safest route uses: edges without collisions can take a default severity and
+# the means can be rounded, as annotate_graph's default_severity and rounded do for the scripts that routed that way
+def effective_severity(severity, accidents, default_severity=None, rounded=False):
+    if default_severity is not None:
+        severity = np.where(np.asarray(accidents) > 0, severity, default_severity)
+    return np.round(severity) if rounded else np.asarray(severity)
+
+# Function to turn the per-metre bounds saved with the tiles into the least safety cost per metre of a severity setting
+# Every edge of a group costs at least its severity per metre plus severity_offset over the group's longest edge
+def safety_cost_per_metre(bounds, severity_offset, default_severity=None, rounded=False):
+    if severity_offset < 0:
+        return 0.0
+    costs = []
+    for group in ['collision', 'clear']:
+        bound = bounds[group]
+        if bound['max_length'] is None:
+            continue
+        if group == 'clear' and default_severity is not None:
+            severity = float(np.round(default_severity)) if rounded else default_severity
+            costs.append((severity + severity_offset) / bound['max_length'])
+        else:
+            costs.append(bound['rounded_per_metre' if rounded else 'severity_per_metre'] + severity_offset / bound['max_length'])
+    return max(min(costs), 0.0) if costs else 0.0
+
+# Function to split a GraphSnapshot into square tiles of the drive network, each in its own directory
+def build_tiles(snapshot, directory, tile_degrees=TILE_DEGREES, severity_offset=SEVERITY_OFFSET):
+    os.makedirs(directory, exist_ok=True)
+    origin = [float(snapshot.node_y.min()), float(snapshot.node_x.min())]
+    rows = ((snapshot.node_y - origin[0]) // tile_degrees).astype(np.int64)
+    columns = ((snapshot.node_x - origin[1]) // tile_degrees).astype(np.int64)
+    column_count = int(columns.max()) + 1
+    node_tile = rows * column_count + columns
+
+    # Number every node within its tile, keeping the snapshot's order
+    order = np.argsort(node_tile, kind='stable')
+    tile_numbers, tile_start = np.unique(node_tile[order], return_index=True)
+    tile_end = np.append(tile_start[1:], snapshot.node_count)
+    local = np.empty(snapshot.node_count, dtype=np.int64)
+    local[order] = np.arange(snapshot.node_count) - np.repeat(tile_start, tile_end - tile_start)
+
+    # The snapshot's edges are sorted by tail node, and a stable sort by tile keeps them that way within each tile
+    tails, heads = snapshot.tails, np.asarray(snapshot.indices)
+    edge_tile = node_tile[tails]
+    edge_order = np.argsort(edge_tile, kind='stable')
+    edge_bounds = np.searchsorted(edge_tile[edge_order], np.append(tile_numbers, np.iinfo(np.int64).max))
+    tiles = {}
+    for position, number in enumerate(tile_numbers.tolist()):
+        nodes = order[tile_start[position]:tile_end[position]]
+        edges = edge_order[edge_bounds[position]:edge_bounds[position + 1]]
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(local[tails[edges]], minlength=len(nodes)), out=indptr[1:])
+        head_tile = node_tile[heads[edges]]
+        values = {
+            'node_ids': snapshot.node_ids[nodes], 'node_x': snapshot.node_x[nodes], 'node_y': snapshot.node_y[nodes],
+            'indptr': indptr, 'head_tile': head_tile.astype(np.int32), 'head_node': local[heads[edges]].astype(np.int32),
+            'edge_osmid': snapshot.edge_osmid[edges], 'edge_length': snapshot.edge_length[edges],
+            'mean_severity_score': snapshot.mean_severity_score[edges], 'number_of_accidents': snapshot.number_of_accidents[edges],
+            'border_edges': np.flatnonzero(head_tile != number).astype(np.int32),
+        }
+        tile_directory = os.path.join(directory, str(number))
+        os.makedirs(tile_directory, exist_ok=True)
+        for name, column in values.items():
+            write_column(tile_directory, name, column)
+        tiles[str(number)] = {'nodes': len(nodes), 'edges': len(edges), 'border_edges': len(values['border_edges']),
+                              'bytes': sum(np.asarray(column).nbytes for column in values.values())}
+
+    # Least cost per metre of every weight, which turns the straight-line distance into a lower bound on a route's cost
+    length = np.asarray(snapshot.edge_length)
+    has_length = length > 0
+    severity = np.asarray(snapshot.mean_severity_score)
+    safety = (severity + severity_offset)[has_length] / length[has_length]
+    # and the same bound's parts for edges with and without collisions, so a graph opened with another severity
+    # setting (see TiledGraph) can work out its own
+    weight_bounds = {}
+    for group, members in [('collision', np.asarray(snapshot.number_of_accidents) > 0),
+                           ('clear', np.asarray(snapshot.number_of_accidents) <= 0)]:
+        members = members & has_length
+        found = bool(members.any())
+        weight_bounds[group] = {
+            'severity_per_metre': float((severity[members] / length[members]).min()) if found else None,
+            'rounded_per_metre': float((np.round(severity[members]) / length[members]).min()) if found else None,
+            'max_length': float(length[members].max()) if found else None,
+        }
+    meta = {'origin': origin, 'tile_degrees': tile_degrees, 'columns': column_count, 'severity_offset': severity_offset,
+            'cost_per_metre': {'length': 1.0, 'safety': float(safety.min()) if len(safety) else 0.0},
+            'weight_bounds': weight_bounds,
+            'nodes': snapshot.node_count, 'edges': snapshot.edge_count, 'source': snapshot.meta.get('source'),
+            'annotated': snapshot.meta.get('annotated'),
+            'built': time.strftime('%Y-%m-%d %H:%M:%S'), 'tiles': tiles}
+    temporary = os.path.join(directory, 'meta.tmp.json')
+    with open(temporary, 'w') as f:
+        json.dump(meta, f)
+    os.replace(temporary, os.path.join(directory, 'meta.json'))
+    print(f"Split {snapshot.node_count} nodes and {snapshot.edge_count} edges into {len(tiles)} tiles")
+    return directory
+
+# One tile read fully into memory, so the cache's byte count is what the tile really holds
+class Tile:
+    def __init__(self, directory, number, severity_offset=SEVERITY_OFFSET, default_severity=None, rounded=False):
+        self.number = number
+        for column in TILE_COLUMNS:
+            setattr(self, column, np.load(os.path.join(directory, str(number), f'{column}.npy')))
+        self.node_count = len(self.node_ids)
+        self.x, self.y = project(self.node_y, self.node_x)
+        self.severity = effective_severity(self.mean_severity_score, self.number_of_accidents, default_severity, rounded)
+
+        # Parallel edges (same tail and head) sit next to each other, so group them into slots and keep the
+        # cheapest edge of every slot for each weight (networkx does the same on a MultiDiGraph)
+        tails = np.repeat(np.arange(self.node_count, dtype=np.int32), np.diff(self.indptr))
+        new_slot = np.ones(len(tails), dtype=bool)
+        new_slot[1:] = (tails[1:] != tails[:-1]) | (self.head_tile[1:] != self.head_tile[:-1]) | \
+            (self.head_node[1:] != self.head_node[:-1])
+        slot_start = np.flatnonzero(new_slot)
+        slot_of_edge = np.cumsum(new_slot) - 1
+        self.slot_tails = tails[slot_start]
+        self.slot_head_tile = self.head_tile[slot_start]
+        self.slot_head_node = self.head_node[slot_start]
+        self.border_slots = np.unique(slot_of_edge[self.border_edges])
+        self.slot_weight, self.slot_edge = {}, {}
+        for weight, values in [('length', self.edge_length), ('safety', self.severity + severity_offset)]:
+            cheapest = np.lexsort((values, slot_of_edge))[slot_start]
+            self.slot_edge[weight] = cheapest.astype(np.int32)
+            self.slot_weight[weight] = values[cheapest]
+        self.nbytes = sum(getattr(self, name).nbytes for name in TILE_COLUMNS + ['x', 'y', 'severity', 'slot_tails', 'slot_head_tile', 'slot_head_node', 'border_slots']) + \
+            sum(values.nbytes for values in list(self.slot_weight.values()) + list(self.slot_edge.values()))
+
+# Thread-safe least-recently-used cache of tiles, capped by their memory rather than their number
+# Tiles a search is using are pinned: they count towards the cap but are only evicted once every search releases them
+class TileCache:
+    def __init__(self, directory, max_bytes=CACHE_BYTES, severity_offset=SEVERITY_OFFSET, default_severity=None, rounded=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.severity_offset = severity_offset
+        self.default_severity = default_severity
+        self.rounded = rounded
+        self.tiles = OrderedDict()
+        self.pins = {}
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Function to return a tile, reading it from disk if it isn't cached (pinned until released, if pin is set)
+    def get(self, number, pin=False):
+        with self.lock:
+            if pin:
+                self.pins[number] = self.pins.get(number, 0) + 1
+            tile = self.tiles.get(number)
+            if tile is not None:
+                self.tiles.move_to_end(number)
+                self.hits += 1
+                return tile
+            self.misses += 1
+            tile = self.tiles[number] = Tile(self.directory, number, self.severity_offset, self.default_severity, self.rounded)
+            self.bytes += tile.nbytes
+            self.evict()
+            return tile
+
+    # Function to unpin tiles a search has finished with, evicting any the cap no longer has room for
+    def release(self, numbers):
+        with self.lock:
+            for number in numbers:
+                self.pins[number] -= 1
+                if not self.pins[number]:
+                    del self.pins[number]
+            self.evict()
+
+    # Function to drop the least recently used unpinned tiles until the cache fits under its cap
+    # (the newest tile always stays, even if it is bigger than the cap on its own)
+    def evict(self):
+        if self.bytes <= self.max_bytes:
+            return
+        newest = next(reversed(self.tiles))
+        for number in [number for number in self.tiles if number not in self.pins and number != newest]:
+            self.bytes -= self.tiles.pop(number).nbytes
+            self.evictions += 1
+            if self.bytes <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self.lock:
+            return {'tiles': len(self.tiles), 'pinned': len(self.pins), 'megabytes': round(self.bytes / 1e6, 1), 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+# The loaded tiles of one search joined into a single CSR graph of their slots
+# Every tile's slots are already in tail order, so joining them is a concatenation rather than a sort
+class TileRegion:
+    def __init__(self, tiles, weight):
+        self.tiles = tiles
+        self.weight = weight
+        self.numbers = np.array([tile.number for tile in tiles], dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum([tile.node_count for tile in tiles])])
+        self.node_count = int(self.offsets[-1])
+        self.x = np.concatenate([tile.x for tile in tiles])
+        self.y = np.concatenate([tile.y for tile in tiles])
+
+        # Keep the slots whose head is in a loaded tile, and the others as exits to the tiles not loaded yet
+        tails, heads, weights, exit_tails, exit_tiles = [], [], [], [], []
+        for index, tile in enumerate(tiles):
+            # Only the border slots can lead to a tile that isn't loaded
+            head_index = np.full(len(tile.slot_tails), index)
+            head_index[tile.border_slots] = np.searchsorted(self.numbers, tile.slot_head_tile[tile.border_slots])
+            inside = self.numbers[np.minimum(head_index, len(tiles) - 1)] == tile.slot_head_tile
+            tails.append(self.offsets[index] + tile.slot_tails[inside])
+            heads.append(self.offsets[head_index[inside]] + tile.slot_head_node[inside])
+            weights.append(tile.slot_weight[weight][inside])
+            exit_tails.append(self.offsets[index] + tile.slot_tails[~inside])
+            exit_tiles.append(tile.slot_head_tile[~inside].astype(np.int64))
+        tails = np.concatenate(tails)
+        self.exit_tails, self.exit_tiles = np.concatenate(exit_tails), np.concatenate(exit_tiles)
+        indptr = np.zeros(self.node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tails, minlength=self.node_count), out=indptr[1:])
+        self.matrix = csr_matrix((np.concatenate(weights), np.concatenate(heads), indptr), shape=(self.node_count, self.node_count))
+
+    # Function to find a node's global position in the region
+    def position(self, number, node):
+        return int(self.offsets[np.searchsorted(self.numbers, number)] + node)
+
+    # Function to find the tile (index into tiles) and the node within it of global positions
+    def locate(self, positions):
+        index = np.searchsorted(self.offsets, positions, side='right') - 1
+        return index, positions - self.offsets[index]
+
+    # Function to find the edge (tile index and position) used between each pair of consecutive nodes
+    def path_edges(self, nodes):
+        edges = []
+        for u, v in zip(nodes[:-1], nodes[1:]):
+            index, tail = self.locate(u)
+            head_index, head = self.locate(v)
+            tile = self.tiles[index]
+            slot = np.flatnonzero((tile.slot_tails == tail) & (tile.slot_head_tile == self.numbers[head_index]) &
+                                  (tile.slot_head_node == head))[0]
+            edges.append((index, int(tile.slot_edge[self.weight][slot])))
+        return edges
+
+# Routing over the tiles of a split London network, reading only the tiles a search reaches
+# The safest route's severity is the tiles' mean_severity_score plus the offset they were built with, unless the
+# graph is opened with another severity_offset, a default_severity for edges without collisions, or rounded means
+class TiledGraph:
+    def __init__(self, directory, max_bytes=CACHE_BYTES, severity_offset=None, default_severity=None, rounded=False):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        built_offset = self.meta['severity_offset']
+        severity_offset = built_offset if severity_offset is None else severity_offset
+        self.cache = TileCache(directory, max_bytes, severity_offset, default_severity, rounded)
+        self.cost_per_metre = dict(self.meta['cost_per_metre'])
+        if (severity_offset, default_severity, rounded) != (built_offset, None, False):
+            # Tiles built without the per-group bounds get no straight-line bound: routes stay exact but read more tiles
+            self.cost_per_metre['safety'] = safety_cost_per_metre(self.meta['weight_bounds'], severity_offset, default_severity,
+                                                                  rounded) if 'weight_bounds' in self.meta else 0.0
+        self.tile_degrees = self.meta['tile_degrees']
+        self.column_count = self.meta['columns']
+        self.existing = set(int(number) for number in self.meta['tiles'])
+        self.row_count = max(self.existing) // self.column_count + 1
+        # Every tile is at least this many metres across in the projection
+        self.tile_metres = self.tile_degrees * min(METRES_PER_DEGREE_LATITUDE, METRES_PER_DEGREE_LONGITUDE)
+
+    # Function to find the row and column of the tile holding a coordinate
+    def tile_cell(self, latitude, longitude):
+        row = int((latitude - self.meta['origin'][0]) // self.tile_degrees)
+        column = int((longitude - self.meta['origin'][1]) // self.tile_degrees)
+        return row, column
+
+    # Function to find the distance in metres from a point to the nearest edge of some tiles (0 inside them)
+    def tile_distances(self, numbers, x, y):
+        rows, columns = np.divmod(np.asarray(numbers), self.column_count)
+        south = self.meta['origin'][0] + rows * self.tile_degrees
+        west = self.meta['origin'][1] + columns * self.tile_degrees
+        west_x, south_y = project(south, west)
+        east_x, north_y = project(south + self.tile_degrees, west + self.tile_degrees)
+        return np.hypot(np.maximum(np.maximum(west_x - x, x - east_x), 0), np.maximum(np.maximum(south_y - y, y - north_y), 0))
+
+    # Function to list the existing tiles in a ring of cells around a row and column (radius 0 is the cell itself)
+    def ring(self, row, column, radius):
+        cells = [(row + dr, column + dc) for dr in range(-radius, radius + 1) for dc in range(-radius, radius + 1)
+                 if max(abs(dr), abs(dc)) == radius]
+        return [r * self.column_count + c for r, c in cells
+                if 0 <= c < self.column_count and r * self.column_count + c in self.existing]
+
+    # Function to snap a coordinate to its nearest node, returning the tile and the node within it
+    # Rings of tiles are searched outwards until the next ring is farther away than the nearest node found
+    def nearest_node(self, latitude, longitude):
+        x, y = project(latitude, longitude)
+        row, column = self.tile_cell(latitude, longitude)
+        best = (np.inf, None, None)
+        # Enough rings to cover every tile from wherever the coordinate is
+        limit = max(abs(row), abs(row - self.row_count), abs(column), abs(column - self.column_count)) + 1
+        for radius in range(limit):
+            for number in self.ring(row, column, radius):
+                tile = self.cache.get(number)
+                distances = np.hypot(tile.x - x, tile.y - y)
+                nearest = int(np.argmin(distances))
+                if distances[nearest] < best[0]:
+                    best = (float(distances[nearest]), number, nearest)
+            if best[1] is not None and best[0] <= radius * self.tile_metres:
+                break
+        if best[1] is None:
+            raise ValueError("The tiles hold no nodes.")
+        return best[1], best[2]
+
+    # Function to list the tiles along the straight line between two coordinates and their neighbours
+    def corridor(self, start, end):
+        steps = int(np.hypot(end[0] - start[0], end[1] - start[1]) / (self.tile_degrees / 2)) + 2
+        tiles = set()
+        for fraction in np.linspace(0, 1, steps):
+            row, column = self.tile_cell(start[0] + fraction * (end[0] - start[0]), start[1] + fraction * (end[1] - start[1]))
+            for radius in range(2):
+                tiles.update(self.ring(row, column, radius))
+        return tiles
+
+    # Function to compute the route minimising length or safety (severity + offset) between two coordinates
+    # The search starts from the tiles along the straight line and adds the tiles behind any border edge a cheaper
+    # route could leave through (its cost so far plus the straight-line bound to the finish is below the best route),
+    # so the route is exact over the whole network while only the tiles the search reaches are read
+    # The search needs all of its tiles at once, so it pins them in the cache and fails if they would take more than
+    # the cache's max_bytes (open the tiles with a larger cache for routes that cross more of the network)
+    @traced('tiled_route')
+    def route(self, start, end, weight='length'):
+        if weight not in self.cost_per_metre:
+            raise ValueError(f"Unknown weight '{weight}', expected one of {sorted(self.cost_per_metre)}")
+        source_tile, source_node = self.nearest_node(*start)
+        target_tile, target_node = self.nearest_node(*end)
+        wanted = self.corridor(start, end) | {source_tile, target_tile}
+        held = {}
+        try:
+            return self.search(held, wanted, source_tile, source_node, target_tile, target_node, weight)
+        finally:
+            self.cache.release(held)
+
+    # Function to run the route's searches, pinning every tile it reads in held
+    def search(self, held, wanted, source_tile, source_node, target_tile, target_node, weight):
+        cost_per_metre = self.cost_per_metre[weight] * HEURISTIC_SLACK
+        held_bytes = 0
+        best = np.inf
+        while True:
+            for number in wanted - held.keys():
+                held[number] = self.cache.get(number, pin=True)
+                held_bytes += held[number].nbytes
+                if held_bytes > self.cache.max_bytes:
+                    raise ValueError(f"The route needs more than the tile cache's {self.cache.max_bytes / 1e6:.0f} MB of tiles; "
+                                     f"open the tiles with a larger max_bytes")
+            region = TileRegion([held[number] for number in sorted(held)], weight)
+            source, target = region.position(source_tile, source_node), region.position(target_tile, target_node)
+            # Adding tiles can only make the best route cheaper, so the last best cost bounds this search
+            distances, predecessors = dijkstra(region.matrix, indices=source, return_predecessors=True, limit=best * (1 + 1e-9))
+            best = distances[target]
+            bound = distances[region.exit_tails] + cost_per_metre * np.hypot(region.x[region.exit_tails] - region.x[target],
+                                                                             region.y[region.exit_tails] - region.y[target])
+            open_exits = bound < best
+            wanted = set(region.exit_tiles[open_exits].tolist()) - held.keys()
+            if not wanted:
+                break
+            # Read the next ring as well where a route leaving the loaded tiles could still beat the best one through
+            # it, which saves a search per ring on long routes
+            leaving = distances[region.exit_tails[open_exits]].min()
+            ahead = set()
+            for number in wanted:
+                ahead.update(self.ring(*divmod(number, self.column_count), 1))
+            ahead = np.array(sorted(ahead - wanted - held.keys()), dtype=np.int64)
+            if len(ahead):
+                closest = self.tile_distances(ahead, region.x[target], region.y[target])
+                wanted.update(ahead[leaving + cost_per_metre * closest < best].tolist())
+        if not np.isfinite(best):
+            raise ValueError("No path exists between the selected start and end points.")
+        return self.route_from_tree(region, predecessors, source, target)
+
+    # Function to read a route back out of a search tree, with its length and mean severity
+    def route_from_tree(self, region, predecessors, source, target):
+        nodes = [int(target)]
+        while nodes[-1] != source:
+            nodes.append(int(predecessors[nodes[-1]]))
+        nodes = np.array(nodes[::-1], dtype=np.int64)
+        tile_index, local = region.locate(nodes)
+        edges = region.path_edges(nodes)
+        lengths = np.array([region.tiles[t].edge_length[e] for t, e in edges])
+        severity = np.array([region.tiles[t].severity[e] for t, e in edges])
+        node_ids = [int(region.tiles[t].node_ids[n]) for t, n in zip(tile_index, local)]
+        latitudes = [float(region.tiles[t].node_y[n]) for t, n in zip(tile_index, local)]
+        longitudes = [float(region.tiles[t].node_x[n]) for t, n in zip(tile_index, local)]
+        mean_severity = round(float(severity.sum()) / len(severity)) if len(severity) else 0
+        return TiledRoute(node_ids, latitudes, longitudes, float(lengths.sum()), mean_severity, len(region.tiles))
+
+# Function to open a tiled network, splitting the London snapshot into tiles the first time and again whenever the
+# snapshot's collision data changes
+# A snapshot without collision data is first annotated from collisions_file (a CSV file with Latitude and Longitude,
+# and number_of_accidents and mean_severity_score or Accident_Severity), as the safest routes would otherwise
+# only count edges; without collisions_file it is refused
+# severity_offset, default_severity and rounded set the safest route's severity (see TiledGraph)
+def open_tiles(directory, snapshot_directory=None, max_bytes=CACHE_BYTES, severity_offset=None, default_severity=None,
+               rounded=False, collisions_file=None):
+    meta_file = os.path.join(directory, 'meta.json')
+    if snapshot_directory is not None:
+        from graph_snapshot import load_snapshot # For the network to split
+        snapshot = load_snapshot(snapshot_directory)
+        if snapshot.meta.get('annotated') is None:
+            if collisions_file is None:
+                raise ValueError(f"The snapshot {snapshot_directory} has no collision data; annotate it with "
+                                 f"edge_severity_annotation.py or pass collisions_file")
+            from edge_severity_annotation import annotate_snapshot # For adding the collision data to the snapshot
+            from compact_schema import read_compact_csv # For the compact column types
+            import pandas as pd # For reading the CSV file's header
+            print("Annotating the road network with the collision data (only needed once)...")
+            header = pd.read_csv(collisions_file, nrows=0).columns
+            columns = ['number_of_accidents', 'mean_severity_score'] if 'number_of_accidents' in header else ['Accident_Severity']
+            annotate_snapshot(snapshot_directory, read_compact_csv(collisions_file, usecols=['Latitude', 'Longitude'] + columns),
+                              source=os.path.basename(collisions_file))
+            snapshot = load_snapshot(snapshot_directory)
+        built_from = None
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                built_from = json.load(f).get('annotated')
+        if built_from is None or built_from != snapshot.meta['annotated']:
+            print("Splitting the road network into tiles...")
+            build_tiles(snapshot, directory)
+    elif not os.path.exists(meta_file):
+        raise ValueError(f"No tiles in {directory}; pass snapshot_directory to split them from a snapshot")
+    return TiledGraph(directory, max_bytes, severity_offset, default_severity, rounded)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Route across London over lazily loaded tiles of the road network.")
+    parser.add_argument('--tiles', default='C:/Users/bencr/Downloads/combined_collision_v3/london_drive_tiles',
+                        help="Tile directory (built from the snapshot on first use)")
+    parser.add_argument('--snapshot', default='C:/Users/bencr/Downloads/combined_collision_v3/london_drive_snapshot',
+                        help="Road network snapshot directory (see graph_snapshot.py)")
+    parser.add_argument('--collisions', default='C:/Users/bencr/Downloads/combined_collision_v3/refined_London_dataset.csv',
+                        help="Collision data to annotate the snapshot with if it has none yet")
+    parser.add_argument('--build-only', action='store_true', help="Only split the snapshot into tiles (if needed)")
+    parser.add_argument('--start', help="Start as latitude,longitude (default a random node)")
+    parser.add_argument('--end', help="End as latitude,longitude (default a random node)")
+    parser.add_argument('--cache-mb', type=float, default=CACHE_BYTES / 1024 / 1024, help="Tile cache size in megabytes")
+    args = parser.parse_args()
+
+    graph = open_tiles(args.tiles, args.snapshot, int(args.cache_mb * 1024 * 1024), collisions_file=args.collisions)
+    if args.build_only:
+        print(f"{len(graph.existing)} tiles in {args.tiles}")
+    else:
+        rng = np.random.default_rng()
+        points = []
+        for text in [args.start, args.end]:
+            if text:
+                points.append(tuple(float(value) for value in text.split(',')))
+            else:
+                tile = graph.cache.get(int(rng.choice(sorted(graph.existing))))
+                node = int(rng.integers(tile.node_count))
+                points.append((float(tile.node_y[node]), float(tile.node_x[node])))
+
+        # Example usage: the shortest and safest routes between the two points
+        for weight in ['length', 'safety']:
+            started = time.perf_counter()
+            route = graph.route(points[0], points[1], weight)
+            print(f"{weight}: Distance = {round(route.distance, 2)}m | Mean Severity Score = {route.mean_severity} | "
+                  f"{route.tiles} tiles searched in {(time.perf_counter() - started) * 1000:.0f} ms")
+        print(f"Tile cache: {graph.cache.stats()}")
@@ -0,0 +1,253 @@
+import os # For interacting with the file system
+import json # For the store metadata and the route service notifications
+import shutil # For removing superseded aggregate generations
+import argparse # For the command-line interface
+import urllib.request # For sending deltas to a running route service
+from collections import namedtuple # For returning deltas with named fields
+import numpy as np # For the running aggregate arrays
+import pandas as pd # For reading the collision batches and matching locations
+from graph_snapshot import load_snapshot, write_column, mark_annotated # For the road network and its edge columns
+from edge_severity_annotation import EdgeIndex, MATCH_DISTANCE # For snapping collisions to street segments
+from compact_schema import SEVERITY_CATEGORIES, read_compact_csv # Accident_Severity values counted separately at every level
+
+# Aggregate levels kept by the store
+LEVELS = ['location', 'node', 'edge']
+
+# New per-edge values for the edges a batch touched (positions in the snapshot's edge columns)
+Delta = namedtuple('Delta', ['edges', 'severity', 'accidents'])
+
+# Running collision aggregates by location, nearest node and street segment, updated one batch at a time
+# Every level keeps a count, a severity sum and a count per severity category, so the mean severity
+# of anything touched by a new batch can be recomputed without going back to the earlier years
+# A new store has to be seeded with the full collision history (SeverityStore.build or seed) before it
+# accepts batches, otherwise the first delta would set every edge it touches to that one batch's mean
+# Every save writes the aggregates into a new generation directory and only then points meta.json at it,
+# so a crash part-way through a save leaves the previous arrays and batch list together
+class SeverityStore:
+    def __init__(self, directory, snapshot_directory, max_distance=MATCH_DISTANCE):
+        self.directory = directory
+        self.snapshot_directory = snapshot_directory
+        self.snapshot = load_snapshot(snapshot_directory)
+        self.edge_index = EdgeIndex(self.snapshot)
+        meta_file = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                self.meta = json.load(f)
+            if self.meta['edge_count'] != self.snapshot.edge_count:
+                raise ValueError("The severity store was built for a different road network snapshot.")
+            data_directory = self.generation_directory(self.meta.get('generation'))
+            self.latitude = np.load(os.path.join(data_directory, 'location_latitude.npy'))
+            self.longitude = np.load(os.path.join(data_directory, 'location_longitude.npy'))
+            self.count, self.total, self.categories = {}, {}, {}
+            for level in LEVELS:
+                self.count[level] = np.load(os.path.join(data_directory, f'{level}_count.npy'))
+                self.total[level] = np.load(os.path.join(data_directory, f'{level}_total.npy'))
+                self.categories[level] = np.load(os.path.join(data_directory, f'{level}_categories.npy'))
+        else:
+            os.makedirs(os.path.join(directory, 'deltas'), exist_ok=True)
+            self.meta = {'edge_count': self.snapshot.edge_count, 'max_distance': max_distance, 'batches': [], 'sequence': 0,
+                         'seed': None}
+            self.latitude, self.longitude = np.empty(0), np.empty(0)
+            sizes = {'location': 0, 'node': self.snapshot.node_count, 'edge': self.edge_index.segment_count}
+            self.count = {level: np.zeros(size, dtype=np.int64) for level, size in sizes.items()}
+            self.total = {level: np.zeros(size, dtype=np.int64) for level, size in sizes.items()}
+            self.categories = {level: np.zeros((size, len(SEVERITY_CATEGORIES)), dtype=np.int64) for level, size in sizes.items()}
+
+        # Snapshot edges grouped by segment, so a segment's edges can be found without scanning every edge
+        self.edges_by_segment = np.argsort(self.edge_index.segment_of_edge, kind='stable')
+        self.segment_starts = np.searchsorted(self.edge_index.segment_of_edge[self.edges_by_segment],
+                                              np.arange(self.edge_index.segment_count + 1))
+
+    # Function to create a store and seed it with the collision history in one step
+    @classmethod
+    def build(cls, directory, snapshot_directory, history, seed_name=None, max_distance=MATCH_DISTANCE):
+        store = cls(directory, snapshot_directory, max_distance)
+        store.seed(history, seed_name)
+        return store
+
+    # Function to check whether the store holds the collision history yet
+    @property
+    def seeded(self):
+        return self.meta.get('seed') is not None
+
+    # Function to find the store position of every location, adding the ones not seen before
+    def location_positions(self, latitudes, longitudes):
+        keys = pd.MultiIndex.from_arrays([latitudes, longitudes])
+        positions = pd.MultiIndex.from_arrays([self.latitude, self.longitude]).get_indexer(keys)
+        new = positions < 0
+        if new.any():
+            new_keys = keys[new].unique()
+            positions[new] = len(self.latitude) + new_keys.get_indexer(keys[new])
+            self.latitude = np.append(self.latitude, new_keys.get_level_values(0).to_numpy(dtype=float))
+            self.longitude = np.append(self.longitude, new_keys.get_level_values(1).to_numpy(dtype=float))
+            self.count['location'] = np.append(self.count['location'], np.zeros(len(new_keys), dtype=np.int64))
+            self.total['location'] = np.append(self.total['location'], np.zeros(len(new_keys), dtype=np.int64))
+            self.categories['location'] = np.vstack([self.categories['location'],
+                                                     np.zeros((len(new_keys), len(SEVERITY_CATEGORIES)), dtype=np.int64)])
+        return positions
+
+    # Function to add collisions to one level's running counts, sums and category counts
+    def add(self, level, groups, severity, category):
+        size = len(self.count[level])
+        self.count[level] += np.bincount(groups, minlength=size)
+        self.total[level] += np.bincount(groups, weights=severity, minlength=size).astype(np.int64)
+        width = len(SEVERITY_CATEGORIES)
+        self.categories[level] += np.bincount(groups * width + category, minlength=size * width).reshape(size, width)
+
+    # Function to add raw collisions (Latitude, Longitude, Accident_Severity) to every level,
+    # returning how many there were and the segments they matched
+    def add_collisions(self, df):
+        df = df.dropna(subset=['Latitude', 'Longitude', 'Accident_Severity'])
+        latitudes, longitudes = df['Latitude'].to_numpy(dtype=float), df['Longitude'].to_numpy(dtype=float)
+        severity = df['Accident_Severity'].to_numpy().astype(np.int64)
+        known = np.isin(severity, list(SEVERITY_CATEGORIES))
+        if not known.all():
+            raise ValueError(f"Unknown Accident_Severity values {sorted(set(severity[~known].tolist()))}")
+        category = np.searchsorted(list(SEVERITY_CATEGORIES), severity)
+
+        self.add('location', self.location_positions(latitudes, longitudes), severity, category)
+        self.add('node', self.snapshot.nearest_nodes(longitudes, latitudes), severity, category)
+        segments = self.edge_index.nearest_segments(latitudes, longitudes, self.meta['max_distance'])
+        matched = segments >= 0
+        self.add('edge', segments[matched], severity[matched], category[matched])
+        return len(df), segments[matched]
+
+    # Function to load the collision history (e.g. London 2005-2018) into an empty store, without emitting a delta
+    def seed(self, history, seed_name=None):
+        if self.seeded:
+            raise ValueError(f"The severity store has already been seeded from '{self.meta['seed']}'.")
+        if self.meta['batches']:
+            raise ValueError("The severity store already holds batches; rebuild it from the full history instead.")
+        collision_count, segments = self.add_collisions(history)
+        self.meta['seed'] = seed_name or 'history'
+        self.save()
+        print(f"Seeded the store with {collision_count} collisions ({len(segments)} matched to a street)")
+
+    # Function to add a batch of raw collisions (Latitude, Longitude, Accident_Severity) to every level
+    # and return the delta for the edges it touched
+    def append(self, df, batch_name=None):
+        if not self.seeded:
+            raise ValueError("The severity store has not been seeded with the collision history; "
+                             "seed it (SeverityStore.build or --seed) before adding batches.")
+        if batch_name is not None and batch_name in self.meta['batches']:
+            print(f"Batch '{batch_name}' has already been added, skipping it")
+            return Delta(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+        collision_count, segments = self.add_collisions(df)
+
+        delta = self.edge_delta(np.unique(segments))
+        self.meta['batches'].append(batch_name)
+        self.meta['sequence'] += 1
+        # The delta goes first, so a saved batch always has its delta (a crash before the save just rewrites it)
+        np.savez(os.path.join(self.directory, 'deltas', f"delta_{self.meta['sequence']:06d}.npz"), **delta._asdict())
+        self.save()
+        print(f"Added {collision_count} collisions ({len(segments)} matched to a street), "
+              f"{len(delta.edges)} edges updated")
+        return delta
+
+    # Function to build the delta for a set of segments (both directions and any parallel edges)
+    def edge_delta(self, segments):
+        starts, ends = self.segment_starts[segments], self.segment_starts[segments + 1]
+        sizes = ends - starts
+        offsets = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        edges = self.edges_by_segment[np.repeat(starts, sizes) + offsets]
+        segment_of_edge = np.repeat(segments, sizes)
+        severity = self.total['edge'][segment_of_edge] / self.count['edge'][segment_of_edge]
+        return Delta(edges, severity, self.count['edge'][segment_of_edge].astype(float))
+
+    # Function to compute the mean severity of every entry of a level (default_severity where there are no collisions)
+    def mean_severity(self, level, default_severity=0):
+        mean = np.full(len(self.count[level]), float(default_severity))
+        np.divide(self.total[level], self.count[level], out=mean, where=self.count[level] > 0)
+        return mean
+
+    # Function to write the current per-edge values into the snapshot, for processes started later
+    def write_snapshot(self):
+        segment_of_edge = self.edge_index.segment_of_edge
+        write_column(self.snapshot_directory, 'mean_severity_score', self.mean_severity('edge')[segment_of_edge])
+        write_column(self.snapshot_directory, 'number_of_accidents', self.count['edge'][segment_of_edge].astype(float))
+        mark_annotated(self.snapshot_directory, f"severity store ({len(self.meta['batches'])} batches)")
+
+    # Function to return the per-location summary in the same form as severity_score.py, with the category counts
+    def location_summary(self):
+        summary = pd.DataFrame({'Latitude': self.latitude, 'Longitude': self.longitude,
+                                'number_of_accidents': self.count['location'],
+                                'mean_severity_score': self.mean_severity('location')})
+        for column, name in enumerate(SEVERITY_CATEGORIES.values()):
+            summary[f'{name}_accidents'] = self.categories['location'][:, column]
+        return summary
+
+    # Function to find the directory holding one generation of the aggregates
+    # (stores saved before generations were added keep theirs in the store directory itself)
+    def generation_directory(self, generation):
+        if generation is None:
+            return self.directory
+        return os.path.join(self.directory, f'generation_{generation:06d}')
+
+    # Function to save the aggregates as a new generation, committed by atomically replacing meta.json
+    def save(self):
+        previous = self.meta.get('generation')
+        generation = (previous or 0) + 1
+        data_directory = self.generation_directory(generation)
+        shutil.rmtree(data_directory, ignore_errors=True) # Left behind by a save that crashed before its commit
+        os.makedirs(data_directory)
+        write_column(data_directory, 'location_latitude', self.latitude)
+        write_column(data_directory, 'location_longitude', self.longitude)
+        for level in LEVELS:
+            write_column(data_directory, f'{level}_count', self.count[level])
+            write_column(data_directory, f'{level}_total', self.total[level])
+            write_column(data_directory, f'{level}_categories', self.categories[level])
+        self.meta['generation'] = generation
+        temporary = os.path.join(self.directory, 'meta.tmp.json')
+        with open(temporary, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(temporary, os.path.join(self.directory, 'meta.json'))
+        if previous is not None:
+            shutil.rmtree(self.generation_directory(previous), ignore_errors=True)
+
+# Function to read a delta saved by the store
+def load_delta(delta_file):
+    with np.load(delta_file) as data:
+        return Delta(data['edges'], data['severity'], data['accidents'])
+
+# Function to apply a delta to a running RoutingCore without reloading the graph
+def apply_delta(core, delta):
+    core.update_severity(delta.edges, delta.severity, delta.accidents)
+
+# Function to send a delta to a running route service (see route_service.py)
+def notify_service(base_url, delta):
+    payload = json.dumps({'edges': delta.edges.tolist(), 'severity': delta.severity.tolist(),
+                          'accidents': delta.accidents.tolist()}).encode()
+    request = urllib.request.Request(f"{base_url}/severity-delta", data=payload,
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add new collision batches to the running severity aggregates.")
+    parser.add_argument('batches', nargs='*', help="CSV files of raw collisions with Latitude, Longitude and Accident_Severity")
+    parser.add_argument('--store', default='C:/Users/bencr/Downloads/combined_collision_v3/severity_store')
+    parser.add_argument('--snapshot', default='C:/Users/bencr/Downloads/combined_collision_v3/london_drive_snapshot',
+                        help="Road network snapshot directory (see graph_snapshot.py)")
+    parser.add_argument('--seed', help="CSV file of the collision history to seed a new store with "
+                                       "(e.g. C:/Users/bencr/Downloads/combined_collision_v3/London_dataset.csv); "
+                                       "required the first time")
+    parser.add_argument('--write-snapshot', action='store_true', help="Also write the new edge values into the snapshot")
+    parser.add_argument('--notify', help="URL of a running route service to send each delta to")
+    args = parser.parse_args()
+
+    store = SeverityStore(args.store, args.snapshot)
+    if args.seed and store.seeded:
+        parser.error(f"the severity store has already been seeded from '{store.meta['seed']}'; "
+                     "pass only the new batches, or point --store at a new directory to reseed")
+    if args.seed:
+        store.seed(read_compact_csv(args.seed, usecols=['Latitude', 'Longitude', 'Accident_Severity']),
+                   os.path.basename(args.seed))
+    elif not store.seeded:
+        parser.error("the severity store is empty; pass --seed with the collision history the first time")
+    for batch_file in args.batches:
+        batch = read_compact_csv(batch_file, usecols=['Latitude', 'Longitude', 'Accident_Severity'])
+        delta = store.append(batch, os.path.basename(batch_file))
+        if args.notify and len(delta.edges):
+            print(notify_service(args.notify, delta))
+    if args.write_snapshot:
+        store.write_snapshot()
@@ -0,0 +1,173 @@
+import os # For the process ID and the trace file
+import sys # For the platform and the script name
+import json # For the Chrome trace files
+import time # For the wall and CPU clocks
+import atexit # For writing the report when a script finishes
+import argparse # For the command-line interface
+import functools # For keeping the wrapped functions' names
+import threading # For the per-thread CPU time and the lock
+
+# Set this environment variable to a file path to write a Chrome trace (and print the summary) when a script exits
+TRACE_VARIABLE = 'COLLISION_TRACE'
+
+# Most spans kept for the trace file (the summary keeps counting after this, so memory stays bounded in production)
+MAX_TRACE_EVENTS = 200000
+
+# Peak resident memory of the process in bytes: resource on Linux and macOS, psutil on Windows, otherwise unknown
+try:
+    import resource # Not available on Windows
+
+    def peak_rss():
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024 # Linux reports kilobytes, macOS bytes
+except ImportError:
+    try:
+        import psutil # Optional, only needed for memory figures on Windows
+        _process = psutil.Process()
+
+        def peak_rss():
+            memory = _process.memory_info()
+            return getattr(memory, 'peak_wset', memory.rss)
+    except ImportError:
+        def peak_rss():
+            return None
+
+# Collects finished spans: running totals per name for the summary, and the first MAX_TRACE_EVENTS spans for the trace
+class Tracer:
+    def __init__(self, max_events=MAX_TRACE_EVENTS):
+        self.origin = time.perf_counter_ns()
+        self.max_events = max_events
+        self.events = []
+        self.totals = {}
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    # Function to record one finished span (times in nanoseconds)
+    def record(self, name, start, wall, cpu, peak, rows, args):
+        with self.lock:
+            totals = self.totals.get(name)
+            if totals is None:
+                totals = self.totals[name] = {'calls': 0, 'wall': 0, 'cpu': 0, 'rows': 0, 'peak_rss': 0}
+            totals['calls'] += 1
+            totals['wall'] += wall
+            totals['cpu'] += cpu
+            totals['rows'] += rows or 0
+            totals['peak_rss'] = max(totals['peak_rss'], peak or 0)
+            if len(self.events) < self.max_events:
+                self.events.append((name, start - self.origin, wall, cpu, peak, rows, threading.get_ident(), args))
+            else:
+                self.dropped += 1
+
+    # Function to return the totals per span name, slowest first
+    def summary(self):
+        with self.lock:
+            rows = [dict(name=name, **totals) for name, totals in self.totals.items()]
+        return sorted(rows, key=lambda row: row['wall'], reverse=True)
+
+    # Function to format the summary as a table
+    def summary_table(self):
+        lines = [f"{'Span':<40} {'Calls':>8} {'Wall (s)':>10} {'CPU (s)':>10} {'Mean (ms)':>10} {'Rows':>12} {'Peak RSS (MB)':>14}"]
+        for row in self.summary():
+            peak = f"{row['peak_rss'] / 1e6:.0f}" if row['peak_rss'] else '-'
+            lines.append(f"{row['name'][:40]:<40} {row['calls']:>8} {row['wall'] / 1e9:>10.3f} {row['cpu'] / 1e9:>10.3f} "
+                         f"{row['wall'] / row['calls'] / 1e6:>10.2f} {row['rows'] or '-':>12} {peak:>14}")
+        if self.dropped:
+            lines.append(f"({self.dropped} spans were left out of the trace file but are counted above)")
+        return '\n'.join(lines)
+
+    # Function to write the spans as a Chrome trace (open it in chrome://tracing or https://ui.perfetto.dev)
+    def write_trace(self, path):
+        pid = os.getpid()
+        with self.lock:
+            events = list(self.events)
+        trace = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': os.path.basename(sys.argv[0]) or 'python'}}]
+        for name, start, wall, cpu, peak, rows, thread, args in events:
+            details = {'cpu_ms': cpu / 1e6}
+            if peak is not None:
+                details['peak_rss_mb'] = round(peak / 1e6, 1)
+            if rows is not None:
+                details['rows'] = rows
+            if args:
+                details.update(args)
+            trace.append({'name': name, 'ph': 'X', 'ts': start / 1000, 'dur': wall / 1000, 'pid': pid, 'tid': thread,
+                          'args': details})
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+        os.replace(temporary, path)
+        return path
+
+# The tracer every span in this process records to
+tracer = Tracer()
+
+# A timed region: with Span('read_csv') as s: ... s.rows = len(df)
+# Costs a few microseconds, so it can wrap every stage and hot call permanently
+class Span:
+    __slots__ = ('name', 'rows', 'args', 'start', 'cpu')
+
+    def __init__(self, name, rows=None, **args):
+        self.name = name
+        self.rows = rows
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        self.cpu = time.thread_time_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        # CPU time of this thread only, so concurrent workers don't count each other's work
+        cpu = time.thread_time_ns() - self.cpu
+        end = time.perf_counter_ns()
+        tracer.record(self.name, self.start, end - self.start, cpu, peak_rss(), self.rows, self.args)
+        return False
+
+# Decorator to wrap every call of a function in a span, optionally counting rows from its result
+# e.g. @traced('load_collisions', rows=len)
+def traced(name=None, rows=None):
+    def decorate(function):
+        label = name or function.__qualname__
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Span(label) as current:
+                result = function(*args, **kwargs)
+                if rows is not None:
+                    current.rows = rows(result)
+                return result
+        return wrapper
+    return decorate
+
+# Function to print the summary and write the trace, e.g. at the end of a script
+def report(trace_file=None):
+    if not tracer.totals:
+        return
+    print(tracer.summary_table())
+    if trace_file:
+        print(f"Trace written to {tracer.write_trace(trace_file)}")
+
+# Function to report when the script exits, if the trace environment variable is set
+def report_at_exit():
+    trace_file = os.environ.get(TRACE_VARIABLE)
+    if trace_file:
+        report(trace_file)
+
+atexit.register(report_at_exit)
+
+# Function to rebuild the summary from a saved trace file
+def load_trace(path):
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+    loaded = Tracer()
+    for event in events:
+        if event.get('ph') == 'X':
+            args = event.get('args', {})
+            peak = args.get('peak_rss_mb')
+            loaded.record(event['name'], loaded.origin + int(event['ts'] * 1000), int(event['dur'] * 1000),
+                          int(args.get('cpu_ms', 0) * 1e6), None if peak is None else int(peak * 1e6), args.get('rows'), None)
+    return loaded
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise a trace written by an instrumented script.")
+    parser.add_argument('trace', help=f"Trace file (scripts write one when {TRACE_VARIABLE} is set)")
+    args = parser.parse_args()
+    print(load_trace(args.trace).summary_table())
@@ -0,0 +1,171 @@
+import os # For interacting with the file system
+import time # For reporting preprocessing and query times
+import numpy as np # For the landmark distance tables and the potentials
+from scipy.sparse import csr_matrix # For the reweighted graph of each query's region
+from scipy.sparse.csgraph import dijkstra # For the landmark searches and the compiled A* search
+from array_routing import Route # For returning routes in the same form as the routing core
+
+# Number of landmarks used by default (more landmarks give tighter bounds but larger tables)
+LANDMARK_COUNT = 16
+
+# Number of table rows (the best bounds between the source and the target) each query builds its bounds from
+ACTIVE_LANDMARKS = 6
+
+# Share of the lower bound at the source that the first search may spend before its limit is doubled
+FIRST_LIMIT_SHARE = 0.03
+
+# Stand-in for "unreachable" in the tables, so differences never produce NaN
+UNREACHABLE = 1e15
+
+# A* with landmark (ALT) lower bounds over one weight of a RoutingCore, run as a compiled Dijkstra search over
+# edge weights reduced by the landmark potential, within the region of nodes that can lie on the route
+# Every query builds its own arrays, so concurrent queries share nothing but the read-only table and graph
+class LandmarkRouter:
+    def __init__(self, core, weight, landmarks, table):
+        self.core = core
+        self.weight = weight
+        self.landmarks = np.asarray(landmarks)
+        # Rows 0..count-1 hold minus the distance from each landmark to every node, rows count..2*count-1 the
+        # distance from every node to each landmark, so the bound to the target from every node is a max over rows
+        table = np.asarray(table) # A plain view of the mapped file avoids np.memmap's per-lookup overhead
+        if table.shape[0] != 2 * len(self.landmarks):
+            table = np.ascontiguousarray(table.T) # Tables saved one row per node
+        self.table = table
+        self.graph = core.matrices[weight]
+
+    # Function to choose landmarks by repeatedly taking the node farthest from those already chosen, then
+    # tabulate the distances to and from each one
+    @classmethod
+    def build(cls, core, weight='length', count=LANDMARK_COUNT, seed=0):
+        start = time.perf_counter()
+        graph = core.matrices[weight]
+        reverse = graph.T.tocsr()
+        rng = np.random.default_rng(seed)
+        landmarks = [int(rng.integers(core.node_count))]
+        # Float64 keeps the potential consistent, so no reduced weight goes negative through rounding
+        table = np.empty((2 * count, core.node_count))
+        nearest = np.full(core.node_count, np.inf)
+        for i in range(count):
+            from_landmark = dijkstra(graph, indices=landmarks[i])
+            to_landmark = dijkstra(reverse, indices=landmarks[i])
+            table[i] = -np.minimum(from_landmark, UNREACHABLE)
+            table[count + i] = np.minimum(to_landmark, UNREACHABLE)
+            if i + 1 < count:
+                # The next landmark is the reachable node with the largest distance to its nearest landmark
+                nearest = np.minimum(nearest, from_landmark)
+                spread = np.where(np.isfinite(nearest), nearest, -1)
+                spread[landmarks] = -1
+                landmarks.append(int(np.argmax(spread)))
+        router = cls(core, weight, landmarks, table)
+        router.preprocessing_seconds = time.perf_counter() - start
+        print(f"Preprocessed {count} landmarks for '{weight}' in {router.preprocessing_seconds:.1f} s "
+              f"({router.table.nbytes / 1e6:.1f} MB of tables)")
+        return router
+
+    # Function to save the landmark table next to the graph snapshot
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, f'landmarks_{self.weight}.npy'), self.landmarks)
+        np.save(os.path.join(directory, f'landmarks_{self.weight}_table.npy'), self.table)
+
+    # Function to open a saved landmark table (memory-mapped, like the snapshot itself)
+    @classmethod
+    def load(cls, core, directory, weight='length'):
+        landmarks = np.load(os.path.join(directory, f'landmarks_{weight}.npy'))
+        table = np.load(os.path.join(directory, f'landmarks_{weight}_table.npy'), mmap_mode='r')
+        return cls(core, weight, landmarks, table)
+
+    # Function to compute the lower bounds on the distance from the source to every node and from every node to the
+    # target, using the table rows that give the best bounds between the source and the target, and an upper bound
+    # on the route's cost (the cheaper of the trips through each landmark)
+    def bounds(self, source, target):
+        table = self.table
+        count = len(self.landmarks)
+        spans = table[:, source] - table[:, target]
+        rows = np.argsort(spans)[-ACTIVE_LANDMARKS:]
+        # Row j bounds the distance from v to the target by table[j, v] - table[j, target], and the distance from
+        # the source to v by table[j, source] - table[j, v], which is the same difference less the row's span
+        differences = table[rows]
+        differences -= table[rows, target][:, None]
+        to_target = np.maximum(differences.max(axis=0), 0)
+        differences -= spans[rows][:, None]
+        from_source = np.maximum(-differences.min(axis=0), 0)
+        upper = float((table[count:, source] - table[:count, target]).min())
+        return from_source, to_target, upper
+
+    # Function to find the route with the lowest total weight by A*
+    # Only nodes whose bounds through them are within the upper bound can lie on the route, so the search runs over
+    # that region alone, with weights reduced by the bound to the target: Dijkstra over them settles nodes in the
+    # same order as A*, and its limit (doubled until the target is reached) keeps the search near the target
+    def route(self, source, target):
+        source, target = int(source), int(target)
+        if source == target:
+            return Route([source], np.empty(0, dtype=np.int64)), 0.0
+        from_source, to_target, upper = self.bounds(source, target)
+        if to_target[source] >= UNREACHABLE / 2:
+            raise ValueError("No path exists between the selected start and end points.")
+        graph = self.graph
+        from_source += to_target
+        nodes = np.flatnonzero(from_source <= upper * (1 + 1e-9)) # Allow for rounding in the sums
+        local = np.full(self.core.node_count, -1, dtype=np.int64)
+        local[nodes] = np.arange(len(nodes))
+
+        # The region's edges: the out-edges of its nodes whose heads are in it too
+        degrees = np.diff(graph.indptr)[nodes]
+        edges = np.arange(degrees.sum()) + np.repeat(graph.indptr[nodes] - (np.cumsum(degrees) - degrees), degrees)
+        tails = np.repeat(np.arange(len(nodes)), degrees)
+        heads = local[graph.indices[edges]]
+        inside = heads >= 0
+        edges, tails, heads = edges[inside], tails[inside], heads[inside]
+        reduced = graph.data[edges] + to_target[nodes[heads]] - to_target[nodes[tails]]
+        np.maximum(reduced, 0, out=reduced) # Only rounding can take a reduced weight below zero
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tails, minlength=len(nodes)), out=indptr[1:])
+        region = csr_matrix((reduced, heads, indptr), shape=(len(nodes), len(nodes)))
+
+        # The reduced distance to the target is the route's excess over the bound, so start small and double, and
+        # stop once a search has no edge left to nodes beyond its limit (everything reachable was settled, so the
+        # target is unreachable)
+        start, finish = local[source], local[target]
+        limit = max(to_target[source] * FIRST_LIMIT_SHARE, 1.0)
+        while finish >= 0:
+            distances, predecessors = dijkstra(region, indices=start, return_predecessors=True, limit=limit)
+            if predecessors[finish] >= 0:
+                break
+            reached = np.isfinite(distances)
+            if not (reached[tails] & ~reached[heads]).any():
+                break
+            limit *= 2
+        if finish < 0 or predecessors[finish] < 0:
+            raise ValueError("No path exists between the selected start and end points.")
+        path = [finish]
+        while path[-1] != start:
+            path.append(predecessors[path[-1]])
+        path = nodes[path[::-1]].tolist()
+        route = Route(path, self.core.path_edges(path, self.weight))
+        return route, float(self.core.weights[self.weight][route.edges].sum())
+
+if __name__ == "__main__":
+    from graph_snapshot import load_snapshot # For opening the London road network
+    from array_routing import RoutingCore # For the weight vectors the landmarks are built over
+
+    # Example usage: preprocess both weights once, then compare point-to-point queries with the routing core
+    snapshot_directory = 'C:/Users/bencr/Downloads/combined_collision_v3/london_drive_snapshot'
+    snapshot = load_snapshot(snapshot_directory)
+    routing = RoutingCore(snapshot)
+    rng = np.random.default_rng()
+    for weight in ['length', 'safety']:
+        router = LandmarkRouter.build(routing, weight)
+        router.save(snapshot_directory)
+        pairs = rng.integers(snapshot.node_count, size=(100, 2))
+        timings = {'landmarks': 0.0, 'routing core': 0.0}
+        for source, target in pairs:
+            for name, query in [('landmarks', router.route), ('routing core', lambda s, t: routing.route(s, t, weight))]:
+                start = time.perf_counter()
+                try:
+                    query(source, target)
+                except ValueError:
+                    pass
+                timings[name] += time.perf_counter() - start
+        print(f"'{weight}': " + ", ".join(f"{name} {seconds * 1000 / len(pairs):.2f} ms per query"
+                                          for name, seconds in timings.items()))
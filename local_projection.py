@@ -0,0 +1,30 @@
+import numpy as np # For vectorised coordinate maths
+
+# Reference point of the projection (central London)
+LONDON_LATITUDE = 51.5074
+LONDON_LONGITUDE = -0.1278
+
+# Mean radius of the Earth in metres
+EARTH_RADIUS = 6371008.8
+
+# Metres per degree along a meridian and along the reference parallel
+METRES_PER_DEGREE_LATITUDE = np.pi * EARTH_RADIUS / 180
+METRES_PER_DEGREE_LONGITUDE = METRES_PER_DEGREE_LATITUDE * np.cos(np.radians(LONDON_LATITUDE))
+
+# Function to project latitudes and longitudes onto a flat grid in metres around London
+# (an equirectangular projection is accurate to well under 0.1% across Greater London)
+def project(latitude, longitude):
+    x = (np.asarray(longitude, dtype=float) - LONDON_LONGITUDE) * METRES_PER_DEGREE_LONGITUDE
+    y = (np.asarray(latitude, dtype=float) - LONDON_LATITUDE) * METRES_PER_DEGREE_LATITUDE
+    return x, y
+
+# Function to convert projected x and y metres back to latitudes and longitudes
+def unproject(x, y):
+    latitude = np.asarray(y, dtype=float) / METRES_PER_DEGREE_LATITUDE + LONDON_LATITUDE
+    longitude = np.asarray(x, dtype=float) / METRES_PER_DEGREE_LONGITUDE + LONDON_LONGITUDE
+    return latitude, longitude
+
+# Function to project an (N, 2) array of longitude/latitude pairs (the layout used by shapely)
+def project_coordinates(coordinates):
+    x, y = project(coordinates[:, 1], coordinates[:, 0])
+    return np.column_stack([x, y])
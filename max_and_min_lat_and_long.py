@@ -1,13 +1,11 @@
-import pandas as pd
+from columnar_store import open_store # For the per-block column statistics
 
-# Load the dataset
-df = pd.read_csv('C:/Users/bencr/Downloads/combined_collision_v3/combined_collisions_v3.csv')
+# Open the dataset's column store
+store = open_store()
 
-# Determine the minimum and maximum values 
-minimum_latitude = df['Latitude'].min()
-maximum_latitude = df['Latitude'].max()
-minimum_longitude = df['Longitude'].min()
-maximum_longitude = df['Longitude'].max()
+# Determine the minimum and maximum values from the block statistics, without reading the columns
+minimum_latitude, maximum_latitude = store.column_range('Latitude')
+minimum_longitude, maximum_longitude = store.column_range('Longitude')
 
 print(f"Minimum Latitude: {minimum_latitude}")
 print(f"Maximum Latitude: {maximum_latitude}")
@@ -1,10 +1,10 @@
-import pandas as pd
+from compact_schema import read_compact_csv
 
 # Load your dataset
-df = pd.read_csv('C:/Users/bencr/Downloads/combined_collision_v3/refined_London_dataset.csv')
+df = read_compact_csv('C:/Users/bencr/Downloads/combined_collision_v3/refined_London_dataset.csv', usecols=['Borough', 'mean_severity_score'])
 
 # Count the number of occurrences of each mean_severity_score in each Borough
-result = df.groupby(['Borough', 'mean_severity_score']).size().reset_index(name='count')
+result = df.groupby(['Borough', 'mean_severity_score'], observed=True).size().reset_index(name='count')
 
 # Save the result to a CSV file
 result.to_csv('mean_severity_score_counts.csv', index=False)
@@ -1,20 +1,9 @@
-import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
+from aggregate_cube import open_cube
 
-# Define London boundaries
-min_latitude, max_latitude = 51.3550556, 51.6517156
-min_longitude, max_longitude = -0.453256, 0.15050513
-
-# Load the dataset
-df = pd.read_csv('C:/Users/bencr/Downloads/combined_collision_v3/combined_collisions_v3.csv')
-
-# Filter the dataset based on London boundaries
-df_london = df[(df['Latitude'] >= min_latitude) & (df['Latitude'] <= max_latitude) &
-               (df['Longitude'] >= min_longitude) & (df['Longitude'] <= max_longitude)]
-
-# Create a pivot table
-pivot_table = df_london.pivot_table(index='Day_of_Week', columns='Accident_Severity', aggfunc='size', fill_value=0)
+# Create a pivot table: London's collisions by day of the week and severity, summed from the collision cube
+pivot_table = open_cube().table('day_of_week', 'severity')
 
 # Create the heatmap
 plt.figure(figsize=(10, 6))
@@ -22,4 +11,5 @@ sns.heatmap(pivot_table, annot=True, cmap='YlGnBu', cbar=True)
 plt.title('Heatmap of Accident Severity in London')
 plt.xlabel('Accident Severity')
 plt.ylabel('Day of the Week')
+plt.savefig('day_heatmap.png')
 plt.show()
\ No newline at end of file
@@ -0,0 +1,125 @@
+import os # For interacting with the file system
+import argparse # For the command-line interface
+import numpy as np # For vectorised array operations
+import pandas as pd # For reading and writing the coordinate files in chunks
+import osmnx as ox # For loading the saved street network
+import shapely # For the spatial index over the street geometries
+from local_projection import project, project_coordinates # For measuring distances in metres
+
+# Search radius in metres (the same 10-metre radius as the Overpass "around" queries)
+SNAP_DISTANCE = 10
+
+# Function to download the London drive network once and save it for offline use
+def save_street_graph(output_file, place='London, England'):
+    street = ox.graph_from_place(place, network_type='drive', simplify=False)
+    ox.save_graphml(street, output_file)
+    return output_file
+
+# Function to load a saved OSMnx graph (.graphml) or a local OSM extract (.osm/.xml) as an edge table
+def load_street_edges(source):
+    if source.endswith('.graphml'):
+        street = ox.load_graphml(source)
+    else:
+        street = ox.graph_from_xml(source, simplify=False, retain_all=True)
+    edges = ox.graph_to_gdfs(street, nodes=False).reset_index()
+    # Convert `osmid` to integers (fix cases where it's a list, as in Nominatim_heatmap.py)
+    edges['osmid'] = edges['osmid'].apply(lambda x: int(x[0]) if isinstance(x, list) else int(x))
+    # Both directions of a two-way street share the same way and geometry, so keep one of them
+    edges['first_node'] = np.minimum(edges['u'], edges['v'])
+    edges['second_node'] = np.maximum(edges['u'], edges['v'])
+    edges = edges.drop_duplicates(subset=['osmid', 'first_node', 'second_node'])
+    return edges[['osmid', 'geometry']].reset_index(drop=True)
+
+# Function to load the edges of a graph snapshot (see graph_snapshot.py) as the same edge table, without OSMnx
+# (the snapshot is unsimplified, so every edge is the straight segment between its two nodes)
+def load_snapshot_edges(directory):
+    from graph_snapshot import load_snapshot # Only needed when snapping to a snapshot
+    snapshot = load_snapshot(directory)
+    tails, heads = np.asarray(snapshot.tails), np.asarray(snapshot.indices)
+    edges = pd.DataFrame({'osmid': np.asarray(snapshot.edge_osmid), 'first_node': np.minimum(tails, heads),
+                          'second_node': np.maximum(tails, heads)}).drop_duplicates()
+    node_x, node_y = np.asarray(snapshot.node_x), np.asarray(snapshot.node_y)
+    first, second = edges['first_node'].to_numpy(), edges['second_node'].to_numpy()
+    coordinates = np.stack([np.column_stack([node_x[first], node_y[first]]),
+                            np.column_stack([node_x[second], node_y[second]])], axis=1)
+    edges['geometry'] = shapely.linestrings(coordinates)
+    return edges[['osmid', 'geometry']].reset_index(drop=True)
+
+# Spatial index mapping coordinates to the OSM way of the nearest street
+class StreetSnapper:
+    def __init__(self, edges, max_distance=SNAP_DISTANCE):
+        self.osm_ids = edges['osmid'].to_numpy(dtype=np.int64)
+        # Project the way geometries into metres once so distances can be compared directly
+        self.geometries = shapely.transform(np.asarray(edges.geometry.values), project_coordinates)
+        self.tree = shapely.STRtree(self.geometries)
+        self.max_distance = max_distance
+
+    # Load the index straight from a saved graph or OSM extract
+    @classmethod
+    def from_file(cls, source, max_distance=SNAP_DISTANCE):
+        return cls(load_street_edges(source), max_distance)
+
+    # Return the position of the nearest street for every point (-1 if none is within range)
+    def nearest(self, latitudes, longitudes):
+        x, y = project(latitudes, longitudes)
+        points = shapely.points(x, y)
+        matches = np.full(len(points), -1, dtype=np.int64)
+        point_index, street_index = self.tree.query_nearest(points, max_distance=self.max_distance)
+        # Ties are returned more than once, so keep the first street per point
+        point_index, first = np.unique(point_index, return_index=True)
+        matches[point_index] = street_index[first]
+        return matches
+
+    # Assign OSM_ID and OSM_Type to a batch of coordinates
+    def snap(self, latitudes, longitudes):
+        matches = self.nearest(latitudes, longitudes)
+        found = matches >= 0
+        osm_ids = pd.arrays.IntegerArray(self.osm_ids[np.maximum(matches, 0)], ~found)
+        osm_types = np.where(found, 'way', None)
+        return osm_ids, osm_types
+
+# Function to snap a whole coordinate file and write it in the Latitude,Longitude,OSM_ID,OSM_Type format
+# (with all_columns, every column of a file with Latitude and Longitude columns is kept, as the Nominatim enrichment did)
+def snap_file(input_file, output_file, snapper, chunk_size=500000, all_columns=False):
+    total, matched = 0, 0
+    header = True
+    # Otherwise read only the first two columns (latitude and longitude), as the Overpass scripts did
+    reader = pd.read_csv(input_file, usecols=None if all_columns else [0, 1], chunksize=chunk_size, encoding='utf-8-sig')
+    for chunk in reader:
+        if not all_columns:
+            chunk.columns = ['Latitude', 'Longitude']
+        osm_ids, osm_types = snapper.snap(chunk['Latitude'].to_numpy(), chunk['Longitude'].to_numpy())
+        chunk['OSM_ID'] = osm_ids
+        chunk['OSM_Type'] = osm_types
+        chunk.to_csv(output_file, mode='w' if header else 'a', header=header, index=False)
+        header = False
+        total += len(chunk)
+        matched += int(chunk['OSM_ID'].notna().sum())
+    print(f"Snapped {matched} of {total} coordinates, written to {output_file}")
+    return total, matched
+
+# Function to process a chunk file, writing the "_processed" file that checkpoint.py would produce
+def snap_chunks(chunk_file, snapper):
+    output_file = chunk_file.replace('.csv', '_processed.csv')
+    snap_file(chunk_file, output_file, snapper)
+    return output_file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assign the OSM way of the nearest street to every coordinate, offline.")
+    parser.add_argument('--input', default='C:/Users/bencr/Downloads/combined_collision_v3/latlong.txt')
+    parser.add_argument('--output', default='osm_info.csv')
+    parser.add_argument('--graph', default='C:/Users/bencr/Downloads/combined_collision_v3/london_drive.graphml',
+                        help="Saved street network (downloaded the first time)")
+    parser.add_argument('--snapshot', help="Snap to the streets of a graph snapshot directory instead of the saved network")
+    parser.add_argument('--all-columns', action='store_true',
+                        help="Keep every column of the input (which needs Latitude and Longitude columns), like enriched_file.csv")
+    args = parser.parse_args()
+
+    # Example usage: save the network once, then snap every collision coordinate offline
+    if args.snapshot:
+        snapper = StreetSnapper(load_snapshot_edges(args.snapshot))
+    else:
+        if not os.path.exists(args.graph):
+            save_street_graph(args.graph)
+        snapper = StreetSnapper.from_file(args.graph)
+    snap_file(args.input, args.output, snapper, all_columns=args.all_columns)
@@ -1,29 +1,22 @@
 import os
+import argparse
 import pandas as pd
+from external_merge import external_sort
 
-# Change this to the path of your folder with the CSV files
-chunks = 'C:/Users/bencr/Downloads/chunks'
+# The folder with the CSV files (the chunks folder osm_information.py writes in the data directory, unless another is given)
+parser = argparse.ArgumentParser(description="Merge the OSM information chunks into one file sorted by latitude.")
+parser.add_argument('chunks', nargs='?', default='C:/Users/bencr/Downloads/combined_collision_v3/chunks')
+chunks = parser.parse_args().chunks
+output_file = os.path.join(chunks, 'osm_info.csv')
 
-# Get all the CSV files in chunks
-osm_files = [f for f in os.listdir(chunks) if f.endswith('.csv')]
+# Get all the CSV files in chunks (apart from the output of an earlier run)
+osm_files = [f for f in os.listdir(chunks) if f.endswith('.csv') and f != 'osm_info.csv']
 
 # Sort the files in order
 osm_files.sort()
 
-# Initialise an empty dataframe
-merged_df = pd.DataFrame()
-
-# Loop through the files whilst appending
-for file in osm_files:
-    file_path = os.path.join(chunks, file)
-    df = pd.read_csv(file_path)
-    # Swap the latitude and longitude columns if needed
-    df = df[['Latitude', 'Longitude'] + [col for col in df.columns if col not in ['Latitude', 'Longitude']]]
-    # Update merged_df with new data
-    merged_df = pd.concat([merged_df, df], ignore_index=True)
-
-# Sort the merged dataframe by the 'Latitude' column
-merged_df = merged_df.sort_values(by='Latitude')
-
-# Save the sorted dataframe to a new CSV file
-merged_df.to_csv(os.path.join(chunks, 'osm_info.csv'), index=False)
\ No newline at end of file
+# Sort each file a block at a time and merge them by the 'Latitude' column, dropping duplicate rows
+# (overlapping chunks), with the latitude and longitude columns first
+columns = list(pd.read_csv(os.path.join(chunks, osm_files[0]), nrows=0).columns)
+columns = ['Latitude', 'Longitude'] + [col for col in columns if col not in ['Latitude', 'Longitude']]
+external_sort([os.path.join(chunks, file) for file in osm_files], output_file, key=['Latitude'], columns=columns)
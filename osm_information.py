@@ -2,10 +2,15 @@ import requests
 import csv
 import os
 import time
+from osm_lookup_cache import LookupCache
+from external_merge import external_sort
 
 # Overpass API URL
 OVERPASS_URL = "http://overpass-api.de/api/interpreter"
 
+# Cache of earlier Overpass lookups (shared with checkpoint.py)
+cache = LookupCache(source='overpass')
+
 # Function to get OSM ID and type from latitude and longitude
 def get_osm_info(lat, lon):
     query = f"""
@@ -25,20 +30,30 @@ def get_osm_info(lat, lon):
         if "elements" in data and len(data["elements"]) > 0:
             element = data["elements"][0]  # Get the first element
             return element["id"], element["type"]
+        return None, None  # Nothing within 10 m
     
-    return None, None
+    return None  # The request failed, so don't cache it
 
 # Function to process a chunk of coordinates
 def chunks(chunk, chunk_index, output_dir):
-    c_output_file = os.path.join(output_dir, f'osm_info_chunk_{chunk_index}.csv')
+    chunk_output_file = os.path.join(output_dir, f'osm_info_chunk_{chunk_index}.csv')
     with open(chunk_output_file, 'w', newline='') as outfile:
         csv_writer = csv.writer(outfile)
         csv_writer.writerow(['Latitude', 'Longitude', 'OSM_ID', 'OSM_Type'])
         
-        for lat, lon in chunk:
-            osm_id, osm_type = get_osm_info(lat, lon)
+        # Only query each distinct coordinate that isn't cached yet
+        results = cache.lookup(chunk, fetch_osm_info)
+        for (lat, lon), (osm_id, osm_type) in zip(chunk, results):
             csv_writer.writerow([lat, lon, osm_id, osm_type])
-            time.sleep(1)  # Delay to avoid Overpass API rate limits
+        print(f"Chunk {chunk_index}: {cache.stats()}")
+
+# Function to query a list of coordinates one at a time
+def fetch_osm_info(points):
+    results = []
+    for lat, lon in points:
+        results.append(get_osm_info(lat, lon))
+        time.sleep(1)  # Delay to avoid Overpass API rate limits
+    return results
 
 # Function to process file in chunks
 def chunks_file_processing(input_file, chunk_size=2000, output_dir='chunks'):
@@ -62,17 +77,11 @@ def chunks_file_processing(input_file, chunk_size=2000, output_dir='chunks'):
 
     merge_chunks(output_dir, 'osm_info.csv')
 
-# Merge chunks into a single output file
+# Merge chunks into a single output file sorted by latitude, dropping rows repeated across chunks
 def merge_chunks(output_dir, output_file):
-    with open(output_file, 'w', newline='') as outfile:
-        csv_writer = csv.writer(outfile)
-        csv_writer.writerow(['Latitude', 'Longitude', 'OSM_ID', 'OSM_Type'])
-        for chunk_file in os.listdir(output_dir):
-            with open(os.path.join(output_dir, chunk_file), 'r', encoding='utf-8-sig') as infile:
-                csv_reader = csv.reader(infile)
-                next(csv_reader)  # Skip header
-                for row in csv_reader:
-                    csv_writer.writerow(row)
+    chunk_files = [f for f in os.listdir(output_dir) if f.startswith('osm_info_chunk_') and f.endswith('.csv')]
+    chunk_files.sort(key=lambda f: int(f[len('osm_info_chunk_'):-len('.csv')]))  # Chunk order, not listdir order
+    external_sort([os.path.join(output_dir, f) for f in chunk_files], output_file, key=['Latitude'])
 
 # Run the process
 input_file = 'C:/Users/bencr/Downloads/combined_collision_v3/latlong.txt'
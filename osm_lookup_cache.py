@@ -0,0 +1,100 @@
+import os # For interacting with the file system
+import sqlite3 # For the on-disk cache shared between runs and processes
+import threading # For one connection per thread and thread-safe statistics
+
+# Where the cache lives (every enrichment path shares this one file)
+CACHE_FILE = 'C:/Users/bencr/Downloads/combined_collision_v3/osm_lookup_cache.sqlite'
+
+# Coordinates are rounded to this many decimal places for the cache key (about 1 m, well inside the 10 m search radius)
+KEY_PRECISION = 5
+
+# On-disk cache of coordinate -> (OSM ID, OSM type) lookups, keyed by source and quantized coordinates
+# SQLite in WAL mode lets several processes read and write the same file at once; every thread gets its own
+# connection. Lookups that found nothing are cached too, but failed lookups (returned as None) are not
+class LookupCache:
+    def __init__(self, path=CACHE_FILE, source='overpass', precision=KEY_PRECISION):
+        self.path = path
+        self.source = source
+        self.scale = 10 ** precision
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.duplicates = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connection() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS lookups (
+                source TEXT NOT NULL, latitude_key INTEGER NOT NULL, longitude_key INTEGER NOT NULL,
+                osm_id INTEGER, osm_type TEXT, PRIMARY KEY (source, latitude_key, longitude_key)) WITHOUT ROWID""")
+
+    # Function to return this thread's connection, opening it on first use
+    def connection(self):
+        if getattr(self.local, 'connection', None) is None:
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return self.local.connection
+
+    # Function to quantize a coordinate pair into its cache key
+    def key(self, latitude, longitude):
+        return round(latitude * self.scale), round(longitude * self.scale)
+
+    # Function to read the cached results for some keys
+    def get_many(self, keys):
+        connection = self.connection()
+        with connection:
+            connection.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (latitude_key INTEGER, longitude_key INTEGER)")
+            connection.execute("DELETE FROM wanted")
+            connection.executemany("INSERT INTO wanted VALUES (?, ?)", keys)
+            rows = connection.execute("""SELECT l.latitude_key, l.longitude_key, l.osm_id, l.osm_type
+                FROM wanted w JOIN lookups l ON l.source = ? AND l.latitude_key = w.latitude_key
+                AND l.longitude_key = w.longitude_key""", (self.source,)).fetchall()
+        return {(latitude_key, longitude_key): (osm_id, osm_type) for latitude_key, longitude_key, osm_id, osm_type in rows}
+
+    # Function to store results for some keys in one transaction
+    def put_many(self, items):
+        connection = self.connection()
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?, ?)",
+                                   [(self.source, latitude_key, longitude_key, osm_id, osm_type)
+                                    for (latitude_key, longitude_key), (osm_id, osm_type) in items])
+
+    # Function to look up many points, deduplicating them and fetching only those not cached yet
+    # fetch takes a list of (latitude, longitude) points and returns one (osm_id, osm_type) or None (failed) per point
+    def lookup(self, points, fetch, missing=(None, None)):
+        points = list(points)
+        keys = [self.key(latitude, longitude) for latitude, longitude in points]
+        first_point = {}
+        for key, point in zip(keys, points):
+            first_point.setdefault(key, point)
+        results = self.get_many(list(first_point))
+        wanted = [key for key in first_point if key not in results]
+        with self.lock:
+            self.hits += len(first_point) - len(wanted)
+            self.misses += len(wanted)
+            self.duplicates += len(points) - len(first_point)
+        if wanted:
+            fetched = fetch([first_point[key] for key in wanted])
+            found = [(key, result) for key, result in zip(wanted, fetched) if result is not None]
+            self.put_many(found)
+            results.update(found)
+        return [results.get(key, missing) for key in keys]
+
+    # Function to report the hit and miss rates so far
+    def stats(self):
+        with self.lock:
+            unique = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'duplicates': self.duplicates,
+                    'hit_rate': self.hits / unique if unique else 0.0}
+
+    # Function to count the cached results for this source
+    def size(self):
+        return self.connection().execute("SELECT COUNT(*) FROM lookups WHERE source = ?", (self.source,)).fetchone()[0]
+
+    def close(self):
+        if getattr(self.local, 'connection', None) is not None:
+            self.local.connection.close()
+            self.local.connection = None
@@ -0,0 +1,109 @@
+import heapq # For the label priority queue
+from collections import namedtuple # For returning routes with named fields
+import numpy as np # For the weight arrays
+from scipy.sparse.csgraph import dijkstra # For the single-criterion lower bounds
+from array_routing import Route # For returning routes in the same form as the routing core
+
+# One route on the distance/severity trade-off curve
+ParetoRoute = namedtuple('ParetoRoute', ['distance', 'severity', 'route'])
+
+# Function to find every Pareto-optimal route between two nodes in one bi-criteria label-setting search
+# (distance is the total length, severity the accumulated mean_severity_score along the route)
+# epsilon > 0 also discards routes that are within that relative margin of a known route's severity, which
+# thins the frontier and speeds the search up on very large graphs
+def pareto_routes(core, source, target, epsilon=0.0, max_labels=5000000):
+    source, target = int(source), int(target)
+    snapshot = core.snapshot
+
+    # Exact single-criterion distances to the target are lower bounds for both criteria at every node
+    # (the severity graph is built from core.severity on every call, so severity updates since are always included)
+    bound_distance = dijkstra(core.matrices['length'].T.tocsr(), indices=target)
+    bound_severity = dijkstra(core.matrix(core.severity).T.tocsr(), indices=target)
+    if not np.isfinite(bound_distance[source]):
+        raise ValueError("No path exists between the selected start and end points.")
+
+    # Plain Python lists are much faster than NumPy scalars inside the search loop
+    indptr, heads = snapshot.indptr.tolist(), snapshot.indices.tolist()
+    lengths, severities = core.edge_length.tolist(), core.severity.tolist()
+    bound_distance, bound_severity = bound_distance.tolist(), bound_severity.tolist()
+
+    # Labels are stored column-wise: node, previous label, edge taken, distance, severity
+    label_node, label_parent, label_edge, label_distance, label_severity = [source], [-1], [-1], [0.0], [0.0]
+    # Labels come off the queue in order of (distance + bound, severity), so a popped label is dominated exactly
+    # when its node already has a permanent label with no more severity
+    best_severity = {}
+    target_labels = []
+    queue = [(bound_distance[source], 0.0, 0)]
+    slack = 1 + epsilon
+    while queue:
+        _, severity, label = heapq.heappop(queue)
+        u = label_node[label]
+        if best_severity.get(u, np.inf) <= severity * slack:
+            continue
+        if u != target and best_severity.get(target, np.inf) <= (severity + bound_severity[u]) * slack:
+            continue
+        best_severity[u] = severity
+        if u == target:
+            target_labels.append(label)
+            continue
+        distance = label_distance[label]
+        target_severity = best_severity.get(target, np.inf)
+        for edge in range(indptr[u], indptr[u + 1]):
+            v = heads[edge]
+            new_severity = severity + severities[edge]
+            # Skip labels dominated at v, or that cannot beat a route already found to the target
+            if best_severity.get(v, np.inf) <= new_severity * slack:
+                continue
+            if target_severity <= (new_severity + bound_severity[v]) * slack:
+                continue
+            new_distance = distance + lengths[edge]
+            label_node.append(v)
+            label_parent.append(label)
+            label_edge.append(edge)
+            label_distance.append(new_distance)
+            label_severity.append(new_severity)
+            heapq.heappush(queue, (new_distance + bound_distance[v], new_severity, len(label_node) - 1))
+        if len(label_node) > max_labels:
+            raise RuntimeError(f"More than {max_labels} labels; increase epsilon to thin the frontier.")
+
+    # Read each target label's route back through its parents
+    frontier = []
+    for label in target_labels:
+        nodes, edges = [], []
+        current = label
+        while current >= 0:
+            nodes.append(label_node[current])
+            edges.append(label_edge[current])
+            current = label_parent[current]
+        nodes.reverse()
+        edges = np.array(edges[::-1][1:], dtype=np.int64)
+        frontier.append(ParetoRoute(label_distance[label], label_severity[label], Route(nodes, edges)))
+    return frontier
+
+# Function to pick the route minimising length + lam * severity from a computed frontier
+# (every blend's optimum lies on the frontier, so no new search is needed for a different lam)
+def best_blend(frontier, lam):
+    return min(frontier, key=lambda option: option.distance + lam * option.severity)
+
+# Function to compute the route for a single blend directly, with one Dijkstra over length + lam * severity
+# The blend's weights and graph are built for this call only, so a long-running service that is asked for many
+# different lam values doesn't keep a weight vector and matrix for each of them in core.matrices
+def blended_route(core, source, target, lam):
+    weights = core.edge_length + lam * core.severity
+    _, predecessors = dijkstra(core.matrix(weights), indices=source, return_predecessors=True)
+    return core.route_from_tree(predecessors, source, target, weights)
+
+if __name__ == "__main__":
+    from graph_snapshot import load_snapshot # For opening the London road network
+    from array_routing import RoutingCore # For the weight arrays
+
+    # Example usage: print the distance/severity trade-off between two random nodes
+    snapshot = load_snapshot('C:/Users/bencr/Downloads/combined_collision_v3/london_drive_snapshot')
+    routing = RoutingCore(snapshot)
+    start_node, end_node = np.random.default_rng().integers(snapshot.node_count, size=2)
+    frontier = pareto_routes(routing, start_node, end_node)
+    for option in frontier:
+        print(f"Distance = {round(option.distance, 2)}m | Total Severity = {round(option.severity, 2)}")
+    for lam in [0, 50, 500]:
+        option = best_blend(frontier, lam)
+        print(f"Blend length + {lam} x severity: Distance = {round(option.distance, 2)}m | Total Severity = {round(option.severity, 2)}")
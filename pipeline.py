@@ -0,0 +1,356 @@
+import os # For interacting with the file system
+import ast # For finding the project modules each script imports
+import sys # For running the scripts with the same Python
+import json # For the pipeline state file
+import time # For timing the stages
+import shutil # For clearing stale outputs
+import hashlib # For the content hashes
+import fnmatch # For the derived file patterns
+import argparse # For the command-line interface
+import threading # For the state lock
+import subprocess # For running the stage scripts
+from collections import namedtuple # For the stage definitions
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait # For running independent stages at once
+
+# Where the scripts live, and where the data lives (relative paths below are inside it; scripts run from it)
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+DATA_DIRECTORY = 'C:/Users/bencr/Downloads/combined_collision_v3'
+
+# Hashes of every stage's inputs and outputs from the last successful runs, and the stage logs
+STATE_FILE = 'pipeline_state.json'
+LOG_DIRECTORY = 'pipeline_logs'
+
+# A stage: the script to run (with any arguments) and the files or directories it reads and writes
+# derived lists patterns of files inside the stage's outputs that other code adds or rewrites in place (the routing
+# columns, the profiles and the annotation's meta.json entry in a snapshot), so changing them doesn't make the
+# stage out of date or make the stages reading the outputs run again
+Stage = namedtuple('Stage', ['name', 'script', 'inputs', 'outputs', 'args', 'derived'], defaults=[(), ()])
+
+# Snapshot files written after graph_snapshot.py builds it: the columns RoutingCore.save_columns and save_profiles add,
+# and meta.json, which lists them and records the annotation (the annotated columns are the annotation stage's outputs)
+SNAPSHOT_DERIVED = ('london_drive_snapshot/meta.json', 'london_drive_snapshot/routing_*', 'london_drive_snapshot/severity_profile*',
+                    'london_drive_snapshot/profile_*', 'london_drive_snapshot/*.tmp.npy', 'london_drive_snapshot/*.tmp')
+
+# The files the pipeline starts from, which no stage writes (the Kaggle dataset and the coordinates for the Overpass lookups)
+SOURCES = ['combined_collisions_v3.csv', 'latlong.txt']
+
+# The pipeline from combined_collisions_v3.csv to the refined datasets, maps and routes
+# (the order doesn't matter: a stage runs once the stages writing its inputs have)
+STAGES = [
+    Stage('collision_store', 'columnar_store.py', ['combined_collisions_v3.csv'], ['combined_collisions_v3_columns']),
+    Stage('london_filtering', 'London_filtering.py', ['combined_collisions_v3_columns'],
+          ['London_dataset.csv', 'filtered_London_dataset.csv']),
+    Stage('severity_score', 'severity_score.py', ['filtered_London_dataset.csv'], ['accidents_summary_filtered.csv']),
+    Stage('borough_coordinates', 'London_borough.py', [], ['london_boroughs_coordinates.csv']),
+    Stage('refinement', 'London_refinement.py', ['accidents_summary_filtered.csv', 'london_boroughs_coordinates.csv'],
+          ['refined_London_dataset.csv']),
+    Stage('graph_snapshot', 'graph_snapshot.py', [], ['london_drive_snapshot'], derived=SNAPSHOT_DERIVED),
+    # The annotation rewrites the snapshot's severity columns in place, so the tiles, the route service and the
+    # severity store open a network that carries the refined collision data (rerunning it replaces any values
+    # SeverityStore.write_snapshot wrote since)
+    Stage('snapshot_annotation', 'edge_severity_annotation.py', ['london_drive_snapshot', 'refined_London_dataset.csv'],
+          ['london_drive_snapshot/mean_severity_score.npy', 'london_drive_snapshot/number_of_accidents.npy']),
+    Stage('graph_tiles', 'graph_tiles.py',
+          ['london_drive_snapshot', 'london_drive_snapshot/mean_severity_score.npy', 'london_drive_snapshot/number_of_accidents.npy'],
+          ['london_drive_tiles'], ('--tiles', 'london_drive_tiles', '--snapshot', 'london_drive_snapshot', '--build-only')),
+    Stage('borough_assignment', 'london_borough_combination.py', ['London_dataset.csv', 'london_boroughs_coordinates.csv'],
+          ['london_dataset_with_boroughs.csv']),
+    Stage('osm_enrichment', 'osm_information.py', ['latlong.txt'], ['chunks', 'osm_info.csv']),
+    Stage('osm_chunk_merge', 'osm_chunk_merger.py', ['chunks'], ['chunks/osm_info.csv'], ('chunks',)),
+    Stage('street_enrichment', 'offline_snapping.py', ['refined_London_dataset.csv', 'london_drive_snapshot'], ['enriched_file.csv'],
+          ('--input', 'refined_London_dataset.csv', '--output', 'enriched_file.csv', '--snapshot', 'london_drive_snapshot',
+           '--all-columns')),
+    Stage('collision_cube', 'aggregate_cube.py', ['combined_collisions_v3_columns', 'london_boroughs_coordinates.csv'],
+          ['collision_cube']),
+    Stage('day_heatmap', 'modified_day_heatmap.py', ['collision_cube'], ['day_heatmap.png']),
+    Stage('hour_heatmap', 'modified_time_heatmap.py', ['collision_cube'], ['hour_heatmap.png']),
+    Stage('density_tiles', 'density_tiles.py', ['combined_collisions_v3_columns'], ['density_tiles'], ('--output', 'density_tiles')),
+    Stage('street_heatmap', 'Nominatim_heatmap.py', ['enriched_file.csv', 'london_drive_snapshot'],
+          ['london_street_heatmap.html', 'london_street_heatmap']),
+    Stage('routing', 'Dijkstra_safest_shortest.py', ['london_drive_snapshot', 'refined_London_dataset.csv'], ['london_routes.html']),
+]
+
+# Function to resolve a stage path against the data directory
+def data_path(path, data_directory=DATA_DIRECTORY):
+    return os.path.normpath(os.path.join(data_directory, path))
+
+# Function to find the project modules a script imports, directly or through other project modules
+def local_modules(script, directory=REPOSITORY_DIRECTORY):
+    found, pending = [], [os.path.join(directory, script)]
+    while pending:
+        path = pending.pop()
+        if path in found:
+            continue
+        found.append(path)
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module = os.path.join(os.path.dirname(path), name.split('.')[0] + '.py')
+                if os.path.exists(module):
+                    pending.append(module)
+    return sorted(found)
+
+# Content hashes of files, remembered by path, size and modification time so large CSV files are only read when they change
+class HashCache:
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.lock = threading.Lock()
+
+    # Function to hash one file
+    def file(self, path):
+        status = os.stat(path)
+        stamp = [status.st_size, status.st_mtime_ns]
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry and entry[:2] == stamp:
+            return entry[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        with self.lock:
+            self.entries[path] = stamp + [digest.hexdigest()]
+        return digest.hexdigest()
+
+    # Function to hash a file or a whole directory (None if it doesn't exist), leaving out some paths and any files
+    # matching some patterns
+    def path(self, path, exclude=(), patterns=()):
+        if os.path.isfile(path):
+            return self.file(path)
+        if not os.path.isdir(path):
+            return None
+        digest = hashlib.sha256()
+        for root, directories, files in os.walk(path):
+            directories.sort()
+            for name in sorted(files):
+                file_path = os.path.normpath(os.path.join(root, name))
+                if file_path in exclude or any(fnmatch.fnmatch(file_path, pattern) for pattern in patterns):
+                    continue
+                digest.update(os.path.relpath(file_path, path).replace(os.sep, '/').encode())
+                digest.update(self.file(file_path).encode())
+        return digest.hexdigest()
+
+# Runs the stages in dependency order, skipping those whose inputs, code and arguments haven't changed
+class Pipeline:
+    def __init__(self, stages=STAGES, data_directory=DATA_DIRECTORY, workers=4, sources=SOURCES):
+        self.stages = {stage.name: stage for stage in stages}
+        self.data_directory = data_directory
+        self.workers = workers
+        self.state_file = os.path.join(data_directory, STATE_FILE)
+        self.state = {'hashes': {}, 'stages': {}}
+        if os.path.exists(self.state_file):
+            with open(self.state_file) as f:
+                self.state = json.load(f)
+        self.hashes = HashCache(self.state['hashes'])
+        self.state_lock = threading.Lock()
+
+        # Each stage depends on the stages writing any of its inputs
+        writers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                path = data_path(output, data_directory)
+                if path in writers:
+                    raise ValueError(f"{output} is written by both {writers[path]} and {stage.name}")
+                writers[path] = stage.name
+        self.outputs = set(writers)
+        self.derived = [data_path(pattern, data_directory) for stage in stages for pattern in stage.derived]
+        # Every input must be written by a stage or be one of the files the pipeline starts from
+        sources = {data_path(path, data_directory) for path in sources}
+        for stage in stages:
+            unknown = [path for path in stage.inputs if data_path(path, data_directory) not in self.outputs | sources]
+            if unknown:
+                raise ValueError(f"{stage.name} reads {unknown}, which no stage writes and which aren't declared sources")
+        self.upstream = {stage.name: sorted({writers[data_path(path, data_directory)] for path in stage.inputs
+                                             if data_path(path, data_directory) in writers} - {stage.name})
+                         for stage in stages}
+        self.order = self.topological_order()
+
+    # Function to order the stages so every stage comes after the ones it depends on
+    def topological_order(self):
+        order, visiting, done = [], set(), set()
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"The pipeline has a cycle through {name}")
+            visiting.add(name)
+            for upstream in self.upstream[name]:
+                visit(upstream)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+        for name in self.stages:
+            visit(name)
+        return order
+
+    # Function to select some target stages and everything they depend on (every stage if there are no targets)
+    def selection(self, targets=None):
+        if not targets:
+            return list(self.order)
+        unknown = set(targets) - set(self.stages)
+        if unknown:
+            raise KeyError(f"Unknown stages {sorted(unknown)}; the stages are {self.order}")
+        selected, pending = set(), list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in selected:
+                selected.add(name)
+                pending.extend(self.upstream[name])
+        return [name for name in self.order if name in selected]
+
+    # Function to hash some declared paths (stage outputs and derived files inside directories, like a merged file
+    # or a snapshot's routing columns, are left out)
+    def path_hashes(self, paths):
+        return {path: self.hashes.path(data_path(path, self.data_directory), exclude=self.outputs, patterns=self.derived)
+                for path in paths}
+
+    # Function to compute a stage's key: the hash of its code, arguments and inputs
+    def stage_key(self, stage):
+        code = {os.path.basename(module): self.hashes.file(module) for module in local_modules(stage.script)}
+        inputs = self.path_hashes(stage.inputs)
+        missing = [path for path, digest in inputs.items() if digest is None]
+        if missing:
+            raise FileNotFoundError(f"missing inputs {missing}")
+        content = json.dumps({'code': code, 'args': list(stage.args), 'inputs': inputs}, sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    # Function to check whether a stage's outputs are still the ones its last run wrote from the same key
+    def up_to_date(self, stage, key):
+        previous = self.state['stages'].get(stage.name)
+        if previous is None or previous['key'] != key:
+            return False
+        return self.path_hashes(stage.outputs) == previous['outputs']
+
+    # Function to record a finished stage and save the state, replacing the state file atomically
+    def record(self, stage, key, seconds):
+        outputs = self.path_hashes(stage.outputs)
+        with self.state_lock:
+            self.state['stages'][stage.name] = {'key': key, 'outputs': outputs, 'seconds': round(seconds, 2),
+                                                'finished': time.strftime('%Y-%m-%d %H:%M:%S')}
+            self.state['hashes'] = dict(self.hashes.entries)
+            temporary = self.state_file + '.tmp'
+            with open(temporary, 'w') as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(temporary, self.state_file)
+
+    # Function to run one stage's script from the data directory, logging its output
+    def execute(self, stage):
+        # Remove the old outputs first, so scripts that only build missing files rebuild them (outputs inside an input,
+        # like the annotated columns of the snapshot, are rewritten in place by a script that reads the rest of it)
+        inputs = [data_path(path, self.data_directory) for path in stage.inputs]
+        for output in stage.outputs:
+            path = data_path(output, self.data_directory)
+            if any(path.startswith(directory + os.sep) for directory in inputs):
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        log_directory = os.path.join(self.data_directory, LOG_DIRECTORY)
+        os.makedirs(log_directory, exist_ok=True)
+        # Plots are saved rather than shown, so the scripts don't wait for a window to close
+        environment = dict(os.environ, MPLBACKEND='Agg', PYTHONPATH=os.pathsep.join(
+            [REPOSITORY_DIRECTORY] + [path for path in [os.environ.get('PYTHONPATH')] if path]))
+        with open(os.path.join(log_directory, f'{stage.name}.log'), 'w') as log:
+            completed = subprocess.run([sys.executable, os.path.join(REPOSITORY_DIRECTORY, stage.script), *stage.args],
+                                       cwd=self.data_directory, env=environment, stdout=log, stderr=subprocess.STDOUT)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{stage.script} exited with status {completed.returncode} "
+                               f"(see {LOG_DIRECTORY}/{stage.name}.log)")
+        missing = [output for output in stage.outputs if not os.path.exists(data_path(output, self.data_directory))]
+        if missing:
+            raise RuntimeError(f"{stage.script} finished without writing {missing}")
+
+    # Function to bring one stage up to date, returning 'ran' or 'skipped'
+    def bring_up_to_date(self, name, force=False, adopt=False):
+        stage = self.stages[name]
+        key = self.stage_key(stage)
+        if not force and self.up_to_date(stage, key):
+            return 'skipped'
+        if adopt and all(os.path.exists(data_path(output, self.data_directory)) for output in stage.outputs):
+            self.record(stage, key, 0)
+            return 'adopted'
+        start = time.perf_counter()
+        self.execute(stage)
+        self.record(stage, key, time.perf_counter() - start)
+        return 'ran'
+
+    # Function to run the selected stages, each as soon as everything it depends on has finished
+    def run(self, targets=None, force=(), adopt=False):
+        selected = self.selection(targets)
+        waiting = {name: set(self.upstream[name]) & set(selected) for name in selected}
+        results, running = {}, {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while waiting or running:
+                # Start every stage whose dependencies have finished; skip those whose dependencies failed
+                for name in [name for name, upstream in waiting.items() if not upstream - set(results)]:
+                    del waiting[name]
+                    failed = [upstream for upstream in self.upstream[name] if results.get(upstream, 'ran') not in ('ran', 'skipped', 'adopted')]
+                    if failed:
+                        results[name] = f"not run ({', '.join(failed)} failed)"
+                        print(f"{name}: {results[name]}")
+                        continue
+                    running[executor.submit(self.bring_up_to_date, name, name in force, adopt)] = (name, time.perf_counter())
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, started = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        results[name] = f"failed: {e}"
+                    print(f"{name}: {results[name]} ({time.perf_counter() - started:.1f} s)")
+        ran = sum(result == 'ran' for result in results.values())
+        skipped = sum(result == 'skipped' for result in results.values())
+        print(f"{ran} stages ran and {skipped} were up to date in {time.perf_counter() - start:.1f} s")
+        return results
+
+    # Function to list which selected stages would run (a stage also runs when anything upstream of it does)
+    def plan(self, targets=None, force=()):
+        stale = set()
+        for name in self.selection(targets):
+            stage = self.stages[name]
+            if name in force or any(upstream in stale for upstream in self.upstream[name]):
+                reason = 'forced' if name in force else 'upstream changes'
+            else:
+                try:
+                    key = self.stage_key(stage)
+                except FileNotFoundError as e:
+                    print(f"{name}: can't run ({e})")
+                    stale.add(name)
+                    continue
+                if self.up_to_date(stage, key):
+                    print(f"{name}: up to date")
+                    continue
+                reason = 'never run' if name not in self.state['stages'] else 'inputs, code or outputs changed'
+            stale.add(name)
+            print(f"{name}: would run ({reason})")
+        return stale
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the collision pipeline, skipping stages that are up to date.")
+    parser.add_argument('targets', nargs='*', help="Stages to bring up to date with everything they depend on (default: all)")
+    parser.add_argument('--workers', type=int, default=4, help="Most stages to run at once")
+    parser.add_argument('--force', nargs='+', default=[], help="Stages to run even if they are up to date")
+    parser.add_argument('--dry-run', action='store_true', help="Only list the stages that would run")
+    parser.add_argument('--adopt', action='store_true',
+                        help="Record existing outputs as up to date instead of running their stages (after running scripts by hand)")
+    parser.add_argument('--data-directory', default=DATA_DIRECTORY)
+    args = parser.parse_args()
+
+    pipeline = Pipeline(data_directory=args.data_directory, workers=args.workers)
+    if args.dry_run:
+        pipeline.plan(args.targets, args.force)
+    else:
+        results = pipeline.run(args.targets, args.force, args.adopt)
+        if any(result not in ('ran', 'skipped', 'adopted') for result in results.values()):
+            sys.exit(1)
@@ -0,0 +1,64 @@
+import json # For reading the responses
+import time # For timing each request
+import random # For generating query points
+import argparse # For the command-line interface
+import urllib.request # For sending requests to the service
+import urllib.error # For counting failed requests
+from concurrent.futures import ThreadPoolExecutor # For sending requests concurrently
+import numpy as np # For the latency percentiles
+
+# Define London's borough boundaries
+minimum_latitude, maximum_latitude = 51.3550556, 51.6517156
+minimum_longitude, maximum_longitude = -0.453256, 0.15050513
+
+# Function to build the query URLs, reusing a share of earlier pairs so the cache is exercised
+def query_urls(base_url, requests, repeat_fraction, seed=None):
+    rng = random.Random(seed)
+    urls = []
+    for _ in range(requests):
+        if urls and rng.random() < repeat_fraction:
+            urls.append(rng.choice(urls))
+            continue
+        points = [f"{rng.uniform(minimum_latitude, maximum_latitude)},{rng.uniform(minimum_longitude, maximum_longitude)}"
+                  for _ in range(2)]
+        mode = rng.choice(['shortest', 'safest'])
+        urls.append(f"{base_url}/route?mode={mode}&start={points[0]}&end={points[1]}")
+    return urls
+
+# Function to send one request, returning its latency and whether it succeeded
+def timed_request(url):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url) as response:
+            json.loads(response.read())
+        ok = True
+    except urllib.error.HTTPError as e:
+        ok = e.code == 404 # "No path" is a valid answer
+    except urllib.error.URLError:
+        ok = False
+    return time.perf_counter() - start, ok
+
+# Function to run the load test and print latency percentiles and throughput
+def load_test(base_url, requests=1000, concurrency=16, repeat_fraction=0.5, seed=None):
+    urls = query_urls(base_url, requests, repeat_fraction, seed)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_request, urls))
+    elapsed = time.perf_counter() - start
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    failures = sum(not ok for _, ok in results)
+    print(f"Requests: {requests} | Concurrency: {concurrency} | Failures: {failures}")
+    print(f"Latency p50 = {np.percentile(latencies, 50):.1f} ms | p99 = {np.percentile(latencies, 99):.1f} ms")
+    print(f"Throughput = {requests / elapsed:.1f} requests/s")
+    return {'p50': float(np.percentile(latencies, 50)), 'p99': float(np.percentile(latencies, 99)),
+            'throughput': requests / elapsed, 'failures': failures}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the route service.")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--repeat-fraction', type=float, default=0.5, help="Share of requests repeating an earlier pair")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    load_test(args.url, args.requests, args.concurrency, args.repeat_fraction, args.seed)
@@ -0,0 +1,158 @@
+import json # For the JSON responses
+import threading # For guarding the shared result cache
+import argparse # For the command-line interface
+from collections import OrderedDict # For the least-recently-used result cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer # For serving requests concurrently
+from urllib.parse import urlparse, parse_qs # For reading the query parameters
+import numpy as np # For checking the severity deltas
+from graph_snapshot import load_snapshot # For opening the memory-mapped road network
+from array_routing import RoutingCore # For the shortest and safest searches
+
+# Weight used by each route mode
+MODES = {'shortest': 'length', 'safest': 'safety'}
+
+# Thread-safe least-recently-used cache of route results
+class RouteCache:
+    def __init__(self, size=10000):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+# The graph, severities and cache shared by every request
+class RouteService:
+    def __init__(self, snapshot_directory, cache_size=10000):
+        self.snapshot = load_snapshot(snapshot_directory)
+        self.routing = RoutingCore(self.snapshot)
+        self.cache = RouteCache(cache_size)
+        # Bumped by every severity delta, so routes computed under the old weights are never served again
+        self.version = 0
+        self.update_lock = threading.Lock()
+
+    # Function to answer one query, keyed in the cache by the snapped node pair
+    def route(self, mode, start, end):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of {sorted(MODES)}")
+        start_node, end_node = self.snapshot.nearest_nodes([start[1], end[1]], [start[0], end[0]])
+        key = (mode, int(start_node), int(end_node), self.version)
+        result = self.cache.get(key)
+        if result is not None:
+            return dict(result, cached=True)
+        path = self.routing.route(start_node, end_node, MODES[mode])
+        distance, mean_severity = self.routing.path_metrics(path)
+        result = {
+            'mode': mode,
+            'start_node': int(self.snapshot.node_ids[start_node]),
+            'end_node': int(self.snapshot.node_ids[end_node]),
+            'path': [[lat, lon] for lat, lon in zip(self.snapshot.node_y[path.nodes].tolist(), self.snapshot.node_x[path.nodes].tolist())],
+            'distance': round(distance, 2),
+            'mean_severity': mean_severity,
+        }
+        self.cache.put(key, result)
+        return dict(result, cached=False)
+
+    # Function to apply new per-edge severities (see incremental_severity.py) and drop the cached routes
+    def apply_delta(self, edges, severity, accidents=None):
+        edges = np.asarray(edges, dtype=np.int64)
+        if len(edges) != len(severity) or (accidents is not None and len(edges) != len(accidents)):
+            raise ValueError("edges, severity and accidents must have the same length")
+        if len(edges) and (edges.min() < 0 or edges.max() >= self.snapshot.edge_count):
+            raise ValueError(f"Edge positions must be between 0 and {self.snapshot.edge_count - 1}")
+        with self.update_lock:
+            self.routing.update_severity(edges, severity, accidents)
+            self.version += 1
+            self.cache.clear()
+        return {'updated_edges': len(edges), 'version': self.version}
+
+# Function to read a "latitude,longitude" query parameter
+def coordinate(query, name):
+    latitude, longitude = query[name][0].split(',')
+    return float(latitude), float(longitude)
+
+# Handles GET /route?mode=shortest&start=lat,lon&end=lat,lon, GET /stats
+# and POST /severity-delta with a JSON body {"edges": [...], "severity": [...], "accidents": [...]}
+class RouteHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/stats':
+            return self.respond(200, self.service.cache.stats())
+        if url.path != '/route':
+            return self.respond(404, {'error': f"Unknown path '{url.path}'"})
+        try:
+            start, end = coordinate(query, 'start'), coordinate(query, 'end')
+            result = self.service.route(query.get('mode', ['shortest'])[0], start, end)
+        except KeyError as e:
+            return self.respond(400, {'error': f"Missing parameter {e}"})
+        except ValueError as e:
+            status = 404 if "No path" in str(e) else 400
+            return self.respond(status, {'error': str(e)})
+        self.respond(200, result)
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/severity-delta':
+            return self.respond(404, {'error': f"Unknown path '{self.path}'"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            result = self.service.apply_delta(body['edges'], body['severity'], body.get('accidents'))
+        except KeyError as e:
+            return self.respond(400, {'error': f"Missing field {e}"})
+        except (ValueError, TypeError) as e:
+            return self.respond(400, {'error': str(e)})
+        self.respond(200, result)
+
+    def respond(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    # Keep the console quiet under load
+    def log_message(self, format, *args):
+        pass
+
+# Function to start the service (each request is handled on its own thread)
+def serve(snapshot_directory, host='127.0.0.1', port=8000, cache_size=10000):
+    RouteHandler.service = RouteService(snapshot_directory, cache_size)
+    server = ThreadingHTTPServer((host, port), RouteHandler)
+    print(f"Serving routes on http://{host}:{port}/route")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve shortest and safest route queries as JSON.")
+    parser.add_argument('--snapshot', default='C:/Users/bencr/Downloads/combined_collision_v3/london_drive_snapshot',
+                        help="Road network snapshot directory (see graph_snapshot.py)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--cache-size', type=int, default=10000, help="Number of recent routes to keep")
+    args = parser.parse_args()
+    serve(args.snapshot, args.host, args.port, args.cache_size)
@@ -1,20 +1,19 @@
-import pandas as pd
+from compact_schema import read_compact_csv, severity_histograms
+from instrumentation import Span
 
 # Load the data
-data = pd.read_csv('C:/Users/bencr/Downloads/combined_collision_v3/filtered_London_dataset.csv')
+with Span('read_csv') as span:
+    data = read_compact_csv('C:/Users/bencr/Downloads/combined_collision_v3/filtered_London_dataset.csv',
+                            usecols=['Latitude', 'Longitude', 'Accident_Severity'])
+    span.rows = len(data)
 
-# Ensure that 'accident_severity_scores' are treated as integers
-data['accident_severity_scores'] = data['Accident_Severity'].astype(int)
-
-# Group by Latitude and Longitude, calculate number of accidents, collect severity scores and mean severity score
-summary = data.groupby(['Latitude', 'Longitude']).agg(
-    number_of_accidents=('Accident_Severity', 'size'), 
-    accident_severity_scores=('accident_severity_scores', list),  
-    mean_severity_score=('accident_severity_scores', 'mean')  
-).reset_index()
+# Group by Latitude and Longitude, calculating the number of accidents, the number of each severity
+# (fatal_accidents, serious_accidents and slight_accidents, in place of a list of scores) and the mean severity score
+with Span('severity_groupby', rows=len(data)):
+    summary = severity_histograms(data['Latitude'], data['Longitude'], data['Accident_Severity'])
 
 # Save the main columns to a CSV file
-summary[['Latitude', 'Longitude', 'number_of_accidents', 'accident_severity_scores', 'mean_severity_score']].to_csv(
+summary.to_csv(
     'accidents_summary_filtered.csv', 
     index=False
 )
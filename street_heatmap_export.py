@@ -0,0 +1,154 @@
+import os # For interacting with the file system
+import json # For writing the GeoJSON layers
+import numpy as np # For the vectorised colours and tolerances
+import pandas as pd # For joining severities to street geometries
+import shapely # For simplifying and grouping the street geometries
+import matplotlib.cm as cm # For colour maps
+import matplotlib.colors as colors # For normalising the severities
+from instrumentation import traced # For timing the calls
+
+# Number of distinct colours on the map (streets in the same colour band are drawn as one feature)
+COLOUR_BINS = 64
+
+# Zoom levels to write a simplified layer for, and the one embedded in the folium map when no layers are written
+ZOOM_LEVELS = [10, 12, 14, 16]
+MAP_ZOOM = 14
+
+# Script that swaps in the written layer for the map's zoom level (the finest layer at or below it) after every zoom
+# The coarsest layer is embedded in the script, because browsers block fetch() from file:// pages: a map opened
+# straight from disk shows that layer at every zoom, and one served over HTTP loads the finer layers as well
+ZOOM_LAYER_SCRIPT = '''
+(function() {
+    var map = %(map)s;
+    var zooms = %(zooms)s;
+    var urls = %(urls)s;
+    var inline = %(inline)s;
+    var layer = null;
+    var shown = null;
+    function layerZoom(zoom) {
+        var chosen = zooms[0];
+        zooms.forEach(function(level) { if (level <= zoom) { chosen = level; } });
+        return chosen;
+    }
+    function show(zoom, data) {
+        if (zoom !== shown) { return; }
+        if (layer) { map.removeLayer(layer); }
+        layer = L.geoJSON(data, {
+            style: function(feature) { return {color: feature.properties.colour, weight: 5}; }
+        }).bindTooltip(function(line) {
+            var properties = line.feature.properties;
+            return 'Mean severity from ' + properties.min_severity + ' to ' + properties.max_severity;
+        }, {sticky: true}).addTo(map);
+    }
+    function refresh() {
+        var zoom = layerZoom(map.getZoom());
+        if (zoom === shown) { return; }
+        shown = zoom;
+        if (zoom === zooms[0]) { show(zoom, inline); return; }
+        fetch(urls[zoom]).then(function(response) { return response.json(); }).then(function(data) {
+            show(zoom, data);
+        }).catch(function() { show(zoom, inline); });
+    }
+    map.on('zoomend', refresh);
+    refresh();
+})();
+'''
+
+# Metres per pixel at zoom level 0 on the equator for 256-pixel web map tiles
+METRES_PER_PIXEL_AT_ZOOM_0 = 156543.03392
+
+# Function to keep the first OSM ID of every edge (the same rule as the heatmap script)
+def first_osmid(osmids):
+    return osmids.map(lambda x: int(x[0]) if isinstance(x, list) else int(x))
+
+# Function to join street severities to edge geometries in one merge, keeping one line per two-way street
+# (edges is an OSMnx edge table, or an osmid and geometry table with one line per street already, like
+# offline_snapping.load_snapshot_edges returns)
+def street_lines(edges, street_severity):
+    edges = edges.reset_index()
+    lines = pd.DataFrame({'osmid': first_osmid(edges['osmid']), 'geometry': edges['geometry'].values})
+    if 'u' in edges.columns:
+        # Both directions of a two-way street share a geometry, so draw it once
+        lines['first'], lines['second'] = np.minimum(edges['u'], edges['v']), np.maximum(edges['u'], edges['v'])
+        lines = lines.drop_duplicates(subset=['osmid', 'first', 'second'])
+    lines = lines.merge(street_severity.rename('severity'), left_on='osmid', right_index=True)
+    return lines[['osmid', 'geometry', 'severity']].reset_index(drop=True)
+
+# Function to assign every severity to a colour band, returning the bands and their hex colours
+def colour_bands(severity, vmin, vmax, colour_map='YlOrRd', bins=COLOUR_BINS):
+    scale = (np.asarray(severity, dtype=float) - vmin) / ((vmax - vmin) or 1)
+    bands = np.clip((scale * bins).astype(int), 0, bins - 1)
+    mappable = cm.ScalarMappable(norm=colors.Normalize(vmin=0, vmax=bins - 1), cmap=colour_map)
+    band_colours = [colors.to_hex(rgba) for rgba in mappable.to_rgba(np.arange(bins))]
+    return bands, band_colours
+
+# Function to convert a zoom level into a simplification tolerance in degrees (half a pixel)
+def zoom_tolerance(zoom, latitude=51.5074):
+    metres_per_pixel = METRES_PER_PIXEL_AT_ZOOM_0 * np.cos(np.radians(latitude)) / 2 ** zoom
+    return 0.5 * metres_per_pixel / 111320.0
+
+# Function to build one GeoJSON layer: a MultiLineString per colour band, simplified for a zoom level
+def heatmap_layer(lines, bands, band_colours, zoom):
+    tolerance = zoom_tolerance(zoom)
+    decimals = int(np.ceil(-np.log10(tolerance))) + 1 # Enough digits to stay well inside half a pixel
+    parts = shapely.get_parts(np.asarray(lines['geometry'].values), return_index=True)
+    geometries, index = parts
+    geometries = shapely.simplify(geometries, tolerance, preserve_topology=False)
+    # Drop streets shorter than half a pixel at this zoom
+    visible = shapely.length(geometries) >= tolerance
+    geometries, index = geometries[visible], index[visible]
+    geometries = shapely.transform(geometries, lambda coordinates: np.round(coordinates, decimals))
+    line_bands = bands[index]
+    features = []
+    for band in np.unique(line_bands):
+        members = line_bands == band
+        severity = lines['severity'].to_numpy()[index[members]]
+        features.append({
+            'type': 'Feature',
+            'properties': {'colour': band_colours[band], 'streets': int(members.sum()),
+                           'min_severity': round(float(severity.min()), 3), 'max_severity': round(float(severity.max()), 3)},
+            'geometry': json.loads(shapely.to_geojson(shapely.multilinestrings(geometries[members]))),
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+# Function to write a GeoJSON layer per zoom level and a folium map that loads the layer for its current zoom,
+# with the coarsest layer embedded so the map still shows every street when opened from disk
+# Without a geojson_directory the map_zoom layer is embedded in the map instead
+@traced('export_street_heatmap', rows=len)
+def export_street_heatmap(edges, street_severity, output_html, geojson_directory=None, zooms=ZOOM_LEVELS, map_zoom=MAP_ZOOM,
+                          location=(51.5074, -0.1278)):
+    import folium # For the interactive map
+    from branca.element import MacroElement # For adding the layer loading script to the map
+    from jinja2 import Template # For the layer loading script's template
+    lines = street_lines(edges, street_severity)
+    vmin, vmax = street_severity.min(), street_severity.max()
+    bands, band_colours = colour_bands(lines['severity'], vmin, vmax)
+    m = folium.Map(location=list(location), zoom_start=12)
+    if geojson_directory:
+        os.makedirs(geojson_directory, exist_ok=True)
+        zooms = sorted(zooms)
+        html_directory = os.path.dirname(os.path.abspath(output_html))
+        urls, layers = {}, {}
+        for zoom in zooms:
+            path = os.path.join(geojson_directory, f'streets_z{zoom}.geojson')
+            layers[zoom] = heatmap_layer(lines, bands, band_colours, zoom)
+            with open(path, 'w') as f:
+                json.dump(layers[zoom], f, separators=(',', ':'))
+            print(f"Zoom {zoom}: {os.path.getsize(path) / 1e6:.1f} MB written to {path}")
+            # The map fetches the layers relative to its own location
+            urls[zoom] = os.path.relpath(os.path.abspath(path), html_directory).replace(os.sep, '/')
+        # Added as a child of the map so the script runs after the map has been created
+        loader = MacroElement()
+        loader._template = Template('{% macro script(this, kwargs) %}' + ZOOM_LAYER_SCRIPT % {
+            'map': m.get_name(), 'zooms': json.dumps(zooms), 'urls': json.dumps(urls),
+            'inline': json.dumps(layers[zooms[0]], separators=(',', ':'))} + '{% endmacro %}')
+        m.add_child(loader)
+    else:
+        folium.GeoJson(heatmap_layer(lines, bands, band_colours, map_zoom), name='Street severity',
+                       style_function=lambda feature: {'color': feature['properties']['colour'], 'weight': 5},
+                       tooltip=folium.GeoJsonTooltip(fields=['min_severity', 'max_severity'],
+                                                     aliases=['Mean severity from', 'to'])).add_to(m)
+    m.save(output_html)
+    print(f"{len(lines)} streets in {len(np.unique(bands))} colour bands saved to {output_html} "
+          f"({os.path.getsize(output_html) / 1e6:.1f} MB)")
+    return lines
@@ -0,0 +1,291 @@
+import argparse # For the command-line interface
+import threading # For sharing one router's graph between threads
+from datetime import datetime # For the departure times
+import numpy as np # For the profile arrays
+import pandas as pd # For parsing the collision times
+from scipy.sparse.csgraph import dijkstra # Compiled Dijkstra over CSR graphs
+from edge_severity_annotation import EdgeIndex, MATCH_DISTANCE # For snapping collisions to street segments
+from graph_snapshot import add_columns # For saving the profiles next to the snapshot's edge columns
+from local_projection import project # For the straight-line distance that bounds the first search
+from instrumentation import traced # For timing the calls
+
+# Time buckets of a profile: every hour of every day, from Sunday 00:00 (Day_of_Week 1) to Saturday 23:00 (Day_of_Week 7)
+HOURS_PER_DAY = 24
+BUCKET_COUNT = 7 * HOURS_PER_DAY
+WEEK_SECONDS = BUCKET_COUNT * 3600
+
+# Profiles hold each segment's collision rate in every bucket relative to its average rate, as uint8 steps of 1/16
+# (so 16 means the average, and the largest factor stored is 255 / 16, about 16 times the average)
+PROFILE_STEP = 1 / 16
+
+# A segment's profile is pulled towards the London-wide profile as if it had this many more collisions spread
+# like London's, so a single collision at 3am doesn't make a street look dangerous only at 3am
+PRIOR_COLLISIONS = 24
+
+# Average driving speed in metres per second (20 km/h, typical of London traffic), used for the arrival times
+TRAVEL_SPEED = 20 / 3.6
+
+# Most times the search is repeated with weights taken at the previous route's arrival times
+MAX_ITERATIONS = 3
+
+# Share of the nodes changing time bucket above which set_weights rewrites every profiled edge instead of gathering them
+FULL_UPDATE_SHARE = 0.25
+
+# The first search is bounded at the straight-line distance times the network's safety weight per metre times this
+# (doubled until the search reaches the target), as routes rarely detour far from the straight line
+DETOUR_FACTOR = 1.4
+
+# Profile rows built at a time (each one is BUCKET_COUNT float64 values while it is computed)
+PROFILE_BLOCK = 65536
+
+# Snapshot columns written by save_profiles
+PROFILE_COLUMNS = ['severity_profile', 'profile_edges', 'profile_rows']
+
+# Function to find every collision's time bucket from its Day_of_Week and "HH:MM" Time (-1 where either is missing)
+def collision_buckets(df):
+    day = pd.to_numeric(df['Day_of_Week'], errors='coerce').to_numpy(dtype=float)
+    hour = pd.to_numeric(df['Time'].astype(object).str.split(':').str[0], errors='coerce').to_numpy(dtype=float)
+    valid = (day >= 1) & (day <= 7) & (hour >= 0) & (hour < HOURS_PER_DAY)
+    return np.where(valid, (np.nan_to_num(day) - 1) * HOURS_PER_DAY + np.nan_to_num(hour), -1).astype(np.int64)
+
+# Function to convert a departure time into seconds since Sunday 00:00 (numbers are taken as seconds already)
+def week_seconds(departure):
+    if isinstance(departure, datetime):
+        # isoweekday runs from 1 = Monday to 7 = Sunday, so % 7 puts Sunday first like Day_of_Week
+        departure = (departure.isoweekday() % 7) * 86400 + departure.hour * 3600 + departure.minute * 60 + departure.second
+    return float(departure) % WEEK_SECONDS
+
+# Function to find the bucket of times given in seconds since Sunday 00:00 (later weeks wrap around)
+def bucket_index(seconds):
+    return (np.asarray(seconds, dtype=np.int64) // 3600) % BUCKET_COUNT
+
+# Function to list every position in a set of [start, end) ranges, in order
+def expand_ranges(starts, ends):
+    sizes = ends - starts
+    return np.arange(sizes.sum()) + np.repeat(starts - (np.cumsum(sizes) - sizes), sizes)
+
+# Function to build the time profiles of every street segment with collisions
+# Returns the uint8 profiles (one row per segment, shared by both directions), and for every edge on a profiled
+# segment its position in the snapshot and its profile row; edges without collisions keep their static weight
+@traced('severity_profiles', rows=lambda result: len(result[0]))
+def build_profiles(snapshot, df, prior=PRIOR_COLLISIONS, max_distance=MATCH_DISTANCE):
+    index = EdgeIndex(snapshot)
+    segments = index.nearest_segments(df['Latitude'].to_numpy(), df['Longitude'].to_numpy(), max_distance)
+    buckets = collision_buckets(df)
+    matched = (segments >= 0) & (buckets >= 0)
+    segments, buckets = segments[matched], buckets[matched]
+    london = np.bincount(buckets, minlength=BUCKET_COUNT) / max(len(buckets), 1)
+
+    # Count the collisions in every (segment, bucket) cell that has any, then fill the profiles a block at a time
+    profiled, rows = np.unique(segments, return_inverse=True)
+    totals = np.bincount(rows, minlength=len(profiled))
+    cells, counts = np.unique(rows * BUCKET_COUNT + buckets, return_counts=True)
+    profile = np.empty((len(profiled), BUCKET_COUNT), dtype=np.uint8)
+    for first in range(0, len(profiled), PROFILE_BLOCK):
+        last = min(first + PROFILE_BLOCK, len(profiled))
+        block = np.tile(prior * london, (last - first, 1))
+        low, high = np.searchsorted(cells, [first * BUCKET_COUNT, last * BUCKET_COUNT])
+        block.ravel()[cells[low:high] - first * BUCKET_COUNT] += counts[low:high]
+        factor = block / (totals[first:last, None] + prior) * BUCKET_COUNT
+        profile[first:last] = np.clip(np.rint(factor / PROFILE_STEP), 0, 255)
+
+    # Every edge on a profiled segment points at its segment's row
+    positions = np.minimum(np.searchsorted(profiled, index.segment_of_edge), max(len(profiled) - 1, 0))
+    has_profile = profiled[positions] == index.segment_of_edge if len(profiled) else np.zeros(snapshot.edge_count, dtype=bool)
+    profile_edges = np.flatnonzero(has_profile).astype(np.int32)
+    print(f"Built time profiles for {len(profiled)} segments ({len(profile_edges)} of {snapshot.edge_count} edges, "
+          f"{profile.nbytes / 1e6:.1f} MB)")
+    return profile, profile_edges, positions[has_profile].astype(np.int32)
+
+# Function to save the profiles as extra columns of a snapshot, so load_snapshot maps them with the rest
+def save_profiles(snapshot_directory, profile, profile_edges, profile_rows):
+    return add_columns(snapshot_directory, dict(zip(PROFILE_COLUMNS, [profile, profile_edges, profile_rows])))
+
+# Safest routing for a departure time over a RoutingCore, with every profiled edge's severity scaled by its
+# profile at the time the route reaches it (edges without a profile keep the static mean_severity_score + 1)
+# The search is the compiled Dijkstra of the static case, repeated with the weights taken at the arrival times
+# along the previous search tree until the route stops changing (usually after one or two repeats)
+# Every search runs on one CSR graph built up front: only the slots holding profiled edges are rewritten each time
+class TimeDependentRouting:
+    def __init__(self, core, profile=None, profile_edges=None, profile_rows=None, speed=TRAVEL_SPEED,
+                 max_iterations=MAX_ITERATIONS):
+        snapshot = core.snapshot
+        if profile is None and not hasattr(snapshot, 'severity_profile'):
+            raise ValueError("The snapshot has no severity profiles; build them with time_dependent_routing.py first.")
+        self.core = core
+        self.profile = snapshot.severity_profile if profile is None else np.asarray(profile, dtype=np.uint8)
+        self.profile_edges = np.asarray(snapshot.profile_edges if profile_edges is None else profile_edges, dtype=np.int64)
+        self.profile_rows = np.asarray(snapshot.profile_rows if profile_rows is None else profile_rows, dtype=np.int64)
+        self.profile_tails = snapshot.tails[self.profile_edges]
+        self.profile_cells = self.profile.reshape(-1)
+        self.profile_offsets = self.profile_rows * BUCKET_COUNT
+        self.max_iterations = max_iterations
+
+        # Travel time of every edge, and of every tail/head slot (the quickest of any parallel edges),
+        # found by its tail * node_count + head key, which is sorted because the slots are
+        self.travel_time = core.edge_length / speed
+        self.slot_time = np.minimum.reduceat(self.travel_time, core.slot_start) if len(self.travel_time) else self.travel_time
+        slot_tails = np.repeat(np.arange(core.node_count, dtype=np.int64), np.diff(core.slot_indptr))
+        self.slot_keys = slot_tails * core.node_count + core.slot_heads
+
+        # profile_edges is sorted, so every node's profiled edges are one range of it, found through profile_indptr,
+        # and the profiled edges of a slot (CSR data position) are one range, a group, as well
+        self.profile_indptr = np.searchsorted(self.profile_tails, np.arange(core.node_count + 1))
+        profile_slots = np.searchsorted(core.slot_start, self.profile_edges, side='right') - 1
+        new_group = np.ones(len(profile_slots), dtype=bool)
+        new_group[1:] = profile_slots[1:] != profile_slots[:-1]
+        self.profile_group = np.cumsum(new_group) - 1
+        self.group_starts = np.flatnonzero(new_group)
+        self.group_ends = np.append(self.group_starts[1:], len(profile_slots))
+        self.group_slots = profile_slots[self.group_starts]
+        self.lock = threading.Lock()
+        self.static_weights = None
+        self.refresh()
+
+    # Function to rebuild the reusable graph from the core's safety weights (again after core.update_severity)
+    def refresh(self):
+        core = self.core
+        self.static_weights = core.weights['safety']
+        self.weights = self.static_weights.copy()
+        self.matrix = core.matrix(self.weights)
+        # Time bucket every node's profiled edges are currently weighted for (-1 until they are first set)
+        self.node_buckets = np.full(core.node_count, -1, dtype=np.int64)
+        self.profile_severity = core.severity[self.profile_edges]
+        # The cheapest unprofiled parallel edge of every slot with a profiled edge (infinite where there is none)
+        unprofiled = self.static_weights.copy()
+        unprofiled[self.profile_edges] = np.inf
+        self.group_floor = np.minimum.reduceat(unprofiled, core.slot_start)[self.group_slots] if len(unprofiled) else unprofiled
+        self.cost_per_metre = self.static_weights.sum() / max(core.edge_length.sum(), 1)
+        self.total_cost = self.matrix.data.sum()
+
+    # Function to find the seconds after departure at which a search tree reaches every node (0 for nodes it doesn't)
+    def arrival_times(self, source, predecessors):
+        children = np.flatnonzero(predecessors >= 0)
+        parents = predecessors[children].astype(np.int64)
+        times = np.zeros(self.core.node_count)
+        # Work on the tree's nodes only (a bounded search reaches part of the network), numbered locally with the
+        # source, its own ancestor, last
+        nodes = np.append(children, source)
+        local = np.zeros(self.core.node_count, dtype=np.int64)
+        local[nodes] = np.arange(len(nodes))
+        ancestor = local[np.append(parents, source)]
+        seconds = np.append(self.slot_time[np.searchsorted(self.slot_keys, parents * self.core.node_count + children)], 0.0)
+        # Pointer jumping: every pass adds the time from each node's ancestor and jumps to that ancestor's ancestor,
+        # so a tree of depth d takes log2(d) passes over the nodes instead of a walk down the tree
+        while True:
+            jumped = ancestor[ancestor]
+            if np.array_equal(jumped, ancestor):
+                times[nodes] = seconds
+                return times
+            seconds += seconds[ancestor]
+            ancestor = jumped
+
+    # Function to look up the profile factor of profiled edges (positions in profile_edges) at times in seconds
+    def profile_factors(self, positions, seconds):
+        return np.take(self.profile_cells, self.profile_offsets[positions] + bucket_index(seconds)) * PROFILE_STEP
+
+    # Function to set every profiled edge's safety weight for when its tail node is reached at the given times,
+    # in the per-edge weights and in the graph's slots (the cheapest of each slot's parallel edges)
+    # Only the edges of nodes whose time bucket changed since the last call are rewritten (all of them when most did)
+    def set_weights(self, node_seconds):
+        buckets = bucket_index(node_seconds)
+        changed = np.flatnonzero(buckets != self.node_buckets)
+        if len(changed) == 0:
+            return
+        self.node_buckets[changed] = buckets[changed]
+        if len(changed) > self.core.node_count * FULL_UPDATE_SHARE:
+            factors = np.take(self.profile_cells, self.profile_offsets + buckets[self.profile_tails]) * PROFILE_STEP
+            profiled = self.profile_severity * factors + self.core.severity_offset
+            self.weights[self.profile_edges] = profiled
+            if len(profiled):
+                self.matrix.data[self.group_slots] = np.minimum(np.minimum.reduceat(profiled, self.group_starts), self.group_floor)
+            return
+        positions = expand_ranges(self.profile_indptr[changed], self.profile_indptr[changed + 1])
+        if len(positions) == 0:
+            return
+        factors = np.take(self.profile_cells, self.profile_offsets[positions] + buckets[self.profile_tails[positions]]) * PROFILE_STEP
+        self.weights[self.profile_edges[positions]] = self.profile_severity[positions] * factors + self.core.severity_offset
+        # Recompute the slots of the rewritten edges from all of their profiled edges and their cheapest unprofiled one
+        groups = self.profile_group[positions]
+        groups = groups[np.append(True, groups[1:] != groups[:-1])]
+        members = expand_ranges(self.group_starts[groups], self.group_ends[groups])
+        sizes = self.group_ends[groups] - self.group_starts[groups]
+        cheapest = np.minimum.reduceat(self.weights[self.profile_edges[members]], np.cumsum(sizes) - sizes)
+        self.matrix.data[self.group_slots[groups]] = np.minimum(cheapest, self.group_floor[groups])
+
+    # Function to estimate a limit for the first search from the straight-line distance between two nodes
+    def first_limit(self, source, target):
+        snapshot = self.core.snapshot
+        x, y = project(snapshot.node_y[[source, target]], snapshot.node_x[[source, target]])
+        return max(np.hypot(x[1] - x[0], y[1] - y[0]), 1.0) * self.cost_per_metre * DETOUR_FACTOR
+
+    # Function to compute the safest route leaving at a departure time (a datetime or seconds since Sunday 00:00)
+    @traced('time_dependent_dijkstra')
+    def route(self, source, target, departure):
+        start = week_seconds(departure)
+        core = self.core
+        with self.lock:
+            if core.weights['safety'] is not self.static_weights:
+                self.refresh()
+            # The first search weights every edge at the departure hour, and stops at the estimated cost of the route
+            # (a search that stops short of the target is repeated with twice the limit, and finally with none)
+            self.set_weights(np.full(core.node_count, start))
+            limit = self.first_limit(source, target)
+            while True:
+                _, predecessors = dijkstra(self.matrix, indices=source, return_predecessors=True, limit=limit)
+                if source == target or predecessors[target] >= 0 or np.isinf(limit):
+                    break
+                limit = limit * 2 if limit * 2 < self.total_cost else np.inf
+            route = core.route_from_tree(predecessors, source, target, self.weights)
+            for _ in range(self.max_iterations):
+                self.set_weights(start + self.arrival_times(source, predecessors))
+                # The last route costs no more than this under the new weights (they are taken at its own arrival times),
+                # so the search can stop at nodes that cost more to reach
+                limit = self.weights[route.edges].sum() * (1 + 1e-9)
+                _, predecessors = dijkstra(self.matrix, indices=source, return_predecessors=True, limit=limit)
+                previous, route = route, core.route_from_tree(predecessors, source, target, self.weights)
+                if route.nodes == previous.nodes:
+                    break
+            return route
+
+    # Function to compute a route's travel time in seconds and its total safety weight when leaving at a departure time
+    def route_cost(self, route, departure):
+        edges = np.asarray(route.edges, dtype=np.int64)
+        entered = week_seconds(departure) + np.concatenate([[0.0], np.cumsum(self.travel_time[edges])[:-1]])
+        weights = self.core.weights['safety'][edges].copy()
+        positions = np.minimum(np.searchsorted(self.profile_edges, edges), max(len(self.profile_edges) - 1, 0))
+        profiled = self.profile_edges[positions] == edges if len(self.profile_edges) else np.zeros(len(edges), dtype=bool)
+        factors = self.profile_factors(positions[profiled], entered[profiled])
+        weights[profiled] = self.core.severity[edges[profiled]] * factors + self.core.severity_offset
+        return float(self.travel_time[edges].sum()), float(weights.sum())
+
+if __name__ == "__main__":
+    from graph_snapshot import load_snapshot # For opening the London road network
+    from array_routing import RoutingCore # For the weight arrays
+
+    parser = argparse.ArgumentParser(description="Route the safest path for a departure time, with severity that varies by hour and day.")
+    parser.add_argument('--snapshot', default='C:/Users/bencr/Downloads/combined_collision_v3/london_drive_snapshot',
+                        help="Road network snapshot directory (see graph_snapshot.py)")
+    parser.add_argument('--depart', action='append', help="Departure time like '2024-06-14 08:30' (repeatable, default now)")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild the profiles from the collision data")
+    args = parser.parse_args()
+
+    # Build the profiles once from the raw collisions (the refined dataset has no times)
+    snapshot = load_snapshot(args.snapshot)
+    if args.rebuild or not hasattr(snapshot, 'severity_profile'):
+        from columnar_store import open_store # For reading only the needed columns of the dataset
+        collisions = open_store().read(['Latitude', 'Longitude', 'Day_of_Week', 'Time'])
+        save_profiles(args.snapshot, *build_profiles(snapshot, collisions))
+        snapshot = load_snapshot(args.snapshot)
+
+    # Example usage: compare the static safest route between two random nodes with the routes for each departure
+    routing = RoutingCore(snapshot)
+    timed = TimeDependentRouting(routing)
+    start_node, end_node = np.random.default_rng().integers(snapshot.node_count, size=2)
+    static_route = routing.safest(start_node, end_node)
+    for departure in [datetime.fromisoformat(text) for text in args.depart or []] or [datetime.now()]:
+        route = timed.route(start_node, end_node, departure)
+        travel_time, total = timed.route_cost(route, departure)
+        _, static_total = timed.route_cost(static_route, departure)
+        print(f"{departure:%a %H:%M}: {len(route.edges)} edges, {travel_time / 60:.1f} min, total safety weight {total:.1f} "
+              f"(static safest route {static_total:.1f})")